@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from pipeline import DEFAULT_POINT, gray_frame, record_time
+from preprocess import FramePreprocessor
+
+
+class AdaptiveDetector:
+    """Schedules face detection so most frames avoid a full-frame cascade pass.
+
+    - Every ``full_scan_interval`` frames (or whenever nothing is being
+      tracked and the scene moves) the whole frame is scanned.
+    - In between, only padded regions around the previous boxes are scanned.
+    - Frames with no motion since the previous frame skip detection: the
+      previous boxes are reused, or nothing is returned for an empty scene.
+    - minSize/maxSize are tuned from the face sizes seen recently.
+    - A new detection scale (see governor.py) drops the remembered boxes and
+      sizes and forces a full scan.
+
+    Planning and bookkeeping are done under a lock, the cascade itself runs
+    outside it, so one detector can be shared by the pipeline's worker
+    threads (each passing its own CascadeClassifier).
+    """
+
+    def __init__(self, full_scan_interval=15, roi_padding=0.5, motion_threshold=25,
+                 motion_fraction=0.002, size_history=50, scale_factor=1.1, min_neighbors=4):
+        self.full_scan_interval = full_scan_interval
+        self.roi_padding = roi_padding
+        self.motion_threshold = motion_threshold
+        self.motion_fraction = motion_fraction
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.sizes = deque(maxlen=size_history)
+        self.stats = {"frames": 0, "full": 0, "roi": 0, "skipped": 0, "detect_time": 0.0, "detect_max": 0.0}
+        self._lock = threading.Lock()
+        self._boxes = []
+        self._prev_motion = None
+        self._since_full = full_scan_interval
+        self._scale = None
+
+    def _size_limits(self, full):
+        if len(self.sizes) < 10:
+            return (0, 0), (0, 0)
+        # Full scans stay looser so people further away are still found
+        low, high = (0.5, 2.0) if full else (0.7, 1.5)
+        min_side = int(min(self.sizes) * low)
+        max_side = int(max(self.sizes) * high)
+        return (min_side, min_side), (max_side, max_side)
+
+    def _moved(self, gray_small):
+        tiny = cv2.resize(gray_small, (0, 0), fx=0.25, fy=0.25, interpolation=cv2.INTER_AREA)
+        prev, self._prev_motion = self._prev_motion, tiny
+        if prev is None or prev.shape != tiny.shape:
+            return True
+        diff = cv2.absdiff(tiny, prev)
+        changed = cv2.countNonZero(cv2.threshold(diff, self.motion_threshold, 255, cv2.THRESH_BINARY)[1])
+        return changed > self.motion_fraction * tiny.size
+
+    def _plan(self, gray_small, scale):
+        with self._lock:
+            if scale != self._scale:
+                # Boxes, sizes and the motion image are in detection-image pixels
+                self._scale = scale
+                self._boxes = []
+                self.sizes.clear()
+                self._prev_motion = None
+                self._since_full = self.full_scan_interval
+            self.stats["frames"] += 1
+            self._since_full += 1
+            moved = self._moved(gray_small)
+            if self._since_full >= self.full_scan_interval or (moved and not self._boxes):
+                self._since_full = 0
+                self.stats["full"] += 1
+                return "full", None, self._size_limits(True)
+            if not moved:
+                self.stats["skipped"] += 1
+                return "skip", list(self._boxes), None
+            self.stats["roi"] += 1
+            return "roi", list(self._boxes), self._size_limits(False)
+
+    def _regions(self, boxes, shape):
+        height, width = shape[:2]
+        regions = []
+        for (x, y, w, h) in boxes:
+            pad_w, pad_h = int(w * self.roi_padding), int(h * self.roi_padding)
+            x0, y0 = max(0, x - pad_w), max(0, y - pad_h)
+            x1, y1 = min(width, x + w + pad_w), min(height, y + h + pad_h)
+            if x1 > x0 and y1 > y0:
+                regions.append((x0, y0, x1, y1))
+        return regions
+
+    def detect(self, frame, face_cascade, timings=None, preprocessor=None, point=None):
+        """Return face boxes in full-frame coordinates, like pipeline.detect_faces.
+
+        An OperatingPoint ``point`` overrides the detection scale and the
+        detector's own cascade parameters.
+        """
+        preprocessor = preprocessor or FramePreprocessor()
+        scale = (point or DEFAULT_POINT).scale
+        scale_factor = point.scale_factor if point is not None else self.scale_factor
+        min_neighbors = point.min_neighbors if point is not None else self.min_neighbors
+        gray = gray_frame(frame, preprocessor, timings)
+        start = time.perf_counter()
+        gray_small = preprocessor.downscale(gray, scale)
+        record_time(timings, "resize", start)
+
+        start = time.perf_counter()
+        mode, boxes, limits = self._plan(gray_small, scale)
+        if mode == "full":
+            min_size, max_size = limits
+            found = [tuple(b) for b in face_cascade.detectMultiScale(
+                gray_small, scaleFactor=scale_factor, minNeighbors=min_neighbors,
+                minSize=min_size, maxSize=max_size)]
+        elif mode == "roi":
+            min_size, max_size = limits
+            found = []
+            for (x0, y0, x1, y1) in self._regions(boxes, gray_small.shape):
+                for (x, y, w, h) in face_cascade.detectMultiScale(
+                        gray_small[y0:y1, x0:x1], scaleFactor=scale_factor,
+                        minNeighbors=min_neighbors, minSize=min_size, maxSize=max_size):
+                    found.append((x + x0, y + y0, w, h))
+        else:
+            found = boxes
+        elapsed = time.perf_counter() - start
+        if mode != "skip":
+            record_time(timings, "detectMultiScale", start)
+
+        with self._lock:
+            self.stats["detect_time"] += elapsed
+            self.stats["detect_max"] = max(self.stats["detect_max"], elapsed)
+            # A frame detected at the old scale must not refill the history of the new one
+            if mode != "skip" and scale == self._scale:
+                self._boxes = found
+                self.sizes.extend(max(w, h) for (_, _, w, h) in found)
+        # Scale face coordinates back to original frame size
+        return [tuple(int(v / scale) for v in box) for box in found]
+
+    def summary(self):
+        with self._lock:
+            s = dict(self.stats)
+        frames = max(s["frames"], 1)
+        return {
+            "frames": s["frames"],
+            "full_scans": s["full"],
+            "roi_scans": s["roi"],
+            "skipped": s["skipped"],
+            "full_skip_ratio": 1.0 - s["full"] / frames,
+            "skip_ratio": s["skipped"] / frames,
+            "detect_ms_mean": s["detect_time"] * 1000 / frames,
+            "detect_ms_max": s["detect_max"] * 1000,
+        }
+
+    def format_stats(self):
+        s = self.summary()
+        return (f"[detector] full {s['full_scans']}, roi {s['roi_scans']}, skipped {s['skipped']} "
+                f"of {s['frames']} frames | full-scan avoided {s['full_skip_ratio']:.0%} | "
+                f"detect ms: mean {s['detect_ms_mean']:.1f}, max {s['detect_ms_max']:.1f}")
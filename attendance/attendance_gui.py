@@ -1,50 +1,120 @@
+from startup_report import StartupReport
+from metrics import Metrics, SamplingProfiler, start_metrics_server
+from ui_log import LogChannel, UiCalls
 import tkinter as tk
-from tkinter import scrolledtext, messagebox
+from tkinter import scrolledtext, messagebox, ttk
 import threading
-import cv2
-import numpy as np
-import pandas as pd
+import time
 from datetime import datetime
 import os
+# OpenCV, NumPy and the recognition modules are imported by load_models() on a
+# background thread so the window appears before they finish loading
 
 CASCADE_PATH = "haarcascade_frontalface_default.xml"
 RECOGNIZER_PATH = "trainer.yml"
+RECOGNIZER_BACKEND = "lbph"  # "gallery" for the vectorized NumPy matcher, "sharded" for shard processes
 LABELS_PATH = "labels.npy"
-ATTENDANCE_CSV = "attendance.csv"
+VIDEO_SOURCE = 0  # webcam index, video file, image directory or stream URL
+METRICS_ENABLED = True  # per-stage timers and counters, summarized in the log
+METRICS_PORT = None  # e.g. 9108 to serve /metrics (Prometheus) and /metrics.json
+GOVERNOR_ENABLED = True  # adapt detection scale, frame stride and cascade settings (targets in governor.py)
 
 class AttendanceApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, source=VIDEO_SOURCE, headless=False):
         super().__init__()
+        self.source = source
+        self.headless = headless
         self.title("Face Recognition Attendance System")
-        self.geometry("600x400")
+        self.geometry("600x450")
         self.protocol("WM_DELETE_WINDOW", self.on_close)
         self.running = False
+        self.recognizer = None
+        self.label_dict = {}
+        self.store = None
+        self.startup = StartupReport()
+        self.metrics = Metrics() if METRICS_ENABLED else None
+        self.profiler = SamplingProfiler()
+        if self.metrics is not None and METRICS_PORT:
+            start_metrics_server(self.metrics, METRICS_PORT, profiler=self.profiler)
         self.create_widgets()
+        self.after_idle(self.window_shown)
 
-        # Load models and labels
-        self.face_cascade = cv2.CascadeClassifier(CASCADE_PATH)
-        self.recognizer = cv2.face.LBPHFaceRecognizer_create()
-        self.recognizer.read(RECOGNIZER_PATH)
-        if os.path.exists(LABELS_PATH):
-            self.label_dict = np.load(LABELS_PATH, allow_pickle=True).item()
-        else:
-            self.label_dict = {}
+    def window_shown(self):
+        self.startup.mark("window shown")
+        # Load models and labels (the pipeline workers load their own cascades)
+        threading.Thread(target=self.load_models, daemon=True).start()
+
+    def load_models(self):
+        report = self.startup
+        modules = ["numpy", "cv2", "pipeline", "adaptive_detector", "face_tracker", "attendance_store",
+                   "frame_sources", "gallery_matcher", "governor"]
+        total = len(modules) + 3
+        try:
+            for step, name in enumerate(modules, 1):
+                report.import_modules(name)
+                self.ui_calls.put(self.show_loading, step, total, f"Loaded {name}")
+            import numpy as np
+            from attendance_store import open_store
+            from gallery_matcher import load_recognizer
+
+            with report.step("load recognizer"):
+                recognizer = load_recognizer(RECOGNIZER_BACKEND, RECOGNIZER_PATH)
+            self.ui_calls.put(self.show_loading, total - 2, total, "Loaded recognizer")
+            with report.step("load labels"):
+                if os.path.exists(LABELS_PATH):
+                    label_dict = np.load(LABELS_PATH, allow_pickle=True).item()
+                else:
+                    label_dict = {}
+            self.ui_calls.put(self.show_loading, total - 1, total, "Loaded labels")
+            with report.step("open attendance store"):
+                store = open_store(synchronous="FULL")
+        except Exception as e:
+            self.ui_calls.put(self.loading_failed, e)
+            return
+        self.ui_calls.put(self.models_ready, recognizer, label_dict, store)
+
+    def show_loading(self, step, total, message):
+        self.progress["value"] = step * 100 / total
+        self.status.config(text=message)
+
+    def loading_failed(self, error):
+        self.status.config(text="Loading failed")
+        self.log(f"Failed to load models: {error}")
+        messagebox.showerror("Error", f"Failed to load models: {error}")
+
+    def models_ready(self, recognizer, label_dict, store):
+        self.recognizer, self.label_dict, self.store = recognizer, label_dict, store
+        self.progress["value"] = 100
+        self.status.config(text=f"Ready ({len(label_dict)} people enrolled)")
+        self.start_btn.config(state='normal')
+        for line in self.startup.lines():
+            print(line)
+            self.log(line)
 
     def create_widgets(self):
         tk.Label(self, text="Attendance System", font=("Arial", 18, "bold")).pack(pady=10)
-        self.start_btn = tk.Button(self, text="Start Attendance", width=20, command=self.start_attendance)
+        self.start_btn = tk.Button(self, text="Start Attendance", width=20, command=self.start_attendance,
+                                   state='disabled')
         self.start_btn.pack(pady=10)
         self.stop_btn = tk.Button(self, text="Stop Attendance", width=20, command=self.stop_attendance, state='disabled')
         self.stop_btn.pack(pady=5)
+        self.progress = ttk.Progressbar(self, length=300, maximum=100)
+        self.progress.pack(pady=2)
+        self.status = tk.Label(self, text="Loading models...")
+        self.status.pack()
         self.log_area = scrolledtext.ScrolledText(self, width=70, height=12, state='disabled')
         self.log_area.pack(pady=10)
-        tk.Button(self, text="Exit", width=20, command=self.on_close).pack(pady=5)
+        self.log_channel = LogChannel(self.log_area)
+        self.ui_calls = UiCalls(self)
+        bottom = tk.Frame(self)
+        bottom.pack(pady=5)
+        self.profile_btn = tk.Button(bottom, text="Start Profiler", width=15, command=self.toggle_profiler)
+        self.profile_btn.pack(side='left', padx=5)
+        tk.Button(bottom, text="Exit", width=20, command=self.on_close).pack(side='left', padx=5)
 
-    def log(self, message):
-        self.log_area.config(state='normal')
-        self.log_area.insert(tk.END, message + "\n")
-        self.log_area.see(tk.END)
-        self.log_area.config(state='disabled')
+    def log(self, message, key=None):
+        """Queue a log line from any thread; lines with a ``key`` are rate limited per key."""
+        self.log_channel.put(message, key)
 
     def start_attendance(self):
         self.running = True
@@ -59,79 +129,102 @@ class AttendanceApp(tk.Tk):
         self.stop_btn.config(state='disabled')
         self.log("Stopping attendance...")
 
+    def toggle_profiler(self):
+        if self.profiler.running:
+            self.log(self.profiler.stop())
+            self.profile_btn.config(text="Start Profiler")
+        else:
+            self.profiler.start()
+            self.profile_btn.config(text="Stop Profiler")
+            self.log("Sampling profiler started.")
+
     def on_close(self):
         self.running = False
         self.destroy()
 
     def load_existing_attendance(self):
         today = datetime.now().strftime('%Y-%m-%d')
-        existing = set()
-        if os.path.exists(ATTENDANCE_CSV):
-            df = pd.read_csv(ATTENDANCE_CSV)
-            if not df.empty:
-                for _, row in df.iterrows():
-                    name = row["Name"]
-                    timestamp = row["Timestamp"]
-                    if str(timestamp).startswith(today):
-                        existing.add(name)
-        return existing
-
-    def save_attendance_to_csv(self, attendance_dict):
+        return self.store.names_for_date(today)
+
+    def save_attendance(self, attendance_dict, writer):
+        # Flush whatever the background writer still has queued
+        writer.close()
         if attendance_dict:
-            df_new = pd.DataFrame(list(attendance_dict.items()), columns=["Name", "Timestamp"])
-            if os.path.exists(ATTENDANCE_CSV):
-                df_existing = pd.read_csv(ATTENDANCE_CSV)
-                df_combined = pd.concat([df_existing, df_new], ignore_index=True)
-                df_combined.to_csv(ATTENDANCE_CSV, index=False)
-            else:
-                df_new.to_csv(ATTENDANCE_CSV, index=False)
-            self.log(f"Attendance saved to {ATTENDANCE_CSV}")
+            self.log(f"Attendance saved to {self.store.path} ({writer.written} new records)")
         else:
             self.log("No new attendance to save.")
+        self.log(writer.format_stats())
 
     def recognize_and_mark_attendance(self):
+        # Already imported by load_models(), so these are cheap lookups
+        from adaptive_detector import AdaptiveDetector
+        from attendance_store import AttendanceWriter
+        from face_tracker import FaceTracker
+        from frame_sources import Display
+        from governor import CPU_BUDGET, TARGET_LATENCY_MS, LoadGovernor
+        from pipeline import RecognitionPipeline, configured_threshold, draw_faces, record_time
+
         attendance_dict = {}
         existing_today = self.load_existing_attendance()
-        cap = cv2.VideoCapture(0)
+        writer = AttendanceWriter(self.store)
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.add_gauge("marks_written", lambda: writer.written)
+            metrics.add_gauge("writer_backlog", writer.backlog)
+            metrics.add_gauge("writer_flush_ms_max", lambda: round(writer.max_flush_ms, 1))
+
+        def report(message):
+            self.log(message)
+            self.log(writer.format_stats())
+            if metrics is not None:
+                self.log(metrics.format_summary())
+
+        governor = LoadGovernor(TARGET_LATENCY_MS, CPU_BUDGET, report=self.log) if GOVERNOR_ENABLED else None
+        pipeline = RecognitionPipeline(CASCADE_PATH, self.recognizer, self.label_dict, source=self.source,
+                                       threshold=configured_threshold(self.recognizer), report=report,
+                                       tracker=FaceTracker(), detector=AdaptiveDetector(),
+                                       metrics=metrics, governor=governor)
+        display = Display(self.headless)
+        pipeline.start()
         self.log("Webcam started.")
-        while self.running:
-            ret, frame = cap.read()
-            if not ret:
-                self.log("Failed to capture frame from webcam.")
-                break
-            frame_small = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
-            gray_small = cv2.cvtColor(frame_small, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray_small, scaleFactor=1.1, minNeighbors=4)
-            for (x, y, w, h) in faces:
-                x_big, y_big, w_big, h_big = [int(v * 2) for v in (x, y, w, h)]
-                roi_gray = cv2.cvtColor(frame[y_big:y_big+h_big, x_big:x_big+w_big], cv2.COLOR_BGR2GRAY)
-                try:
-                    label, confidence = self.recognizer.predict(roi_gray)
-                except:
-                    continue
-                if confidence < 70:
-                    name = self.label_dict.get(label, "Unknown")
-                    if name not in attendance_dict and name not in existing_today and name != "Unknown":
+        try:
+            for frame, faces in pipeline.results():
+                if not self.running:
+                    break
+                for face in faces:
+                    if not face.is_new:
+                        continue
+                    name = face.name
+                    if name not in attendance_dict and name not in existing_today:
                         now = datetime.now()
                         dt_string = now.strftime('%Y-%m-%d %H:%M:%S')
                         attendance_dict[name] = dt_string
+                        writer.submit(name, dt_string)
                         self.log(f"Marked attendance for {name} at {dt_string}")
                     elif name in existing_today:
-                        self.log(f"Attendance for {name} already marked today.")
-                    color = (0, 255, 0)
-                else:
-                    name = "Unknown"
-                    color = (0, 0, 255)
-                cv2.rectangle(frame, (x_big, y_big), (x_big+w_big, y_big+h_big), color, 2)
-                cv2.putText(frame, name, (x_big, y_big-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-            cv2.imshow("Attendance - Face Recognition", frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                self.log("Webcam window closed by user.")
-                break
-        cap.release()
-        cv2.destroyAllWindows()
-        self.save_attendance_to_csv(attendance_dict)
+                        self.log(f"Attendance for {name} already marked today.", key=name)
+                if not self.headless:
+                    draw_faces(frame, faces, metrics, governor.label() if governor is not None else None)
+                start = time.perf_counter()
+                shown = display.show("Attendance - Face Recognition", frame)
+                record_time(metrics, "display", start)
+                if not shown:
+                    self.log("Webcam window closed by user.")
+                    break
+        finally:
+            pipeline.stop()
+        if pipeline.source_failed:
+            self.log("Failed to capture frame from webcam.")
+        self.log(pipeline.format_stats())
+        if metrics is not None:
+            self.log(metrics.format_summary())
+        display.close()
+        self.save_attendance(attendance_dict, writer)
         self.show_summary(attendance_dict)
+        self.ui_calls.put(self.session_finished)
+
+    def session_finished(self):
+        self.running = False
         self.start_btn.config(state='normal')
         self.stop_btn.config(state='disabled')
 
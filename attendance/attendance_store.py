@@ -0,0 +1,416 @@
+import csv
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+ATTENDANCE_DB = "attendance.db"
+ATTENDANCE_CSV = "attendance.csv"
+# Sort orders for paging, each a unique key backed by an index
+SORT_KEYS = {"name": ("name", "date"), "date": ("date", "name"), "timestamp": ("timestamp", "id")}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attendance (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    date TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    UNIQUE (date, name)
+);
+CREATE INDEX IF NOT EXISTS idx_attendance_name_date ON attendance (name, date);
+CREATE INDEX IF NOT EXISTS idx_attendance_timestamp ON attendance (timestamp);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+-- Append-only log of every mark, numbered per originating node (see kiosk_sync.py)
+CREATE TABLE IF NOT EXISTS changes (
+    origin TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    PRIMARY KEY (origin, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS change_heads (
+    origin TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL
+);
+"""
+# Keep one row per person per day, moving its time earlier when an earlier mark arrives
+UPSERT_EARLIEST = (
+    "INSERT INTO attendance (name, date, timestamp) VALUES (?, ?, ?) "
+    "ON CONFLICT (date, name) DO UPDATE SET timestamp = excluded.timestamp "
+    "WHERE excluded.timestamp < attendance.timestamp")
+
+
+class AttendanceStore:
+    """SQLite-backed attendance storage with one mark per person per day.
+
+    The UNIQUE (date, name) constraint doubles as the date+name index, so
+    looking up today's names and inserting a mark never scan history. When
+    two marks for the same day meet, the earliest one is kept.
+
+    Every mark is also appended to the ``changes`` log under this store's
+    ``node_id`` with an increasing sequence number, and ``change_heads``
+    holds the last sequence number seen from each node. Kiosks exchange the
+    log with ``changes_since``/``apply_changes`` (see kiosk_sync.py).
+    """
+
+    def __init__(self, path=ATTENDANCE_DB, synchronous="NORMAL", node_id=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL fsyncs the WAL on every commit, so a committed batch survives power loss
+        self._conn.execute(f"PRAGMA synchronous={synchronous}")
+        self._conn.executescript(SCHEMA)
+        self.node_id = self._init_node(node_id)
+
+    def _init_node(self, node_id):
+        """Read this database's node ID, creating it (and logging existing marks) on first use."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'node_id'").fetchone()
+            if row:
+                return row[0]
+            node_id = node_id or uuid.uuid4().hex[:12]
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('node_id', ?)", (node_id,))
+            # Databases from before the change log: their marks become this node's first changes
+            self._conn.execute(
+                "INSERT INTO changes (origin, seq, name, timestamp) "
+                "SELECT ?, ROW_NUMBER() OVER (ORDER BY id), name, timestamp FROM attendance", (node_id,))
+            self._conn.execute("INSERT INTO change_heads (origin, seq) SELECT ?, COUNT(*) FROM attendance",
+                               (node_id,))
+            return node_id
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def names_for_date(self, date):
+        """Names already marked on ``date`` (YYYY-MM-DD)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT name FROM attendance WHERE date = ?", (date,))
+            return {name for (name,) in rows}
+
+    def mark(self, name, timestamp):
+        """Insert a mark; returns False if the person is already marked that day (at or before it)."""
+        return self.mark_many([(name, timestamp)]) == 1
+
+    def mark_many(self, marks):
+        """Insert (name, timestamp) pairs in one transaction; returns how many were new or earlier.
+
+        Only marks that changed the table are added to the change log.
+        """
+        with self._lock, self._conn:
+            logged = []
+            for name, timestamp in marks:
+                if self._conn.execute(UPSERT_EARLIEST, (name, timestamp[:10], timestamp)).rowcount:
+                    logged.append((name, timestamp))
+            if logged:
+                seq = self._head(self.node_id)
+                self._conn.executemany(
+                    "INSERT INTO changes (origin, seq, name, timestamp) VALUES (?, ?, ?, ?)",
+                    [(self.node_id, seq + i, name, timestamp) for i, (name, timestamp) in enumerate(logged, 1)])
+                self._set_head(self.node_id, seq + len(logged))
+            return len(logged)
+
+    def _head(self, origin):
+        row = self._conn.execute("SELECT seq FROM change_heads WHERE origin = ?", (origin,)).fetchone()
+        return row[0] if row else 0
+
+    def _set_head(self, origin, seq):
+        self._conn.execute("INSERT INTO change_heads (origin, seq) VALUES (?, ?) "
+                           "ON CONFLICT (origin) DO UPDATE SET seq = excluded.seq", (origin, seq))
+
+    def change_heads(self):
+        """{origin node: last sequence number held} for every node this store has changes from."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT origin, seq FROM change_heads"))
+
+    def changes_since(self, heads, limit=None, origins=None):
+        """Changes newer than ``heads`` ({origin: seq}) as (origin, seq, name, timestamp) tuples.
+
+        Each origin's changes come in sequence order from the primary key, so
+        the cost follows the number of changes returned, not the log size.
+        ``origins`` restricts the result to those nodes.
+        """
+        result = []
+        for origin, head in sorted(self.change_heads().items()):
+            since = heads.get(origin, 0)
+            if head <= since or (origins is not None and origin not in origins):
+                continue
+            remaining = None if limit is None else limit - len(result)
+            if remaining is not None and remaining <= 0:
+                break
+            with self._lock:
+                result.extend(self._conn.execute(
+                    "SELECT origin, seq, name, timestamp FROM changes WHERE origin = ? AND seq > ? "
+                    "ORDER BY seq LIMIT ?", (origin, since, -1 if remaining is None else remaining)))
+        return result
+
+    def apply_changes(self, changes):
+        """Merge changes received from other nodes; returns (changes applied, marks added or moved earlier).
+
+        Changes already held (or from this node) are skipped, so applying the
+        same delta twice is harmless. Each origin's changes must follow on
+        from the head held for it; anything after a gap is left for the next
+        sync to fetch again.
+        """
+        applied = updated = 0
+        with self._lock, self._conn:
+            heads = {}
+            for origin, seq, name, timestamp in sorted(changes):
+                if origin == self.node_id:
+                    continue
+                if origin not in heads:
+                    heads[origin] = self._head(origin)
+                if seq != heads[origin] + 1:
+                    continue
+                self._conn.execute("INSERT INTO changes (origin, seq, name, timestamp) VALUES (?, ?, ?, ?)",
+                                   (origin, seq, name, timestamp))
+                updated += self._conn.execute(UPSERT_EARLIEST, (name, timestamp[:10], timestamp)).rowcount
+                heads[origin] = seq
+                applied += 1
+            for origin, seq in heads.items():
+                self._set_head(origin, seq)
+        return applied, updated
+
+    def rows(self, start_date=None, end_date=None, name=None):
+        """Yield (name, timestamp) rows in timestamp order, optionally filtered."""
+        sql, params = self._where(start_date, end_date, name)
+        yield from self.stream("SELECT name, timestamp FROM attendance" + sql + " ORDER BY timestamp", params)
+
+    def stream(self, sql, params=(), batch_size=1000):
+        """Yield the rows of a read query ``batch_size`` at a time, so results never sit in memory."""
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            batch = cursor.fetchmany(batch_size)
+        while batch:
+            yield from batch
+            with self._lock:
+                batch = cursor.fetchmany(batch_size)
+
+    def count(self, start_date=None, end_date=None, name=None):
+        sql, params = self._where(start_date, end_date, name)
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM attendance" + sql, params).fetchone()[0]
+
+    def names(self):
+        """Distinct names in alphabetical order (read from the name index)."""
+        with self._lock:
+            return [name for (name,) in self._conn.execute("SELECT DISTINCT name FROM attendance ORDER BY name")]
+
+    def page(self, limit=200, after=None, sort="timestamp", descending=False,
+             start_date=None, end_date=None, name=None):
+        """One page of (name, timestamp, key) rows in ``sort`` order.
+
+        Paging is keyset based: pass the ``key`` of the last row of the
+        previous page as ``after``. Unlike OFFSET, the cost of a page does not
+        grow with how far the user has scrolled.
+        """
+        first, second = SORT_KEYS[sort]
+        if first == "name":
+            # "+date" keeps the date bounds from steering SQLite away from the name index
+            sql, params = self._where(start_date, end_date, name, "+date")
+        else:
+            if first == "timestamp":
+                # Bound the timestamp itself so SQLite walks the timestamp index in order;
+                # "~" sorts after any time of day, so the end date stays inclusive
+                end_date = end_date and end_date + "~"
+            if after is not None:
+                # SQLite seeks on the plain bound, so move it up to where the last page ended
+                if descending:
+                    end_date = min(end_date or after[0], after[0])
+                else:
+                    start_date = max(start_date or after[0], after[0])
+            sql, params = self._where(start_date, end_date, name, first)
+        op, order = ("<", "DESC") if descending else (">", "ASC")
+        if after is not None:
+            sql += (" AND " if sql else " WHERE ") + f"({first}, {second}) {op} (?, ?)"
+            params = params + list(after)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT name, timestamp, {first}, {second} FROM attendance{sql} "
+                f"ORDER BY {first} {order}, {second} {order} LIMIT ?", params + [limit]).fetchall()
+        return [(name, timestamp, (k1, k2)) for name, timestamp, k1, k2 in rows]
+
+    def daily_counts(self, start_date=None, end_date=None, name=None):
+        """(date, marks) per day that has any attendance."""
+        sql, params = self._where(start_date, end_date, name)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT date, COUNT(*) FROM attendance" + sql + " GROUP BY date ORDER BY date", params).fetchall()
+
+    def attendance_rates(self, start_date=None, end_date=None, name=None):
+        """(name, days present, rate, first date, last date) per person, or only for ``name``.
+
+        The rate is days present divided by the number of days in the range on
+        which anyone was marked, so weekends and holidays do not count.
+        """
+        day_sql, day_params = self._where(start_date, end_date, None)
+        sql, params = self._where(start_date, end_date, name)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT name, COUNT(*), "
+                "COUNT(*) * 1.0 / (SELECT COUNT(DISTINCT date) FROM attendance" + day_sql + "), "
+                "MIN(date), MAX(date) FROM attendance" + sql + " GROUP BY name ORDER BY name",
+                day_params + params).fetchall()
+
+    def export_csv(self, csv_path=ATTENDANCE_CSV, **filters):
+        """Stream attendance to a CSV file in the original Name,Timestamp format."""
+        count = 0
+        tmp_path = csv_path + ".tmp"
+        with open(tmp_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Name", "Timestamp"])
+            for row in self.rows(**filters):
+                writer.writerow(row)
+                count += 1
+        os.replace(tmp_path, csv_path)
+        return count
+
+    def migrate_from_csv(self, csv_path=ATTENDANCE_CSV):
+        """One-shot import of a legacy attendance.csv; returns the number of rows imported."""
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM meta WHERE key = 'csv_migrated'").fetchone()
+        if done or not os.path.exists(csv_path):
+            return 0
+        imported = 0
+        with open(csv_path, newline="") as f:
+            reader = csv.DictReader(f)
+            batch = []
+            for row in reader:
+                if row.get("Name") and row.get("Timestamp"):
+                    batch.append((row["Name"], row["Timestamp"]))
+                if len(batch) >= 5000:
+                    imported += self.mark_many(batch)
+                    batch = []
+            imported += self.mark_many(batch)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('csv_migrated', ?)",
+                               (os.path.abspath(csv_path),))
+        return imported
+
+    @staticmethod
+    def _where(start_date, end_date, name, date_column="date"):
+        clauses, params = [], []
+        if start_date:
+            clauses.append(f"{date_column} >= ?")
+            params.append(start_date)
+        if end_date:
+            clauses.append(f"{date_column} <= ?")
+            params.append(end_date)
+        if name:
+            clauses.append("name = ?")
+            params.append(name)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+class AttendanceWriter:
+    """Background writer that persists marks as they happen.
+
+    ``submit`` only enqueues, so the frame loop never waits on disk. The writer
+    thread commits a batch every ``batch_size`` marks or ``flush_interval_ms``
+    milliseconds, whichever comes first; each batch is one SQLite transaction.
+    """
+
+    def __init__(self, store, batch_size=20, flush_interval_ms=500):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flushes = 0
+        self.written = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.errors = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, name, timestamp):
+        self._queue.put((name, timestamp))
+
+    def backlog(self):
+        return self._queue.qsize()
+
+    def close(self):
+        """Flush everything still queued and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            if item:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if item is None:
+                # Closing: retry a few times before giving up on what is left
+                for _ in range(3):
+                    if not batch or self._flush(batch):
+                        return
+                    time.sleep(self.flush_interval)
+                return
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                if self._flush(batch):
+                    batch = []
+                    deadline = None
+                else:
+                    # Keep the batch and back off; marks are never dropped on a busy database
+                    deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        try:
+            self.written += self.store.mark_many(batch)
+        except sqlite3.Error:
+            self.errors += 1
+            return False
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.flushes += 1
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+        return True
+
+    def stats(self):
+        return {
+            "written": self.written,
+            "flushes": self.flushes,
+            "backlog": self.backlog(),
+            "errors": self.errors,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+            "avg_flush_ms": self.total_flush_ms / self.flushes if self.flushes else 0.0,
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        return (f"[writer] written {s['written']} in {s['flushes']} flushes | backlog {s['backlog']} | "
+                f"flush ms: last {s['last_flush_ms']:.1f}, avg {s['avg_flush_ms']:.1f}, "
+                f"max {s['max_flush_ms']:.1f} | errors {s['errors']}")
+
+
+def open_store(path=ATTENDANCE_DB, csv_path=ATTENDANCE_CSV, synchronous="NORMAL", node_id=None):
+    """Open the attendance store, importing the legacy CSV the first time."""
+    store = AttendanceStore(path, synchronous, node_id)
+    store.migrate_from_csv(csv_path)
+    return store
+
+
+if __name__ == "__main__":
+    import sys
+    store = open_store()
+    out = sys.argv[1] if len(sys.argv) > 1 else ATTENDANCE_CSV
+    print(f"Exported {store.export_csv(out)} records to {out}")
+    store.close()
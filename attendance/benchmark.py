@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import platform
+import time
+import tracemalloc
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from adaptive_detector import AdaptiveDetector
+from face_cache import list_dataset
+from face_tracker import FaceTracker
+from frame_sources import open_source
+from gallery_matcher import load_recognizer
+from pipeline import (configured_threshold, draw_faces, detect_faces, gray_frame, process_frame,
+                      track_and_recognize)
+from preprocess import FramePreprocessor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CASCADE_PATH = "haarcascade_frontalface_default.xml"
+RECOGNIZER_PATH = "trainer.yml"
+LABELS_PATH = "labels.npy"
+DATASET_DIR = "dataset"
+
+
+def iter_frames(source):
+    """Yield BGR frames from a video file or a directory of images (sorted by name)."""
+    frames = open_source(source)
+    try:
+        yield from frames
+    finally:
+        frames.release()
+
+
+def make_synthetic_clip(out_path, dataset_dir=DATASET_DIR, people=4, seconds=10, fps=15,
+                        size=(640, 480), face_size=120, seed=0):
+    """Build a test clip of dataset faces drifting across a textured background.
+
+    ``out_path`` ending in .avi/.mp4 writes a video; anything else is treated
+    as a directory and receives a numbered PNG image sequence.
+    """
+    rng = np.random.default_rng(seed)
+    by_person = {}
+    for rel, person_name in list_dataset(dataset_dir):
+        by_person.setdefault(person_name, []).append(os.path.join(dataset_dir, rel))
+    if not by_person:
+        raise ValueError(f"No face images found in {dataset_dir}")
+    chosen = sorted(by_person)[:people]
+
+    width, height = size
+    background = cv2.GaussianBlur(rng.integers(60, 200, (height, width, 3), dtype=np.uint8), (0, 0), 8)
+    actors = []
+    for person_name in chosen:
+        paths = by_person[person_name]
+        faces = []
+        for path in paths[:: max(1, len(paths) // 5)]:
+            img = cv2.imread(path)
+            if img is not None:
+                faces.append(cv2.resize(img, (face_size, face_size)))
+        if faces:
+            start = rng.uniform([0, 0], [width - face_size, height - face_size])
+            velocity = rng.uniform(-3, 3, size=2)
+            actors.append((faces, start, velocity))
+
+    video = out_path.lower().endswith((".avi", ".mp4"))
+    if video:
+        fourcc = cv2.VideoWriter_fourcc(*("MJPG" if out_path.lower().endswith(".avi") else "mp4v"))
+        writer = cv2.VideoWriter(out_path, fourcc, fps, size)
+    else:
+        os.makedirs(out_path, exist_ok=True)
+    frames = int(seconds * fps)
+    for i in range(frames):
+        frame = background.copy()
+        for faces, start, velocity in actors:
+            x, y = start + velocity * i
+            # Bounce off the frame edges
+            x = int(abs((x % (2 * (width - face_size))) - (width - face_size)))
+            y = int(abs((y % (2 * (height - face_size))) - (height - face_size)))
+            frame[y:y + face_size, x:x + face_size] = faces[(i // fps) % len(faces)]
+        if video:
+            writer.write(frame)
+        else:
+            cv2.imwrite(os.path.join(out_path, f"frame_{i:06d}.png"), frame)
+    if video:
+        writer.release()
+    return frames
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def _run_pass(source, face_cascade, recognizer, label_dict, threshold, track, adaptive, max_frames,
+              trace_allocations=False):
+    """Process ``source`` once with a fresh tracker and detector; returns the raw measurements.
+
+    With ``trace_allocations`` the pass runs under tracemalloc and records
+    the memory allocated per frame. Tracing slows every allocation down, so
+    the timings of such a pass are not representative.
+    """
+    tracker = FaceTracker() if track else None
+    detector = AdaptiveDetector() if adaptive else None
+    preprocessor = FramePreprocessor()
+    timings = {}
+    frame_times = []
+    frame_allocs = []
+    frames = faces_total = predictions = 0
+    if trace_allocations:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+    for frame in iter_frames(source):
+        if trace_allocations:
+            # Peak of memory allocated while processing this frame (NumPy and OpenCV arrays included)
+            tracemalloc.reset_peak()
+            alloc_base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        if tracker is not None:
+            gray = gray_frame(frame, preprocessor, timings)
+            if detector is not None:
+                boxes = detector.detect(gray, face_cascade, timings, preprocessor)
+            else:
+                boxes = detect_faces(gray, face_cascade, timings, preprocessor)
+            faces, calls = track_and_recognize(gray, boxes, tracker, recognizer, label_dict,
+                                               threshold, timings, preprocessor)
+        else:
+            faces = process_frame(frame, face_cascade, recognizer, label_dict, threshold, timings, detector,
+                                  preprocessor)
+            calls = len(faces)
+        draw_faces(frame, faces, timings)
+        frame_times.append(time.perf_counter() - start)
+        if trace_allocations:
+            frame_allocs.append(tracemalloc.get_traced_memory()[1] - alloc_base)
+        frames += 1
+        faces_total += len(faces)
+        predictions += calls
+        if max_frames and frames >= max_frames:
+            break
+    wall = time.perf_counter() - wall_start
+    python_peak = None
+    if trace_allocations:
+        python_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {"timings": timings, "frame_times": frame_times, "frame_allocs": frame_allocs, "frames": frames,
+            "faces": faces_total, "predictions": predictions, "wall": wall, "python_peak": python_peak,
+            "detector": detector}
+
+
+def run_benchmark(source, backend="lbph", track=False, max_frames=None, threshold=None,
+                  adaptive=False, allocations=True):
+    """Run the recognition frame logic headless over ``source`` and return a results dict.
+
+    Latencies come from a pass with tracemalloc off. With ``allocations`` a
+    second, untimed pass over the same frames measures Python memory.
+    """
+    face_cascade = cv2.CascadeClassifier(CASCADE_PATH)
+    recognizer = load_recognizer(backend, RECOGNIZER_PATH)
+    if threshold is None:
+        threshold = configured_threshold(recognizer)
+    if os.path.exists(LABELS_PATH):
+        label_dict = np.load(LABELS_PATH, allow_pickle=True).item()
+    else:
+        label_dict = {}
+    run = (source, face_cascade, recognizer, label_dict, threshold, track, adaptive, max_frames)
+
+    timed = _run_pass(*run)
+    traced = _run_pass(*run, trace_allocations=True) if allocations else None
+    frames, wall, detector = timed["frames"], timed["wall"], timed["detector"]
+    result = {
+        "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "config": {"source": source, "backend": backend, "track": track, "adaptive": adaptive,
+                   "threshold": threshold,
+                   "cpu_count": os.cpu_count(), "opencv": cv2.__version__},
+        "frames": frames,
+        "fps": frames / wall if wall > 0 else 0.0,
+        "faces_per_frame": timed["faces"] / frames if frames else 0.0,
+        "recognizer_calls_per_frame": timed["predictions"] / frames if frames else 0.0,
+        "stages": {stage: percentiles(samples) for stage, samples in timed["timings"].items()},
+        "frame": percentiles(timed["frame_times"]),
+        "peak_rss_mb": peak_rss_mb(),
+        "python_peak_mb": None,
+        "frame_alloc_kb": None,
+        "detector": detector.summary() if detector is not None else None,
+    }
+    if traced is not None:
+        allocs = traced["frame_allocs"]
+        result["python_peak_mb"] = traced["python_peak"] / (1024 * 1024)
+        result["frame_alloc_kb"] = {"mean": float(np.mean(allocs)) / 1024 if allocs else 0.0,
+                                    "max": max(allocs, default=0) / 1024}
+    return result
+
+
+def print_report(result, baseline=None):
+    print(f"Frames: {result['frames']}  FPS: {result['fps']:.1f}  "
+          f"faces/frame: {result['faces_per_frame']:.2f}  "
+          f"recognizer calls/frame: {result['recognizer_calls_per_frame']:.2f}")
+    rows = list(result["stages"].items()) + [("frame", result["frame"])]
+    for stage, stats in rows:
+        if not stats.get("count"):
+            continue
+        line = (f"  {stage:18s} p50 {stats['p50_ms']:7.2f} ms  p90 {stats['p90_ms']:7.2f} ms  "
+                f"p99 {stats['p99_ms']:7.2f} ms")
+        base = baseline and (baseline["stages"].get(stage) if stage != "frame" else baseline["frame"])
+        if base and base.get("count"):
+            change = (stats["p50_ms"] - base["p50_ms"]) / base["p50_ms"] * 100 if base["p50_ms"] else 0.0
+            line += f"  ({change:+.1f}% p50 vs baseline)"
+        print(line)
+    if result.get("detector"):
+        d = result["detector"]
+        print(f"Detector: full-scan avoided {d['full_skip_ratio']:.0%}, skipped {d['skip_ratio']:.0%}, "
+              f"mean detect {d['detect_ms_mean']:.2f} ms")
+    if result["peak_rss_mb"] is not None:
+        line = f"Peak RSS: {result['peak_rss_mb']:.1f} MB"
+        if result.get("python_peak_mb") is not None:
+            line += f"  Python peak: {result['python_peak_mb']:.1f} MB"
+        print(line)
+    alloc = result.get("frame_alloc_kb")
+    if alloc:
+        line = f"Allocated per frame: mean {alloc['mean']:.1f} KB, max {alloc['max']:.1f} KB"
+        base = baseline and baseline.get("frame_alloc_kb")
+        if base and base["mean"]:
+            line += f"  ({(alloc['mean'] - base['mean']) / base['mean'] * 100:+.1f}% mean vs baseline)"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless benchmark of the recognition hot path.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="build a synthetic clip from dataset faces")
+    gen.add_argument("output", help="video file (.avi/.mp4) or directory for an image sequence")
+    gen.add_argument("--people", type=int, default=4)
+    gen.add_argument("--seconds", type=float, default=10)
+    gen.add_argument("--fps", type=int, default=15)
+
+    run = sub.add_parser("run", help="benchmark a video file or image directory")
+    run.add_argument("source")
+    run.add_argument("--backend", choices=["lbph", "gallery"], default="lbph")
+    run.add_argument("--track", action="store_true", help="use the track-then-recognize mode")
+    run.add_argument("--adaptive", action="store_true", help="use the adaptive detection scheduler")
+    run.add_argument("--max-frames", type=int, default=None)
+    run.add_argument("--no-alloc", action="store_true",
+                     help="skip the second pass that measures Python allocations under tracemalloc")
+    run.add_argument("--output", help="write results as JSON to this file")
+    run.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        count = make_synthetic_clip(args.output, people=args.people, seconds=args.seconds, fps=args.fps)
+        print(f"Wrote {count} frames to {args.output}")
+    else:
+        result = run_benchmark(args.source, args.backend, args.track, args.max_frames,
+                               adaptive=args.adaptive, allocations=not args.no_alloc)
+        baseline = None
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        print_report(result, baseline)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(result, f, indent=2)
+            print(f"Results saved to {args.output}")
@@ -1,37 +1,26 @@
-import cv2
-import os
+import argparse
+from enrollment import enroll
 
-CASCADE_PATH = "haarcascade_frontalface_default.xml"
-face_cascade = cv2.CascadeClassifier(CASCADE_PATH)
-
-def capture_images(person_name, save_dir="dataset", num_samples=50):
-    person_dir = os.path.join(save_dir, person_name)
-    os.makedirs(person_dir, exist_ok=True)
-    cap = cv2.VideoCapture(0)
-    count = 0
+def capture_images(person_name, save_dir="dataset", num_samples=50, source=0, headless=False, to_cache=False):
     print(f"Capturing images for {person_name}. Press 'q' to quit early.")
-    while count < num_samples:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.2, 5)
-        for (x, y, w, h) in faces:
-            count += 1
-            face_img = gray[y:y+h, x:x+w]
-            img_path = os.path.join(person_dir, f"{person_name}_{count}.jpg")
-            cv2.imwrite(img_path, face_img)
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (0,255,0), 2)
-            cv2.putText(frame, f"{count}/{num_samples}", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0,255,0), 2)
-        cv2.imshow("Capture Faces", frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-        if count >= num_samples:
-            break
-    cap.release()
-    cv2.destroyAllWindows()
-    print(f"Saved {count} images to {person_dir}")
+
+    def progress(count, total, rejected):
+        print(f"{count}/{total} captured (rejected: {rejected['blur']} blurry, "
+              f"{rejected['duplicate']} duplicate)")
+
+    result = enroll(person_name, source=source, dataset_dir=save_dir, num_samples=num_samples,
+                    headless=headless, to_cache=to_cache, progress=progress)
+    print(f"Saved {result['saved']} images to {result['person_dir']}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture face images for one person.")
+    parser.add_argument("--source", default=0,
+                        help="webcam index, video file, image directory or stream URL (default: 0)")
+    parser.add_argument("--headless", action="store_true", help="run without a display window")
+    parser.add_argument("--samples", type=int, default=50, help="number of face images to capture")
+    parser.add_argument("--to-cache", action="store_true",
+                        help="save one .npy face stack in the training cache format instead of JPEGs")
+    args = parser.parse_args()
     name = input("Enter the person's name: ")
-    capture_images(name)
\ No newline at end of file
+    capture_images(name, num_samples=args.samples, source=args.source, headless=args.headless,
+                   to_cache=args.to_cache)
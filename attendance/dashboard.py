@@ -1,22 +1,29 @@
 import tkinter as tk
-from tkinter import messagebox, simpledialog, scrolledtext, ttk
+from tkinter import messagebox, simpledialog, scrolledtext
 import subprocess
-import os
-import pandas as pd
+import sys
+from attendance_store import open_store
+from history_viewer import HistoryViewer
+from service_client import ServiceClient
+from ui_log import LogChannel
 import threading
 
 # Paths to scripts
 CAPTURE_SCRIPT = "capture_faces.py"
 TRAIN_SCRIPT = "train_recognizer.py"
-ATTENDANCE_SCRIPT = "real_time_face_recognition.py"
+SERVICE_SCRIPT = "recognition_service.py"
 ATTENDANCE_CSV = "attendance.csv"
 
 class AttendanceDashboard(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title("Attendance Management System")
-        self.geometry("600x420")
+        self.geometry("600x460")
         self.resizable(False, False)
+        self.service = ServiceClient()
+        self.service_process = None
+        self.event_seq = 0
+        self.polling_events = False
         self.create_widgets()
 
     def create_widgets(self):
@@ -28,25 +35,25 @@ class AttendanceDashboard(tk.Tk):
         tk.Button(btn_frame, text="Capture Face Images", width=25, command=self.capture_faces).grid(row=0, column=0, pady=5)
         tk.Button(btn_frame, text="Train Recognizer", width=25, command=self.train_recognizer).grid(row=1, column=0, pady=5)
         tk.Button(btn_frame, text="Start Attendance", width=25, command=self.start_attendance).grid(row=2, column=0, pady=5)
-        tk.Button(btn_frame, text="Export Attendance (CSV)", width=25, command=self.export_attendance).grid(row=3, column=0, pady=5)
-        tk.Button(btn_frame, text="View Attendance History", width=25, command=self.view_attendance_history).grid(row=4, column=0, pady=5)
-        tk.Button(btn_frame, text="Exit", width=25, command=self.quit).grid(row=5, column=0, pady=5)
+        tk.Button(btn_frame, text="Stop Attendance", width=25, command=self.stop_attendance).grid(row=3, column=0, pady=5)
+        tk.Button(btn_frame, text="Export Attendance (CSV)", width=25, command=self.export_attendance).grid(row=4, column=0, pady=5)
+        tk.Button(btn_frame, text="View Attendance History", width=25, command=self.view_attendance_history).grid(row=5, column=0, pady=5)
+        tk.Button(btn_frame, text="Exit", width=25, command=self.quit).grid(row=6, column=0, pady=5)
 
         tk.Label(self, text="Status / Log:", font=("Arial", 12, "bold")).pack(pady=(20, 0))
         self.log_area = scrolledtext.ScrolledText(self, width=70, height=8, state='disabled')
         self.log_area.pack(pady=5)
+        self.log_channel = LogChannel(self.log_area)
 
-    def log(self, message):
-        self.log_area.config(state='normal')
-        self.log_area.insert(tk.END, message + "\n")
-        self.log_area.see(tk.END)
-        self.log_area.config(state='disabled')
+    def log(self, message, key=None):
+        """Queue a log line from any thread; lines with a ``key`` are rate limited per key."""
+        self.log_channel.put(message, key)
 
     def run_script_with_log(self, command, input_text=None):
         def target():
             try:
                 process = subprocess.Popen(
-                    ['python', command],
+                    [sys.executable, command],
                     stdin=subprocess.PIPE if input_text else None,
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
@@ -75,38 +82,81 @@ class AttendanceDashboard(tk.Tk):
 
     def train_recognizer(self):
         self.log("Training recognizer...")
+        # A running recognition service notices the new model on disk and swaps it in itself
         self.run_script_with_log(TRAIN_SCRIPT)
 
+    def ensure_service(self):
+        """Start the recognition service once; later sessions reuse the loaded models."""
+        if self.service.is_running():
+            return True
+        self.log("Starting recognition service (models are loaded once)...")
+        self.service_process = subprocess.Popen([sys.executable, SERVICE_SCRIPT],
+                                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return self.service.wait_until_ready()
+
     def start_attendance(self):
-        self.log("Starting real-time attendance. Close the webcam window to finish.")
-        self.run_script_with_log(ATTENDANCE_SCRIPT)
+        def target():
+            try:
+                if not self.ensure_service():
+                    self.log("Recognition service did not start.")
+                    return
+                self.event_seq = self.service.status()["last_event"]
+                if self.service.start_session()["started"]:
+                    self.log("Starting real-time attendance. Close the webcam window or click 'Stop Attendance' to finish.")
+                else:
+                    self.log("An attendance session is already running.")
+                self.poll_events()
+            except Exception as e:
+                self.log(f"Error starting attendance: {e}")
+
+        threading.Thread(target=target, daemon=True).start()
+
+    def stop_attendance(self):
+        def target():
+            try:
+                if self.service.is_running():
+                    self.service.stop_session()
+            except Exception as e:
+                self.log(f"Error stopping attendance: {e}")
+
+        threading.Thread(target=target, daemon=True).start()
+
+    def poll_events(self):
+        """Follow the service's event stream until the session stops."""
+        if self.polling_events:
+            return
+        self.polling_events = True
+        try:
+            while True:
+                for event in self.service.events(self.event_seq):
+                    self.event_seq = event["seq"]
+                    self.log(event["message"])
+                    if event["type"] == "session" and event.get("state") == "stopped":
+                        return
+        except Exception as e:
+            self.log(f"Lost connection to recognition service: {e}")
+        finally:
+            self.polling_events = False
 
     def export_attendance(self):
-        if os.path.exists(ATTENDANCE_CSV):
-            self.log(f"Attendance exported to {ATTENDANCE_CSV}")
+        try:
+            store = open_store()
+            count = store.export_csv(ATTENDANCE_CSV)
+            store.close()
+        except Exception as e:
+            self.log(f"Export failed: {e}")
+            messagebox.showerror("Export", f"Could not export attendance: {e}")
+            return
+        if count:
+            self.log(f"Exported {count} records to {ATTENDANCE_CSV}")
             messagebox.showinfo("Export", f"Attendance exported to {ATTENDANCE_CSV}")
         else:
-            self.log("No attendance file found to export.")
-            messagebox.showwarning("Export", "No attendance file found to export.")
-            
+            self.log("No attendance records found to export.")
+            messagebox.showwarning("Export", "No attendance records found to export.")
+
     def view_attendance_history(self):
-        if not os.path.exists(ATTENDANCE_CSV):
-            messagebox.showwarning("No Data", "No attendance file found to display.")
-            return
         try:
-            df = pd.read_csv(ATTENDANCE_CSV)
-            win = tk.Toplevel(self)
-            win.title("Attendance History")
-            win.geometry("450x300")
-            tree = ttk.Treeview(win)
-            tree.pack(expand=True, fill='both')
-            tree["columns"] = list(df.columns)
-            tree["show"] = "headings"
-            for col in df.columns:
-                tree.heading(col, text=col)
-                tree.column(col, width=150)
-            for _, row in df.iterrows():
-                tree.insert("", "end", values=list(row))
+            HistoryViewer(self)
         except Exception as e:
             messagebox.showerror("Error", f"Could not load attendance history: {e}")
 
@@ -0,0 +1,138 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from frame_sources import Display, open_source
+from pipeline import detect_faces
+from preprocess import FramePreprocessor
+
+CASCADE_PATH = "haarcascade_frontalface_default.xml"
+DATASET_DIR = "dataset"
+
+
+class FaceQualityFilter:
+    """Rejects blurry crops and near-duplicates of crops already accepted.
+
+    Blur is the variance of the Laplacian; duplicates are detected by the mean
+    absolute difference of 32x32 thumbnails against every accepted sample.
+    """
+
+    def __init__(self, blur_threshold=60.0, duplicate_threshold=6.0):
+        self.blur_threshold = blur_threshold
+        self.duplicate_threshold = duplicate_threshold
+        self.thumbnails = np.empty((0, 32, 32), dtype=np.int16)
+        self.rejected = {"blur": 0, "duplicate": 0}
+
+    def accept(self, face):
+        if cv2.Laplacian(face, cv2.CV_64F).var() < self.blur_threshold:
+            self.rejected["blur"] += 1
+            return False
+        thumb = cv2.resize(face, (32, 32), interpolation=cv2.INTER_AREA).astype(np.int16)
+        if len(self.thumbnails):
+            diff = np.abs(self.thumbnails - thumb).mean(axis=(1, 2)).min()
+            if diff < self.duplicate_threshold:
+                self.rejected["duplicate"] += 1
+                return False
+        self.thumbnails = np.concatenate([self.thumbnails, thumb[None]])
+        return True
+
+
+class EnrollmentWriter:
+    """Saves accepted faces off the capture thread.
+
+    JPEG mode encodes and writes each face in a thread pool. Cache mode keeps
+    the faces in memory and writes one (N, H, W) uint8 ``.npy`` stack, which
+    the training face cache reads without decoding.
+    """
+
+    def __init__(self, person_dir, person_name, to_cache=False, workers=4):
+        self.person_dir = person_dir
+        self.person_name = person_name
+        self.to_cache = to_cache
+        self.faces = []
+        self.failed = 0
+        self._pool = None if to_cache else ThreadPoolExecutor(max_workers=workers)
+        self._futures = []
+
+    @staticmethod
+    def _write(path, face):
+        return cv2.imwrite(path, face)
+
+    def submit(self, face, index):
+        if self.to_cache:
+            self.faces.append(face)
+            return
+        path = os.path.join(self.person_dir, f"{self.person_name}_{index}.jpg")
+        self._futures.append(self._pool.submit(self._write, path, face))
+
+    def pending(self):
+        return sum(1 for f in self._futures if not f.done())
+
+    def close(self):
+        """Wait for outstanding writes; returns the number of faces saved."""
+        if not self.to_cache:
+            self._pool.shutdown(wait=True)
+            # Counted here from the results, not in the pool threads
+            saved = sum(1 for f in self._futures if f.exception() is None and f.result())
+            self.failed = len(self._futures) - saved
+            return saved
+        if not self.faces:
+            return 0
+        path = os.path.join(self.person_dir, f"{self.person_name}_faces.npy")
+        tmp_path = path + ".tmp.npy"
+        np.save(tmp_path, np.stack(self.faces))
+        os.replace(tmp_path, path)
+        return len(self.faces)
+
+
+def enroll(person_name, source=0, dataset_dir=DATASET_DIR, num_samples=50, headless=False,
+           to_cache=False, progress=None, stop_event=None, cascade_path=CASCADE_PATH):
+    """Capture ``num_samples`` diverse, sharp face crops of one person.
+
+    Faces are detected on the half-resolution frame, cropped from the full
+    resolution grayscale frame and resized to the training size by the same
+    FramePreprocessor the recognition loop uses, before the quality filter.
+    They are saved without equalization; the face cache applies the current
+    setting when training reads them. ``progress(saved, num_samples, rejected)``
+    is called after every accepted face. Returns a summary dict.
+    """
+    person_dir = os.path.join(dataset_dir, person_name)
+    os.makedirs(person_dir, exist_ok=True)
+    face_cascade = cv2.CascadeClassifier(cascade_path)
+    cap = open_source(source)
+    display = Display(headless)
+    preprocessor = FramePreprocessor(equalize=None)
+    quality = FaceQualityFilter()
+    writer = EnrollmentWriter(person_dir, person_name, to_cache)
+    stop_event = stop_event or threading.Event()
+    count = 0
+    try:
+        while count < num_samples and not stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            gray = preprocessor.gray(frame)
+            boxes = detect_faces(gray, face_cascade, preprocessor=preprocessor)
+            for (x, y, w, h), face in zip(boxes, preprocessor.faces(gray, boxes)):
+                accepted = count < num_samples and quality.accept(face)
+                if accepted:
+                    count += 1
+                    # The crop lives in the preprocessor's buffer; the writer keeps a copy
+                    writer.submit(face.copy(), count)
+                    if progress:
+                        progress(count, num_samples, dict(quality.rejected))
+                if not headless:
+                    color = (0, 255, 0) if accepted else (0, 165, 255)
+                    cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+                    cv2.putText(frame, f"{count}/{num_samples}", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8,
+                                color, 2)
+            if not display.show("Capture Faces", frame):
+                break
+    finally:
+        cap.release()
+        display.close()
+        saved = writer.close()
+    return {"saved": saved, "rejected": dict(quality.rejected), "person_dir": person_dir}
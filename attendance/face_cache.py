@@ -0,0 +1,184 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from preprocess import FACE_SIZE, make_equalizer, normalize_face, settings_key
+
+CACHE_DIR = "face_cache"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".pgm")
+STACK_EXTENSION = ".npy"  # (N, H, W) uint8 face stacks written by enrollment
+
+
+def load_face(path):
+    """Decode one dataset image to a normalized face (see preprocess.py), or None if unreadable."""
+    img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None
+    return normalize_face(img)
+
+
+def load_faces(path):
+    """Return the list of normalized faces stored in a dataset file (image or .npy stack)."""
+    if path.lower().endswith(STACK_EXTENSION):
+        try:
+            stack = np.load(path)
+        except (OSError, ValueError):
+            return []
+        if stack.ndim != 3:
+            return []
+        equalizer = make_equalizer()
+        return [normalize_face(f, equalizer=equalizer) for f in stack]
+    face = load_face(path)
+    return [] if face is None else [face]
+
+
+def file_key(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def list_people(dataset_dir):
+    """Return sorted (person_name, person_dir, cohort) for every person in the dataset.
+
+    People are folders of images directly under ``dataset_dir``, or one level
+    deeper inside a cohort/class folder (``dataset/<cohort>/<person>/``);
+    cohort is None for the flat layout.
+    """
+    people = []
+    for name in sorted(os.listdir(dataset_dir)):
+        top_dir = os.path.join(dataset_dir, name)
+        if not os.path.isdir(top_dir):
+            continue
+        subdirs = [d for d in sorted(os.listdir(top_dir)) if os.path.isdir(os.path.join(top_dir, d))]
+        if subdirs:
+            people.extend((person_name, os.path.join(name, person_name), name) for person_name in subdirs)
+        else:
+            people.append((name, name, None))
+    return people
+
+
+def list_dataset(dataset_dir):
+    """Return sorted (relative_path, person_name) pairs for every image in the dataset."""
+    entries = []
+    for person_name, person_dir, _ in list_people(dataset_dir):
+        for img_name in sorted(os.listdir(os.path.join(dataset_dir, person_dir))):
+            if img_name.lower().endswith(IMAGE_EXTENSIONS + (STACK_EXTENSION,)):
+                entries.append((os.path.join(person_dir, img_name), person_name))
+    return entries
+
+
+class FaceCache:
+    """Decoded, size-normalized training faces kept in one memory-mapped array.
+
+    ``faces-<generation>.npy`` holds an (N, H, W) uint8 array,
+    ``labels-<generation>.npy`` the matching label IDs, and ``index.json``
+    maps each dataset file to its first row and row count (images have one
+    row, .npy stacks several) along with the (mtime, size) key used to detect
+    changed files. The index also records the face normalization
+    (preprocess.settings_key); when that changes every file is decoded again.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, "index.json")
+
+    def _read_index(self):
+        if not os.path.exists(self.index_path):
+            return {"generation": 0, "faces_file": None, "labels_file": None, "files": {},
+                    "preprocess": settings_key()}
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def load(self):
+        """Return (faces, labels, index) from the cache, or (None, None, index) if empty."""
+        index = self._read_index()
+        if not index["faces_file"]:
+            return None, None, index
+        faces = np.load(os.path.join(self.cache_dir, index["faces_file"]), mmap_mode="r")
+        labels = np.load(os.path.join(self.cache_dir, index["labels_file"]))
+        return faces, labels, index
+
+    def sync(self, dataset_dir, name_to_label, workers=None):
+        """Bring the cache in line with ``dataset_dir``, decoding only new or changed files.
+
+        Returns (faces, labels, files_decoded).
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        old_faces, old_labels, index = self.load()
+        old_files = index["files"]
+        # Caches written before the setting was recorded hold plain 200x200 faces
+        if index.get("preprocess", settings_key((200, 200), None)) != settings_key():
+            old_files = {}
+
+        entries = list_dataset(dataset_dir)
+        keys = {}
+        to_decode = []
+        for rel, _ in entries:
+            keys[rel] = file_key(os.path.join(dataset_dir, rel))
+            cached = old_files.get(rel)
+            if old_faces is None or cached is None or cached["key"] != keys[rel]:
+                to_decode.append(rel)
+
+        decoded = {}
+        if to_decode:
+            paths = [os.path.join(dataset_dir, rel) for rel in to_decode]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                chunksize = max(1, len(paths) // ((workers or os.cpu_count() or 1) * 4))
+                for rel, faces in zip(to_decode, pool.map(load_faces, paths, chunksize=chunksize)):
+                    decoded[rel] = faces
+
+        # rows: (rel, person_name, old_row or None, decoded face or None)
+        rows = []
+        for rel, person_name in entries:
+            if rel in decoded:
+                rows.extend((rel, person_name, None, face) for face in decoded[rel])
+            elif rel in old_files:
+                start, count = old_files[rel]["row"], old_files[rel].get("count", 1)
+                rows.extend((rel, person_name, start + k, None) for k in range(count))
+
+        unchanged = (not decoded and len(rows) == len(old_labels if old_labels is not None else [])
+                     and all(old_row == i for i, (_, _, old_row, _) in enumerate(rows)))
+        if unchanged and old_faces is not None:
+            return old_faces, old_labels, 0
+
+        generation = index["generation"] + 1
+        faces_file = f"faces-{generation}.npy"
+        labels_file = f"labels-{generation}.npy"
+        faces = np.lib.format.open_memmap(os.path.join(self.cache_dir, faces_file), mode="w+",
+                                          dtype=np.uint8, shape=(len(rows), FACE_SIZE[1], FACE_SIZE[0]))
+        labels = np.empty(len(rows), dtype=np.int32)
+        files = {}
+        for i, (rel, person_name, old_row, face) in enumerate(rows):
+            faces[i] = face if old_row is None else old_faces[old_row]
+            labels[i] = name_to_label[person_name]
+            if rel in files:
+                files[rel]["count"] += 1
+            else:
+                files[rel] = {"key": keys[rel], "row": i, "count": 1}
+        for rel, decoded_faces in decoded.items():
+            if not decoded_faces:
+                # Remember unreadable files so they are not decoded again on every run
+                files[rel] = {"key": keys[rel], "row": 0, "count": 0}
+        faces.flush()
+        del faces
+        np.save(os.path.join(self.cache_dir, labels_file), labels)
+
+        # The index is written last so an interrupted sync leaves the old cache valid
+        new_index = {"generation": generation, "faces_file": faces_file,
+                     "labels_file": labels_file, "files": files, "preprocess": settings_key()}
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(new_index, f)
+        os.replace(tmp_path, self.index_path)
+        if index["faces_file"]:
+            del old_faces
+            for old_file in (index["faces_file"], index["labels_file"]):
+                try:
+                    os.remove(os.path.join(self.cache_dir, old_file))
+                except OSError:
+                    pass
+        faces, labels, _ = self.load()
+        return faces, labels, len(decoded)
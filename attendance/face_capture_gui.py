@@ -1,16 +1,21 @@
 import tkinter as tk
-from tkinter import simpledialog, messagebox, scrolledtext
-import cv2
-import os
+from tkinter import messagebox, scrolledtext, ttk
+import threading
+from ui_log import LogChannel, UiCalls
 
 CASCADE_PATH = "haarcascade_frontalface_default.xml"
 DATASET_DIR = "dataset"
+VIDEO_SOURCE = 0  # webcam index, video file, image directory or stream URL
+NUM_SAMPLES = 50
 
 class FaceCaptureApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, source=VIDEO_SOURCE, headless=False):
         super().__init__()
+        self.source = source
+        self.headless = headless
+        self.stop_event = None
         self.title("User Registration & Face Capture")
-        self.geometry("500x300")
+        self.geometry("500x340")
         self.create_widgets()
 
     def create_widgets(self):
@@ -18,52 +23,69 @@ class FaceCaptureApp(tk.Tk):
         tk.Label(self, text="Enter Name:").pack()
         self.name_entry = tk.Entry(self, width=30)
         self.name_entry.pack(pady=5)
-        tk.Button(self, text="Capture Face Images", width=25, command=self.capture_faces).pack(pady=10)
+        self.capture_btn = tk.Button(self, text="Capture Face Images", width=25, command=self.capture_faces)
+        self.capture_btn.pack(pady=10)
+        self.progress = ttk.Progressbar(self, length=300, maximum=NUM_SAMPLES)
+        self.progress.pack(pady=5)
         self.log_area = scrolledtext.ScrolledText(self, width=60, height=8, state='disabled')
         self.log_area.pack(pady=5)
-        tk.Button(self, text="Exit", width=20, command=self.destroy).pack(pady=5)
+        self.log_channel = LogChannel(self.log_area)
+        self.ui_calls = UiCalls(self)
+        tk.Button(self, text="Exit", width=20, command=self.on_close).pack(pady=5)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
-    def log(self, message):
-        self.log_area.config(state='normal')
-        self.log_area.insert(tk.END, message + "\n")
-        self.log_area.see(tk.END)
-        self.log_area.config(state='disabled')
+    def log(self, message, key=None):
+        """Queue a log line from any thread; lines with a ``key`` are rate limited per key."""
+        self.log_channel.put(message, key)
+
+    def on_close(self):
+        if self.stop_event:
+            self.stop_event.set()
+        self.destroy()
 
     def capture_faces(self):
         person_name = self.name_entry.get().strip()
         if not person_name:
             messagebox.showwarning("Input Error", "Please enter a name.")
             return
-        person_dir = os.path.join(DATASET_DIR, person_name)
-        os.makedirs(person_dir, exist_ok=True)
-        cap = cv2.VideoCapture(0)
-        face_cascade = cv2.CascadeClassifier(CASCADE_PATH)
-        count = 0
-        num_samples = 50
+        self.capture_btn.config(state='disabled')
+        self.progress["value"] = 0
+        self.stop_event = threading.Event()
         self.log(f"Capturing images for {person_name}. Press 'q' to quit early.")
-        while count < num_samples:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, 1.2, 5)
-            for (x, y, w, h) in faces:
-                count += 1
-                face_img = gray[y:y+h, x:x+w]
-                img_path = os.path.join(person_dir, f"{person_name}_{count}.jpg")
-                cv2.imwrite(img_path, face_img)
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (0,255,0), 2)
-                cv2.putText(frame, f"{count}/{num_samples}", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0,255,0), 2)
-            cv2.imshow("Capture Faces", frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-            if count >= num_samples:
-                break
-        cap.release()
-        cv2.destroyAllWindows()
-        self.log(f"Saved {count} images to {person_dir}")
-        messagebox.showinfo("Done", f"Saved {count} images for {person_name}.")
+        # Capture runs off the Tk thread; UI updates are handed back through ui_calls
+        threading.Thread(target=self.run_capture, args=(person_name,), daemon=True).start()
+
+    def run_capture(self, person_name):
+        def progress(count, total, rejected):
+            self.ui_calls.put(self.show_progress, count, total, rejected)
+
+        try:
+            # Imported here so OpenCV loads on this worker thread, not before the window shows
+            from enrollment import enroll
+            result = enroll(person_name, source=self.source, dataset_dir=DATASET_DIR, num_samples=NUM_SAMPLES,
+                            headless=self.headless, progress=progress, stop_event=self.stop_event,
+                            cascade_path=CASCADE_PATH)
+        except Exception as e:
+            self.ui_calls.put(self.capture_failed, e)
+            return
+        self.ui_calls.put(self.capture_done, person_name, result)
+
+    def show_progress(self, count, total, rejected):
+        self.progress["value"] = count
+        if count % 10 == 0 or count == total:
+            self.log(f"{count}/{total} captured (rejected: {rejected['blur']} blurry, "
+                     f"{rejected['duplicate']} duplicate)")
+
+    def capture_done(self, person_name, result):
+        self.capture_btn.config(state='normal')
+        self.log(f"Saved {result['saved']} images to {result['person_dir']}")
+        messagebox.showinfo("Done", f"Saved {result['saved']} images for {person_name}.")
+
+    def capture_failed(self, error):
+        self.capture_btn.config(state='normal')
+        self.log(f"Capture failed: {error}")
+        messagebox.showerror("Error", f"Capture failed: {error}")
 
 if __name__ == "__main__":
     app = FaceCaptureApp()
-    app.mainloop()
\ No newline at end of file
+    app.mainloop()
@@ -0,0 +1,116 @@
+from collections import Counter, deque
+from itertools import count
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def centroid_distance(a, b):
+    """Distance between box centres, relative to the size of box ``a``."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    dx = (ax + aw / 2) - (bx + bw / 2)
+    dy = (ay + ah / 2) - (by + bh / 2)
+    return (dx * dx + dy * dy) ** 0.5 / max(aw, ah, 1)
+
+
+class Track:
+    def __init__(self, track_id, box, votes_required):
+        self.id = track_id
+        self.box = box
+        self.verified_box = None
+        self.name = "Unknown"
+        self.confidence = None
+        self.votes = deque(maxlen=votes_required)
+        self.age = 0
+        self.missed = 0
+        self.last_verified = None
+        self.reported_name = None
+
+    @property
+    def confirmed(self):
+        return len(self.votes) == self.votes.maxlen
+
+
+class FaceTracker:
+    """Associates detections across frames so recognition runs once per face track.
+
+    Detections are matched to existing tracks greedily by IoU, falling back to
+    centroid distance for fast-moving faces. Each track caches its identity,
+    which is the majority vote over its last ``votes_required`` predictions.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_centroid_distance=0.5, max_missed=10,
+                 reverify_interval=30, box_change_threshold=0.5, votes_required=3):
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance
+        self.max_missed = max_missed
+        self.reverify_interval = reverify_interval
+        self.box_change_threshold = box_change_threshold
+        self.votes_required = votes_required
+        self.tracks = []
+        self._ids = count(1)
+
+    def update(self, boxes):
+        """Match ``boxes`` to tracks; returns the tracks for this frame in box order."""
+        for track in self.tracks:
+            track.age += 1
+        candidates = []
+        for i, box in enumerate(boxes):
+            for track in self.tracks:
+                overlap = iou(track.box, box)
+                if overlap >= self.iou_threshold:
+                    candidates.append((overlap, i, track))
+                elif centroid_distance(track.box, box) <= self.max_centroid_distance:
+                    candidates.append((0.0, i, track))
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        matched = {}
+        used = set()
+        for _, i, track in candidates:
+            if i in matched or track.id in used:
+                continue
+            matched[i] = track
+            used.add(track.id)
+        result = []
+        for i, box in enumerate(boxes):
+            track = matched.get(i)
+            if track is None:
+                track = Track(next(self._ids), box, self.votes_required)
+                self.tracks.append(track)
+            track.box = box
+            track.missed = 0
+            result.append(track)
+        for track in self.tracks:
+            if track.id not in used and track not in result:
+                track.missed += 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+        return result
+
+    def needs_recognition(self, track):
+        if not track.confirmed or track.last_verified is None:
+            return True
+        if track.age - track.last_verified >= self.reverify_interval:
+            return True
+        return iou(track.verified_box, track.box) < self.box_change_threshold
+
+    def add_prediction(self, track, name, confidence):
+        track.votes.append(name)
+        track.last_verified = track.age
+        track.verified_box = track.box
+        track.confidence = confidence
+        if track.confirmed:
+            track.name = Counter(track.votes).most_common(1)[0][0]
+
+    def take_new_identity(self, track):
+        """Return the track's identity the first time it is confirmed (or changes), else None."""
+        if not track.confirmed or track.name == track.reported_name:
+            return None
+        track.reported_name = track.name
+        return track.name
@@ -0,0 +1,149 @@
+import os
+import time
+
+import cv2
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".pgm")
+STREAM_PREFIXES = ("rtsp://", "rtsps://", "http://", "https://", "udp://", "tcp://")
+
+
+class FrameSource:
+    """Minimal frame source interface: ``read()`` returns (ok, frame) like cv2.VideoCapture."""
+
+    name = "source"
+
+    def read(self):
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+    def __iter__(self):
+        while True:
+            ok, frame = self.read()
+            if not ok:
+                return
+            yield frame
+
+
+class CaptureSource(FrameSource):
+    """Any input cv2.VideoCapture can open: webcam index, video file or stream URL."""
+
+    def __init__(self, spec, name=None):
+        self.spec = spec
+        self.name = name or str(spec)
+        self.cap = cv2.VideoCapture(spec)
+
+    def read(self):
+        return self.cap.read()
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource(CaptureSource):
+    """Video file input; ``realtime`` paces reads at the file's frame rate, ``loop`` rewinds at the end."""
+
+    def __init__(self, path, loop=False, realtime=False, name=None):
+        super().__init__(path, name or os.path.basename(path))
+        self.loop = loop
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 0
+        self.interval = 1.0 / fps if realtime and fps > 0 else 0.0
+        self._next = time.perf_counter()
+
+    def read(self):
+        if self.interval:
+            delay = self._next - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._next = max(self._next + self.interval, time.perf_counter())
+        ok, frame = self.cap.read()
+        if not ok and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        return ok, frame
+
+
+class StreamSource(CaptureSource):
+    """Network stream (RTSP/HTTP) that reconnects after read failures instead of ending."""
+
+    def __init__(self, url, reconnect_attempts=5, reconnect_delay=2.0, name=None):
+        super().__init__(url, name)
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+
+    def read(self):
+        ok, frame = self.cap.read()
+        attempts = 0
+        while not ok and attempts < self.reconnect_attempts:
+            attempts += 1
+            self.cap.release()
+            time.sleep(self.reconnect_delay)
+            self.cap = cv2.VideoCapture(self.spec)
+            ok, frame = self.cap.read()
+        return ok, frame
+
+
+class ImageDirectorySource(FrameSource):
+    """Frames from a directory of images, in file-name order."""
+
+    def __init__(self, directory, loop=False, name=None):
+        self.directory = directory
+        self.name = name or os.path.basename(os.path.normpath(directory))
+        self.loop = loop
+        self.paths = [os.path.join(directory, f) for f in sorted(os.listdir(directory))
+                      if f.lower().endswith(IMAGE_EXTENSIONS)]
+        self._index = 0
+
+    def read(self):
+        while self._index < len(self.paths) or (self.loop and self.paths):
+            if self._index >= len(self.paths):
+                self._index = 0
+            frame = cv2.imread(self.paths[self._index])
+            self._index += 1
+            if frame is not None:
+                return True, frame
+        return False, None
+
+
+def open_source(spec, loop=False, realtime=False):
+    """Open a frame source from a spec.
+
+    An int or digit string is a webcam index, a URL is a network stream, a
+    directory is an image sequence and anything else is a video file.
+    Existing FrameSource objects are returned unchanged.
+    """
+    if isinstance(spec, FrameSource):
+        return spec
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        return CaptureSource(int(spec), name=f"webcam{spec}")
+    if spec.lower().startswith(STREAM_PREFIXES):
+        return StreamSource(spec)
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec, loop=loop)
+    if not os.path.exists(spec):
+        raise IOError(f"Frame source not found: {spec}")
+    return VideoFileSource(spec, loop=loop, realtime=realtime)
+
+
+class Display:
+    """Shows frames with cv2.imshow, or does nothing in headless mode.
+
+    ``show`` returns False once the user presses 'q'.
+    """
+
+    def __init__(self, headless=False):
+        self.headless = headless
+        self._windows = set()
+
+    def show(self, window, frame):
+        if self.headless:
+            return True
+        cv2.imshow(window, frame)
+        self._windows.add(window)
+        return (cv2.waitKey(1) & 0xFF) != ord('q')
+
+    def close(self):
+        if not self.headless and self._windows:
+            cv2.destroyAllWindows()
+        self._windows.clear()
@@ -0,0 +1,168 @@
+import math
+import os
+import threading
+import time
+
+from pipeline import DEFAULT_POINT, OperatingPoint
+
+TARGET_LATENCY_MS = 200  # capture to result, 95th percentile
+CPU_BUDGET = None  # share of all cores the process may use (e.g. 0.5); None targets latency only
+
+# Operating points from the best detection quality to the cheapest; loops start at DEFAULT_POINT
+LEVELS = (
+    OperatingPoint(1.0, 1, 1.05, 5),
+    OperatingPoint(0.75, 1, 1.1, 4),
+    DEFAULT_POINT,
+    OperatingPoint(0.5, 2, 1.2, 4),
+    OperatingPoint(0.4, 2, 1.2, 3),
+    OperatingPoint(0.3, 3, 1.3, 3),
+)
+
+
+def describe(point):
+    return (f"scale {point.scale:g}, stride {point.stride}, scaleFactor {point.scale_factor:g}, "
+            f"minNeighbors {point.min_neighbors}")
+
+
+class LoadGovernor:
+    """Moves a recognition loop between operating points to meet a latency or CPU budget.
+
+    The loop calls ``observe`` once per processed frame with its end-to-end
+    latency and the time spent processing it; workers read ``point``. Once a
+    window of about ``window_s`` seconds is complete, the pressure is the
+    larger of p95 latency / target and CPU use / budget.
+
+    - ``down_windows`` windows in a row over 1.0 step one level cheaper.
+    - Stepping back up needs ``up_windows`` windows in a row in which the
+      next better level is predicted to stay under ``up_margin``. The
+      prediction scales the current latency and CPU by that level's cost
+      per frame: measured when the level has run before, otherwise estimated
+      from its detection pixels and cascade pyramid depth.
+    - The window right after a change is discarded while queues settle.
+
+    The gap between ``up_margin`` and 1.0 plus the learned costs keep it
+    from bouncing between two levels. ``report`` is called with a message
+    whenever the point changes.
+    """
+
+    def __init__(self, target_latency_ms=TARGET_LATENCY_MS, cpu_budget=CPU_BUDGET, levels=LEVELS, start=None,
+                 window_s=1.0, min_frames=5, down_windows=2, up_windows=5, up_margin=0.7, report=None):
+        self.target = target_latency_ms / 1000.0 if target_latency_ms else None
+        self.cpu_budget = cpu_budget
+        self.levels = list(levels)
+        self.level = self.levels.index(DEFAULT_POINT) if start is None else start
+        self.point = self.levels[self.level]
+        self.window_s = window_s
+        self.min_frames = min_frames
+        self.down_windows = down_windows
+        self.up_windows = up_windows
+        self.up_margin = up_margin
+        self.report = report
+        self.changes = 0
+        self.last = {"p95_ms": 0.0, "cpu": 0.0, "pressure": 0.0}
+        self._costs = [None] * len(self.levels)  # mean processing seconds per frame at each level
+        self._lock = threading.Lock()
+        self._latencies = []
+        self._busy = 0.0
+        self._over = self._under = 0
+        self._settling = False
+        self._window_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    def observe(self, latency, busy):
+        """Record one processed frame; returns the new OperatingPoint when this frame changed it."""
+        with self._lock:
+            self._latencies.append(latency)
+            self._busy += busy
+            now = time.perf_counter()
+            if now - self._window_start < self.window_s or len(self._latencies) < self.min_frames:
+                return None
+            message = self._close_window(now)
+        if message is None:
+            return None
+        if self.report:
+            self.report(message)
+        return self.point
+
+    def _pressure(self, latency, cpu):
+        pressures = []
+        if self.target:
+            pressures.append(latency / self.target)
+        if self.cpu_budget:
+            pressures.append(cpu / self.cpu_budget)
+        return max(pressures, default=0.0)
+
+    def _cost_ratio(self, level):
+        """Expected processing cost per frame at ``level`` relative to the current one."""
+        known, current = self._costs[level], self._costs[self.level]
+        if known and current:
+            return known / current
+        # Cascade cost follows the detection pixels and the number of pyramid scales
+        new, cur = self.levels[level], self.point
+        return ((new.scale / cur.scale) ** 2
+                * math.log(cur.scale_factor) / math.log(new.scale_factor))
+
+    def _close_window(self, now):
+        latencies = sorted(self._latencies)
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        cost = self._busy / len(latencies)
+        cpu = (time.process_time() - self._cpu_start) / (now - self._window_start) / (os.cpu_count() or 1)
+        self._latencies = []
+        self._busy = 0.0
+        self._window_start = now
+        self._cpu_start = time.process_time()
+        if self._settling:
+            self._settling = False
+            return None
+
+        previous = self._costs[self.level]
+        self._costs[self.level] = cost if previous is None else 0.7 * previous + 0.3 * cost
+        pressure = self._pressure(p95, cpu)
+        self.last = {"p95_ms": p95 * 1000, "cpu": cpu, "pressure": pressure}
+        reason = f"p95 latency {p95 * 1000:.0f} ms, cpu {cpu:.0%}"
+        if pressure > 1.0:
+            self._under = 0
+            self._over += 1
+            if self._over >= self.down_windows and self.level < len(self.levels) - 1:
+                return self._move(self.level + 1, f"over budget ({reason})")
+            return None
+        self._over = 0
+        if self.level == 0:
+            return None
+        better = self.levels[self.level - 1]
+        ratio = self._cost_ratio(self.level - 1)
+        # Skipping fewer frames costs CPU but not per-frame latency
+        predicted = self._pressure(p95 * ratio, cpu * ratio * self.point.stride / better.stride)
+        self._under = self._under + 1 if predicted < self.up_margin else 0
+        if self._under >= self.up_windows:
+            return self._move(self.level - 1, f"headroom ({reason}, predicted {predicted:.2f} of budget)")
+        return None
+
+    def _move(self, level, reason):
+        direction = "down" if level > self.level else "up"
+        self.level = level
+        self.point = self.levels[level]
+        self.changes += 1
+        self._over = self._under = 0
+        self._settling = True
+        return f"[governor] stepped {direction} to {describe(self.point)}: {reason}"
+
+    def label(self):
+        """Short operating point summary for the video overlay."""
+        point = self.point
+        return (f"scale {point.scale:g} stride {point.stride} sf {point.scale_factor:g} "
+                f"mn {point.min_neighbors} | p95 {self.last['p95_ms']:.0f} ms")
+
+    def summary(self):
+        with self._lock:
+            return {"level": self.level, "point": self.point._asdict(), "changes": self.changes,
+                    "target_latency_ms": self.target * 1000 if self.target else None,
+                    "cpu_budget": self.cpu_budget, **self.last}
+
+    def format_stats(self):
+        s = self.summary()
+        target = f" of {s['target_latency_ms']:.0f}" if s["target_latency_ms"] else ""
+        budget = f" of {s['cpu_budget']:.0%}" if s["cpu_budget"] else ""
+        return (f"[governor] level {s['level'] + 1}/{len(self.levels)}: {describe(self.point)} | "
+                f"p95 latency {s['p95_ms']:.0f}{target} ms | cpu {s['cpu']:.0%}{budget} | "
+                f"{s['changes']} changes")
@@ -0,0 +1,155 @@
+import tkinter as tk
+from tkinter import messagebox, ttk
+
+from attendance_store import open_store
+
+PAGE_SIZE = 200
+# Fetch the next page once the visible part of the list passes this fraction
+PREFETCH_AT = 0.8
+
+
+class HistoryViewer(tk.Toplevel):
+    """Attendance history window that pages rows from SQLite as the user scrolls.
+
+    Only the rows scrolled into view so far are inserted into the Treeview.
+    Filtering, sorting and the aggregate tabs are all done by SQL queries on
+    the store's indexes.
+    """
+
+    def __init__(self, master, store=None):
+        super().__init__(master)
+        self.title("Attendance History")
+        self.geometry("560x420")
+        self.own_store = store is None
+        self.store = store or open_store()
+        self.filters = {"start_date": None, "end_date": None, "name": None}
+        self.sort, self.descending = "timestamp", True
+        self.last_key = None
+        self.exhausted = False
+        self.loaded = 0
+        self.total = 0
+        self.aggregates_stale = True
+        self.create_widgets()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.apply_filters()
+
+    def create_widgets(self):
+        bar = tk.Frame(self)
+        bar.pack(fill='x', padx=5, pady=5)
+        tk.Label(bar, text="From:").pack(side='left')
+        self.start_entry = tk.Entry(bar, width=11)
+        self.start_entry.pack(side='left')
+        tk.Label(bar, text="To:").pack(side='left')
+        self.end_entry = tk.Entry(bar, width=11)
+        self.end_entry.pack(side='left')
+        tk.Label(bar, text="Name:").pack(side='left')
+        self.name_box = ttk.Combobox(bar, width=14, values=[""] + self.store.names())
+        self.name_box.pack(side='left')
+        tk.Button(bar, text="Apply", command=self.apply_filters).pack(side='left', padx=5)
+
+        notebook = ttk.Notebook(self)
+        notebook.pack(expand=True, fill='both')
+        notebook.bind("<<NotebookTabChanged>>", lambda event: self.refresh_aggregates())
+        self.notebook = notebook
+        records = tk.Frame(notebook)
+        notebook.add(records, text="Records")
+        self.tree = self.make_tree(records, [("name", "Name", 180), ("timestamp", "Timestamp", 180)],
+                                   sortable=True, on_scroll=self.on_scroll)
+        daily = tk.Frame(notebook)
+        notebook.add(daily, text="Daily counts")
+        self.daily_tree = self.make_tree(daily, [("date", "Date", 150), ("count", "Attendees", 100)])
+        people = tk.Frame(notebook)
+        notebook.add(people, text="Per person")
+        self.rate_tree = self.make_tree(people, [("name", "Name", 140), ("days", "Days", 60), ("rate", "Rate", 70),
+                                                 ("first", "First", 100), ("last", "Last", 100)])
+        self.status = tk.Label(self, anchor='w')
+        self.status.pack(fill='x', padx=5)
+
+    def make_tree(self, parent, columns, sortable=False, on_scroll=None):
+        scrollbar = ttk.Scrollbar(parent, orient='vertical')
+        scrollbar.pack(side='right', fill='y')
+
+        def yscroll(first, last):
+            scrollbar.set(first, last)
+            if on_scroll:
+                on_scroll(float(last))
+
+        tree = ttk.Treeview(parent, columns=[c for c, _, _ in columns], show="headings", yscrollcommand=yscroll)
+        tree.pack(expand=True, fill='both')
+        scrollbar.config(command=tree.yview)
+        for column, heading, width in columns:
+            command = (lambda c=column: self.sort_by(c)) if sortable else ""
+            tree.heading(column, text=heading, command=command)
+            tree.column(column, width=width)
+        return tree
+
+    def read_filters(self):
+        return {"start_date": self.start_entry.get().strip() or None,
+                "end_date": self.end_entry.get().strip() or None,
+                "name": self.name_box.get().strip() or None}
+
+    def apply_filters(self):
+        self.filters = self.read_filters()
+        self.aggregates_stale = True
+        try:
+            self.total = self.store.count(**self.filters)
+            self.reload()
+            self.refresh_aggregates()
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not load attendance history: {e}", parent=self)
+
+    def refresh_aggregates(self):
+        """Fill the aggregate tab being shown; they are only queried when looked at."""
+        tab = self.notebook.index("current")
+        if tab == 0 or not self.aggregates_stale:
+            return
+        self.aggregates_stale = False
+        self.daily_tree.delete(*self.daily_tree.get_children())
+        for date, count in self.store.daily_counts(**self.filters):
+            self.daily_tree.insert("", "end", values=(date, count))
+        self.rate_tree.delete(*self.rate_tree.get_children())
+        for name, days, rate, first, last in self.store.attendance_rates(**self.filters):
+            self.rate_tree.insert("", "end", values=(name, days, f"{rate:.0%}", first, last))
+
+    def sort_by(self, column):
+        if self.sort == column:
+            self.descending = not self.descending
+        else:
+            self.sort, self.descending = column, False
+        self.reload()
+
+    def reload(self):
+        self.tree.delete(*self.tree.get_children())
+        self.last_key = None
+        self.exhausted = False
+        self.loaded = 0
+        for column in ("name", "timestamp"):
+            arrow = (" ▼" if self.descending else " ▲") if column == self.sort else ""
+            self.tree.heading(column, text=column.capitalize() + arrow)
+        self.load_page()
+        # Fill the visible area even if the first page is shorter than the window
+        self.after_idle(lambda: self.on_scroll(self.tree.yview()[1]))
+
+    def load_page(self):
+        if self.exhausted:
+            return
+        rows = self.store.page(PAGE_SIZE, self.last_key, self.sort, self.descending, **self.filters)
+        for name, timestamp, _ in rows:
+            self.tree.insert("", "end", values=(name, timestamp))
+        self.loaded += len(rows)
+        if rows:
+            self.last_key = rows[-1][2]
+        self.exhausted = len(rows) < PAGE_SIZE
+        if self.total == 0:
+            self.status.config(text="No attendance records match these filters.")
+        else:
+            self.status.config(text=f"Showing {self.loaded} of {self.total} records")
+
+    def on_scroll(self, last):
+        if last >= PREFETCH_AT and not self.exhausted:
+            self.load_page()
+
+    def on_close(self):
+        if self.own_store:
+            self.store.close()
+        self.destroy()
@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from attendance_store import ATTENDANCE_DB, open_store
+
+SYNC_HOST = "127.0.0.1"  # the server has no authentication; --host 0.0.0.0 opens it to the network
+SYNC_PORT = 8766
+SYNC_INTERVAL = 30.0  # seconds between sync rounds in --interval mode
+PULL_BATCH = 5000  # changes per HTTP response
+DELTA_EXTENSION = ".jsonl"
+
+
+def _delta_range(filename):
+    """'000000000001-000000000250.jsonl' -> (1, 250), or None for other files."""
+    stem, ext = os.path.splitext(filename)
+    first, _, last = stem.partition("-")
+    if ext != DELTA_EXTENSION or not (first.isdigit() and last.isdigit()):
+        return None
+    return int(first), int(last)
+
+
+class DirectorySync:
+    """Exchanges change-log deltas through a folder every kiosk can reach (a network share).
+
+    Each node only ever writes its own changes, as new numbered files in
+    ``<shared_dir>/<node_id>/``, and reads the files of every other node
+    that go past the head it already holds for that node. Files are never
+    rewritten, so nodes need no locking and a half-copied share only delays
+    the missing changes to the next round.
+    """
+
+    def __init__(self, shared_dir):
+        self.shared_dir = shared_dir
+
+    def push(self, store):
+        """Write this node's changes that are not on the share yet; returns how many were written."""
+        own_dir = os.path.join(self.shared_dir, store.node_id)
+        os.makedirs(own_dir, exist_ok=True)
+        ranges = [r for r in map(_delta_range, os.listdir(own_dir)) if r]
+        published = max((last for _, last in ranges), default=0)
+        changes = store.changes_since({store.node_id: published}, origins=[store.node_id])
+        if not changes:
+            return 0
+        path = os.path.join(own_dir, f"{changes[0][1]:012d}-{changes[-1][1]:012d}{DELTA_EXTENSION}")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for change in changes:
+                f.write(json.dumps(change) + "\n")
+        os.replace(tmp_path, path)
+        return len(changes)
+
+    def pull(self, store):
+        """Apply other nodes' new delta files; returns (changes applied, marks added or moved earlier)."""
+        if not os.path.isdir(self.shared_dir):
+            return 0, 0
+        heads = store.change_heads()
+        applied = updated = 0
+        for origin in sorted(os.listdir(self.shared_dir)):
+            origin_dir = os.path.join(self.shared_dir, origin)
+            if origin == store.node_id or not os.path.isdir(origin_dir):
+                continue
+            head = heads.get(origin, 0)
+            files = sorted((r, name) for name in os.listdir(origin_dir) if (r := _delta_range(name)))
+            for (_, last), name in files:
+                if last <= head:
+                    continue
+                with open(os.path.join(origin_dir, name)) as f:
+                    changes = [json.loads(line) for line in f if line.strip()]
+                a, u = store.apply_changes(changes)
+                applied += a
+                updated += u
+                head = max(head, last) if a else head
+        return applied, updated
+
+
+class HttpSync:
+    """Pulls changes from a peer kiosk's sync server (see start_sync_server).
+
+    The peer sends every change it holds past our heads, including those it
+    got from other nodes, so kiosks that can only reach one neighbour still
+    converge.
+    """
+
+    def __init__(self, url, batch=PULL_BATCH, timeout=10.0):
+        self.url = url.rstrip("/")
+        self.batch = batch
+        self.timeout = timeout
+
+    def push(self, store):
+        return 0  # peers pull from our server
+
+    def pull(self, store):
+        applied = updated = 0
+        while True:
+            payload = json.dumps({"heads": store.change_heads(), "limit": self.batch}).encode()
+            request = urllib.request.Request(self.url + "/sync/pull", data=payload,
+                                             headers={"Content-Type": "application/json"})
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = json.loads(response.read())
+            a, u = store.apply_changes(body["changes"])
+            applied += a
+            updated += u
+            if not body["more"] or not a:
+                return applied, updated
+
+
+class SyncHandler(BaseHTTPRequestHandler):
+    store = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload, code=200):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/sync/heads":
+            self._send({"node": self.store.node_id, "heads": self.store.change_heads()})
+        else:
+            self._send({"error": "not found"}, 404)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/sync/pull":
+            self._send({"error": "not found"}, 404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        limit = min(int(request.get("limit") or PULL_BATCH), PULL_BATCH)
+        changes = self.store.changes_since(request.get("heads") or {}, limit + 1)
+        self._send({"node": self.store.node_id, "changes": changes[:limit], "more": len(changes) > limit})
+
+
+def start_sync_server(store, port=SYNC_PORT, host=SYNC_HOST):
+    """Serve GET /sync/heads and POST /sync/pull for ``store`` on a daemon thread."""
+    handler = type("Handler", (SyncHandler,), {"store": store})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def sync_once(store, transports):
+    """Push local changes, then pull from every transport; returns a stats dict."""
+    stats = {"pushed": 0, "applied": 0, "updated": 0}
+    for transport in transports:
+        stats["pushed"] += transport.push(store)
+    for transport in transports:
+        applied, updated = transport.pull(store)
+        stats["applied"] += applied
+        stats["updated"] += updated
+    return stats
+
+
+def attendance_snapshot(store):
+    """{(date, name): timestamp} of a store, for comparing nodes."""
+    return {(timestamp[:10], name): timestamp for name, timestamp in store.rows()}
+
+
+def simulate(nodes=4, marks_per_node=3000, rounds=5, people=400, days=5, transport="dir", seed=0):
+    """Run several kiosks against temporary databases and check that they converge.
+
+    Every round each node records a share of its random marks (many of them
+    for the same person and day as other nodes), then all nodes sync. At
+    the end every database must hold exactly the earliest mark per person
+    per day, and one more round must move nothing. Returns a dict with the
+    per-round stats and the results of those checks.
+    """
+    rng = random.Random(seed)
+    workdir = tempfile.mkdtemp(prefix="kiosk_sync_")
+    start = datetime(2024, 3, 4, 8, 0, 0)
+    stores, servers, log = [], [], []
+    try:
+        for i in range(nodes):
+            os.makedirs(os.path.join(workdir, f"node{i}"))
+            stores.append(open_store(os.path.join(workdir, f"node{i}", ATTENDANCE_DB), csv_path=os.devnull,
+                                     node_id=f"node{i}"))
+        if transport == "dir":
+            shared = DirectorySync(os.path.join(workdir, "shared"))
+            transports = [[shared] for _ in stores]
+        else:
+            servers = [start_sync_server(store, port=0, host="127.0.0.1") for store in stores]
+            urls = [f"http://127.0.0.1:{server.server_address[1]}" for server in servers]
+            # A ring: each node only talks to its neighbour, changes travel around
+            transports = [[HttpSync(urls[(i + 1) % nodes])] for i in range(nodes)]
+
+        planned = [[(f"person{rng.randrange(people)}",
+                     (start + timedelta(days=rng.randrange(days), seconds=rng.randrange(4 * 3600)))
+                     .strftime('%Y-%m-%d %H:%M:%S')) for _ in range(marks_per_node)] for _ in stores]
+        expected = {}
+        for marks in planned:
+            for name, timestamp in marks:
+                key = (timestamp[:10], name)
+                if key not in expected or timestamp < expected[key]:
+                    expected[key] = timestamp
+
+        per_round = -(-marks_per_node // rounds)
+        # Extra rounds without new marks let a ring carry the last changes all the way around
+        extra = 1 if transport == "dir" else nodes
+        for r in range(rounds + extra):
+            marked = sum(store.mark_many(marks[r * per_round:(r + 1) * per_round])
+                         for store, marks in zip(stores, planned))
+            started = time.perf_counter()
+            totals = {"pushed": 0, "applied": 0, "updated": 0}
+            for store, node_transports in zip(stores, transports):
+                for key, value in sync_once(store, node_transports).items():
+                    totals[key] += value
+            log.append({"round": r + 1, "new_local_changes": marked, **totals,
+                        "sync_ms": (time.perf_counter() - started) * 1000})
+
+        snapshots = [attendance_snapshot(store) for store in stores]
+        converged = all(snapshot == expected for snapshot in snapshots)
+        final = {"pushed": 0, "applied": 0, "updated": 0}
+        for store, node_transports in zip(stores, transports):
+            for key, value in sync_once(store, node_transports).items():
+                final[key] += value
+        # Replaying everything a node already has must change nothing
+        replay = stores[0].apply_changes(stores[1].changes_since({}))
+        return {"rounds": log, "converged": converged, "expected_marks": len(expected),
+                "idle_round": final, "replay": replay,
+                "log_sizes": [sum(store.change_heads().values()) for store in stores]}
+    finally:
+        for server in servers:
+            server.shutdown()
+        for store in stores:
+            store.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_simulation(result):
+    print(f"{'round':>5} {'new local':>10} {'pushed':>8} {'applied':>8} {'updated':>8} {'sync ms':>8}")
+    for row in result["rounds"]:
+        print(f"{row['round']:>5} {row['new_local_changes']:>10} {row['pushed']:>8} {row['applied']:>8} "
+              f"{row['updated']:>8} {row['sync_ms']:>8.1f}")
+    idle = result["idle_round"]
+    print(f"Converged on {result['expected_marks']} earliest marks: {'yes' if result['converged'] else 'NO'} | "
+          f"idle round pushed {idle['pushed']}, applied {idle['applied']} | "
+          f"replay applied {result['replay'][0]} | log sizes {result['log_sizes']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Share attendance marks between kiosks.")
+    parser.add_argument("--db", default=ATTENDANCE_DB)
+    parser.add_argument("--dir", help="shared folder to exchange deltas through")
+    parser.add_argument("--peer", action="append", default=[], help="URL of another kiosk's sync server")
+    parser.add_argument("--serve", action="store_true", help="run a sync server for peers to pull from")
+    parser.add_argument("--host", default=SYNC_HOST,
+                        help="address --serve binds to; peers on other machines need e.g. 0.0.0.0 "
+                             "(unauthenticated: use only on a trusted network)")
+    parser.add_argument("--port", type=int, default=SYNC_PORT)
+    parser.add_argument("--interval", type=float, default=None,
+                        help=f"keep syncing every N seconds (e.g. {SYNC_INTERVAL:g}) instead of once")
+    parser.add_argument("--simulate", action="store_true", help="run a multi-node simulation and exit")
+    parser.add_argument("--nodes", type=int, default=4)
+    parser.add_argument("--marks", type=int, default=3000, help="marks per node in the simulation")
+    parser.add_argument("--transport", choices=["dir", "http"], default="dir")
+    args = parser.parse_args()
+
+    if args.simulate:
+        result = simulate(args.nodes, args.marks, transport=args.transport)
+        print_simulation(result)
+        raise SystemExit(0 if result["converged"] else 1)
+
+    store = open_store(args.db, synchronous="FULL")
+    transports = ([DirectorySync(args.dir)] if args.dir else []) + [HttpSync(url) for url in args.peer]
+    if args.serve:
+        start_sync_server(store, args.port, args.host)
+        print(f"Sync server for node {store.node_id} on {args.host}:{args.port}")
+    try:
+        while True:
+            try:
+                stats = sync_once(store, transports)
+                print(f"[sync] {datetime.now():%H:%M:%S} node {store.node_id}: pushed {stats['pushed']}, "
+                      f"applied {stats['applied']}, marks added or moved earlier {stats['updated']}")
+            except OSError as e:
+                print(f"[sync] failed: {e}")
+            if args.interval is None and not args.serve:
+                break
+            time.sleep(args.interval or SYNC_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
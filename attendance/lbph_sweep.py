@@ -0,0 +1,260 @@
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from face_cache import CACHE_DIR, FaceCache
+from gallery_matcher import LBPH_DEFAULTS, RECOGNIZER_CONFIG, create_lbph
+from pipeline import CONFIDENCE_THRESHOLD
+
+SWEEP_REPORT = "lbph_sweep.json"
+FOLDS = 5
+MAX_FALSE_ACCEPT = 0.01  # share of probes that may be marked as the wrong person
+RADII = (1, 2, 3)
+NEIGHBORS = (4, 8)  # 16 would make every histogram cell 65536 bins long
+GRIDS = (4, 6, 8, 10)  # grid_x = grid_y; the histogram length grows with its square
+
+# Per-process face cache, loaded once by _init_worker
+_worker = {}
+
+
+def parameter_grid(radii=RADII, neighbors=NEIGHBORS, grids=GRIDS):
+    """Every combination as a dict of LBPHFaceRecognizer_create arguments."""
+    return [{"radius": r, "neighbors": n, "grid_x": g, "grid_y": g}
+            for r, n, g in itertools.product(radii, neighbors, grids)]
+
+
+def fold_split(labels, folds, fold):
+    """Return (train_rows, known_rows, impostor_rows) for one cross-validation fold.
+
+    Every ``folds``-th person is left out of training entirely and all their
+    images probe for false accepts (as long as two people remain to train
+    on). Of the others, every ``folds``-th image is held out as a probe that
+    should be recognized. Each image is a probe in exactly one fold.
+    """
+    labels = np.asarray(labels)
+    people = np.unique(labels)
+    left_out = people[fold::folds] if len(people) - len(people[fold::folds]) >= 2 else people[:0]
+    impostors = np.isin(labels, left_out)
+    held_out = np.zeros(len(labels), dtype=bool)
+    for label in people:
+        rows = np.flatnonzero(labels == label)
+        held_out[rows[fold::folds]] = True
+    known = held_out & ~impostors
+    return np.flatnonzero(~held_out & ~impostors), np.flatnonzero(known), np.flatnonzero(impostors)
+
+
+def _init_worker(cache_dir):
+    # One OpenCV thread per process; the pool already uses every core
+    cv2.setNumThreads(1)
+    faces, labels, _ = FaceCache(cache_dir).load()
+    _worker["faces"], _worker["labels"] = faces, labels
+
+
+def evaluate_fold(params, folds, fold):
+    """Train on one fold's training rows and predict its probes (runs in a worker process).
+
+    Returns (true labels, predicted labels, distances, seconds per predict,
+    histogram floats per face); impostor probes have the true label -1.
+    """
+    faces, labels = _worker["faces"], _worker["labels"]
+    train_rows, known_rows, impostor_rows = fold_split(labels, folds, fold)
+    recognizer = create_lbph(params)
+    recognizer.train([faces[i] for i in train_rows], labels[train_rows])
+    probes = np.concatenate([known_rows, impostor_rows])
+    predicted = np.empty(len(probes), dtype=np.int64)
+    distances = np.empty(len(probes), dtype=np.float64)
+    start = time.perf_counter()
+    for k, row in enumerate(probes):
+        predicted[k], distances[k] = recognizer.predict(faces[row])
+    elapsed = time.perf_counter() - start
+    truth = np.concatenate([labels[known_rows], np.full(len(impostor_rows), -1)])
+    return truth, predicted, distances, elapsed / max(len(probes), 1), int(recognizer.getHistograms()[0].size)
+
+
+def _run_fold(task):
+    index, params, folds, fold = task
+    return index, evaluate_fold(params, folds, fold)
+
+
+def rates_at(truth, predicted, distances, threshold):
+    """(accuracy, false-accept rate) when faces closer than ``threshold`` are accepted.
+
+    Accuracy is the share of enrolled people's probes accepted as the right
+    person; false accepts are probes accepted as anybody else. ``threshold``
+    may also be an array with one threshold per probe.
+    """
+    accepted = distances < threshold
+    known = truth >= 0
+    correct = accepted & (predicted == truth)
+    return (float(correct[known].sum() / max(known.sum(), 1)),
+            float((accepted & (predicted != truth)).sum() / max(len(truth), 1)))
+
+
+def choose_threshold(truth, predicted, distances, max_false_accept=MAX_FALSE_ACCEPT):
+    """Largest threshold whose false-accept rate stays within ``max_false_accept``.
+
+    Accuracy only grows with the threshold, so the largest allowed one is
+    the most accurate. It is placed halfway to the next probe distance.
+    """
+    order = np.argsort(distances, kind="stable")
+    wrong = np.cumsum(predicted[order] != truth[order]) / max(len(truth), 1)
+    sorted_distances = distances[order]
+    # Equal distances are accepted or rejected together, so only the last of a run counts
+    last_of_run = np.append(sorted_distances[1:] != sorted_distances[:-1], True)
+    allowed = np.flatnonzero((wrong <= max_false_accept) & last_of_run)
+    if len(allowed) == 0:
+        return float(sorted_distances[0]) if len(sorted_distances) else 0.0
+    i = allowed[-1]
+    upper = sorted_distances[i + 1] if i + 1 < len(sorted_distances) else sorted_distances[i] + 1.0
+    return round(float(sorted_distances[i] + upper) / 2, 2)
+
+
+def out_of_fold_rates(fold_results, max_false_accept=MAX_FALSE_ACCEPT):
+    """(accuracy, false-accept rate) with each fold judged by a threshold chosen on the other folds.
+
+    Choosing the threshold on the probes it is scored on would overstate
+    accuracy and understate false accepts.
+    """
+    thresholds = []
+    for fold, result in enumerate(fold_results):
+        others = [r for k, r in enumerate(fold_results) if k != fold]
+        threshold = choose_threshold(*(np.concatenate([r[k] for r in others]) for k in range(3)),
+                                     max_false_accept) if others else 0.0
+        thresholds.append(np.full(len(result[0]), threshold))
+    truth, predicted, distances = (np.concatenate([r[k] for r in fold_results]) for k in range(3))
+    return rates_at(truth, predicted, distances, np.concatenate(thresholds))
+
+
+def pareto_front(rows, objectives=(("accuracy", 1), ("false_accept_rate", -1), ("ms_per_predict", -1))):
+    """Indexes of the rows no other row beats on every objective (1 = higher is better)."""
+    front = []
+    for i, row in enumerate(rows):
+        dominated = False
+        for other in rows:
+            no_worse = all(sign * other[key] >= sign * row[key] for key, sign in objectives)
+            better = any(sign * other[key] > sign * row[key] for key, sign in objectives)
+            if no_worse and better:
+                dominated = True
+                break
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def sweep(grid, labels, folds=FOLDS, workers=None, max_false_accept=MAX_FALSE_ACCEPT, cache_dir=CACHE_DIR,
+          progress=None):
+    """Cross-validate every parameter set in ``grid`` over the cached faces in a process pool.
+
+    Returns one row per parameter set with its threshold (chosen on every
+    probe), out-of-fold accuracy and false-accept rate, per-predict latency
+    and model size for the whole dataset, plus the indexes of the
+    Pareto-optimal rows.
+    """
+    labels = np.asarray(labels)
+    tasks = [(index, params, folds, fold) for index, params in enumerate(grid) for fold in range(folds)]
+    results = [[] for _ in grid]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cache_dir,)) as pool:
+        for done, (index, result) in enumerate(pool.map(_run_fold, tasks), 1):
+            results[index].append(result)
+            if progress:
+                progress(done, len(tasks))
+
+    rows = []
+    for params, fold_results in zip(grid, results):
+        truth, predicted, distances = (np.concatenate([r[k] for r in fold_results]) for k in range(3))
+        threshold = choose_threshold(truth, predicted, distances, max_false_accept)
+        accuracy, false_accept = out_of_fold_rates(fold_results, max_false_accept)
+        histogram_size = fold_results[0][4]
+        row = {**params, "threshold": threshold, "accuracy": accuracy, "false_accept_rate": false_accept,
+               "ms_per_predict": float(np.mean([r[3] for r in fold_results])) * 1000,
+               "model_mb": histogram_size * 4 * len(labels) / (1024 * 1024),
+               "probes": int(len(truth))}
+        if params == LBPH_DEFAULTS:
+            # What the recognition loops do without a configuration
+            accuracy, false_accept = rates_at(truth, predicted, distances, CONFIDENCE_THRESHOLD)
+            row["at_default_threshold"] = {"accuracy": accuracy, "false_accept_rate": false_accept}
+        rows.append(row)
+    return rows, pareto_front(rows)
+
+
+def pick(rows, front, max_ms=None):
+    """The most accurate Pareto setting (fastest on ties) within ``max_ms`` per predict."""
+    candidates = [rows[i] for i in front if max_ms is None or rows[i]["ms_per_predict"] <= max_ms]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda row: (row["accuracy"], -row["false_accept_rate"], -row["ms_per_predict"]))
+
+
+def save_config(row, path=RECOGNIZER_CONFIG):
+    """Write the chosen parameters and threshold for training and the recognition loops."""
+    config = {key: row[key] for key in (*LBPH_DEFAULTS, "threshold")}
+    # Out-of-fold figures recorded for reference; only the parameters and threshold are read back
+    config.update({key: round(row[key], 4) for key in ("accuracy", "false_accept_rate", "ms_per_predict")})
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(config, f, indent=1)
+    os.replace(tmp_path, path)
+    return config
+
+
+def print_report(rows, front, max_false_accept):
+    print(f"{'':1} {'radius':>6} {'nbrs':>4} {'grid':>5} {'threshold':>9} {'accuracy':>8} {'false acc':>9} "
+          f"{'ms/predict':>10} {'model MB':>8}")
+    for i, row in sorted(enumerate(rows), key=lambda item: item[1]["ms_per_predict"]):
+        print(f"{'*' if i in front else ' ':1} {row['radius']:>6} {row['neighbors']:>4} "
+              f"{row['grid_x']:>2}x{row['grid_y']:<2} {row['threshold']:>9.1f} {row['accuracy']:>8.3f} "
+              f"{row['false_accept_rate']:>9.3f} {row['ms_per_predict']:>10.2f} {row['model_mb']:>8.1f}")
+    print(f"* Pareto-optimal (accuracy, false accepts, latency). Thresholds allow at most "
+          f"{max_false_accept:.1%} false accepts.")
+    for row in rows:
+        if "at_default_threshold" in row:
+            current = row["at_default_threshold"]
+            print(f"Without a configuration (defaults, threshold {CONFIDENCE_THRESHOLD}): accuracy "
+                  f"{current['accuracy']:.3f}, false accepts {current['false_accept_rate']:.3f}.")
+
+
+if __name__ == "__main__":
+    from train_recognizer import DATASET_DIR, get_images_and_labels
+
+    parser = argparse.ArgumentParser(description="Cross-validate LBPH parameters and accept thresholds.")
+    parser.add_argument("--folds", type=int, default=FOLDS)
+    parser.add_argument("--radius", type=int, nargs="+", default=list(RADII))
+    parser.add_argument("--neighbors", type=int, nargs="+", default=list(NEIGHBORS))
+    parser.add_argument("--grid", type=int, nargs="+", default=list(GRIDS), help="grid_x = grid_y values")
+    parser.add_argument("--max-false-accept", type=float, default=MAX_FALSE_ACCEPT,
+                        help="largest share of probes a threshold may accept as the wrong person")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--output", default=SWEEP_REPORT, help="JSON report of every configuration")
+    parser.add_argument("--apply", action="store_true",
+                        help=f"write the most accurate Pareto setting to {RECOGNIZER_CONFIG}")
+    parser.add_argument("--max-ms", type=float, default=None, help="with --apply, slowest predict allowed")
+    args = parser.parse_args()
+
+    # Brings the face cache up to date; the workers then map it read-only
+    faces, labels, _ = get_images_and_labels(DATASET_DIR, args.workers)
+    if len(set(labels)) < 2:
+        raise SystemExit("Need images of at least two people to evaluate.")
+    grid = parameter_grid(args.radius, args.neighbors, args.grid)
+    print(f"Evaluating {len(grid)} configurations with {args.folds}-fold cross-validation "
+          f"on {len(faces)} images of {len(set(labels))} people.")
+    started = time.perf_counter()
+    rows, front = sweep(grid, labels, args.folds, args.workers, args.max_false_accept,
+                        progress=lambda done, total: print(f"\r{done}/{total} folds", end="", flush=True))
+    print(f"\rDone in {time.perf_counter() - started:.1f} s.")
+    print_report(rows, front, args.max_false_accept)
+    with open(args.output, "w") as f:
+        json.dump({"folds": args.folds, "max_false_accept": args.max_false_accept, "images": len(faces),
+                   "rows": rows, "pareto": front}, f, indent=1)
+    print(f"Report saved to {args.output}")
+    if args.apply:
+        choice = pick(rows, front, args.max_ms)
+        if choice is None:
+            raise SystemExit("No Pareto setting is fast enough; raise --max-ms.")
+        config = save_config(choice)
+        print(f"Saved {config} to {RECOGNIZER_CONFIG}. Run train_recognizer.py to retrain with it.")
@@ -0,0 +1,297 @@
+import json
+import sys
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# Upper bounds of the LBPH confidence (distance) histogram buckets
+CONFIDENCE_BUCKETS = (10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 125, 150)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+
+class StageTimer:
+    """Count, total and max of a stage's durations plus a rolling window for percentiles."""
+
+    def __init__(self, window=512):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def append(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+            self.recent.append(seconds)
+
+    def quantiles(self, *qs):
+        with self._lock:
+            recent = sorted(self.recent)
+        if not recent:
+            return [0.0] * len(qs)
+        return [recent[min(len(recent) - 1, int(q * len(recent)))] for q in qs]
+
+
+class Metrics:
+    """Stage timers, counters, gauges and a confidence histogram for one recognition loop.
+
+    It can be passed wherever the pipeline functions take ``timings``:
+    ``record_time`` hands each duration to ``record`` instead of appending to
+    a list as it does for the benchmark's dict. Code that is not given a
+    Metrics (``timings=None``) skips all of this, so disabled metrics cost one
+    ``is None`` check per stage.
+    """
+
+    def __init__(self, window=512):
+        self.window = window
+        self.stages = {}  # stage name -> StageTimer
+        self.counters = Counter()
+        self.gauges = {}
+        self.histogram = [0] * (len(CONFIDENCE_BUCKETS) + 1)
+        self.confidence_sum = 0.0
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._last_summary = (time.perf_counter(), Counter())
+
+    def record(self, stage, seconds):
+        """Add one duration of ``stage`` to its timer."""
+        timer = self.stages.get(stage)
+        if timer is None:
+            with self._lock:
+                timer = self.stages.setdefault(stage, StageTimer(self.window))
+        timer.append(seconds)
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def add_gauge(self, name, read):
+        """Register ``read()`` to be called for the current value at report time."""
+        self.gauges[name] = read
+
+    def observe_predictions(self, results):
+        """Count recognizer results (``(name, confidence)`` or None) into the histogram."""
+        with self._lock:
+            for result in results:
+                if result is None:
+                    self.counters["prediction_errors"] += 1
+                    continue
+                name, confidence = result
+                self.counters["predictions"] += 1
+                if name == "Unknown":
+                    self.counters["unknowns"] += 1
+                self.confidence_sum += confidence
+                for i, bound in enumerate(CONFIDENCE_BUCKETS):
+                    if confidence <= bound:
+                        self.histogram[i] += 1
+                        break
+                else:
+                    self.histogram[-1] += 1
+
+    def read_gauges(self):
+        values = {}
+        for name, read in list(self.gauges.items()):
+            try:
+                values[name] = read()
+            except Exception:
+                values[name] = None
+        return values
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self.counters)
+            histogram = list(self.histogram)
+            confidence_sum = self.confidence_sum
+            stages = list(self.stages.items())
+        stage_stats = {}
+        for stage, timer in stages:
+            p50, p95 = timer.quantiles(0.5, 0.95)
+            stage_stats[stage] = {"count": timer.count, "total_s": timer.total, "max_ms": timer.max * 1000,
+                                  "p50_ms": p50 * 1000, "p95_ms": p95 * 1000}
+        return {
+            "uptime_s": time.time() - self.started,
+            "counters": counters,
+            "gauges": self.read_gauges(),
+            "stages": stage_stats,
+            "confidence": {"buckets": list(CONFIDENCE_BUCKETS), "counts": histogram, "sum": confidence_sum},
+        }
+
+    def format_summary(self):
+        """Rolling summary for the log: counts since the last call and recent stage latencies."""
+        now = time.perf_counter()
+        with self._lock:
+            counters = Counter(self.counters)
+            stages = list(self.stages.items())
+        last_time, last_counters = self._last_summary
+        self._last_summary = (now, counters)
+        elapsed = max(now - last_time, 1e-9)
+        delta = counters - last_counters
+        gauges = self.read_gauges()
+        text = (f"[metrics] frames in {delta['frames_in'] / elapsed:.1f}/s | faces {delta['faces_detected']} | "
+                f"predictions {delta['predictions']} (unknown {delta['unknowns']})")
+        for name, value in gauges.items():
+            if value is not None:
+                text += f" | {name} {value}"
+        latencies = []
+        for stage, timer in stages:
+            p50, p95 = timer.quantiles(0.5, 0.95)
+            latencies.append(f"{stage} {p50 * 1000:.1f}/{p95 * 1000:.1f}")
+        if latencies:
+            text += "\n[metrics] p50/p95 ms: " + ", ".join(latencies)
+        return text
+
+    def prometheus(self, prefix="attendance"):
+        """Prometheus text exposition format."""
+        s = self.snapshot()
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        for stage, st in s["stages"].items():
+            label = f'stage="{stage}"'
+            lines.append(f'{prefix}_stage_seconds{{{label},quantile="0.5"}} {st["p50_ms"] / 1000:.6f}')
+            lines.append(f'{prefix}_stage_seconds{{{label},quantile="0.95"}} {st["p95_ms"] / 1000:.6f}')
+            lines.append(f"{prefix}_stage_seconds_sum{{{label}}} {st['total_s']:.6f}")
+            lines.append(f"{prefix}_stage_seconds_count{{{label}}} {st['count']}")
+        for name, value in sorted(s["counters"].items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        for name, value in sorted(s["gauges"].items()):
+            if isinstance(value, (int, float)):
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value}")
+        lines.append(f"# TYPE {prefix}_confidence histogram")
+        cumulative = 0
+        for bound, count in zip(list(CONFIDENCE_BUCKETS) + ["+Inf"], s["confidence"]["counts"]):
+            cumulative += count
+            lines.append(f'{prefix}_confidence_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{prefix}_confidence_sum {s['confidence']['sum']:.3f}")
+        lines.append(f"{prefix}_confidence_count {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Statistical profiler that can be switched on and off while the app runs.
+
+    A background thread looks at every other thread's current Python frame
+    each ``interval`` seconds and counts the innermost functions and the
+    stacks they were called from. Nothing is installed in the profiled code,
+    so it costs nothing while stopped.
+    """
+
+    def __init__(self, interval=0.005, depth=6):
+        self.interval = interval
+        self.depth = depth
+        self.functions = Counter()
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return False
+        self.functions.clear()
+        self.stacks.clear()
+        self.samples = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Stop sampling; returns the report text."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return self.format_report()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                self.functions[stack[0]] += 1
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def format_report(self, top=15):
+        if not self.samples:
+            return "[profiler] no samples"
+        total = sum(self.functions.values())
+        lines = [f"[profiler] {self.samples} samples every {self.interval * 1000:.0f} ms; top functions:"]
+        for location, count in self.functions.most_common(top):
+            lines.append(f"  {count / total:6.1%}  {location}")
+        return "\n".join(lines)
+
+
+def metrics_response(path, metrics):
+    """Body for a GET of /metrics or /metrics.json as (content type, text), or None for other paths."""
+    if path == "/metrics":
+        return "text/plain; version=0.0.4", metrics.prometheus()
+    if path == "/metrics.json":
+        return "application/json", json.dumps(metrics.snapshot())
+    return None
+
+
+def profiler_response(path, profiler):
+    """Handle a POST to /profile/start or /profile/stop; returns a JSON-able dict or None."""
+    if path == "/profile/start":
+        return {"started": profiler.start()}
+    if path == "/profile/stop":
+        return {"report": profiler.stop()}
+    return None
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    metrics = None
+    profiler = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, content_type, text):
+        body = text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        response = metrics_response(urlparse(self.path).path, self.metrics)
+        if response is None:
+            self.send_error(404)
+        else:
+            self._send(*response)
+
+    def do_POST(self):
+        response = None
+        if self.profiler is not None:
+            response = profiler_response(urlparse(self.path).path, self.profiler)
+        if response is None:
+            self.send_error(404)
+        else:
+            self._send("application/json", json.dumps(response))
+
+
+def start_metrics_server(metrics, port=METRICS_PORT, host=METRICS_HOST, profiler=None):
+    """Serve GET /metrics (Prometheus), GET /metrics.json and POST /profile/start|stop on a daemon thread."""
+    handler = type("Handler", (MetricsHandler,), {"metrics": metrics, "profiler": profiler})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
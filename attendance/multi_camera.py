@@ -0,0 +1,241 @@
+import argparse
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from adaptive_detector import AdaptiveDetector
+from attendance_store import AttendanceWriter, open_store
+from face_tracker import FaceTracker
+from frame_sources import Display, open_source
+from gallery_matcher import load_recognizer
+from governor import LoadGovernor
+from pipeline import (CONFIDENCE_THRESHOLD, DropOldestQueue, StageCounter, configured_threshold,
+                      draw_faces, gray_frame, track_and_recognize)
+from preprocess import FramePreprocessor
+
+CASCADE_PATH = "haarcascade_frontalface_default.xml"
+RECOGNIZER_PATH = "trainer.yml"
+RECOGNIZER_BACKEND = "lbph"
+LABELS_PATH = "labels.npy"
+
+
+def unique_names(names):
+    """Suffix repeated source names (two cameras' "clip.avi") with #2, #3... so their stats stay apart."""
+    unique = []
+    for name in names:
+        candidate, n = name, 1
+        while candidate in unique:
+            n += 1
+            candidate = f"{name} #{n}"
+        unique.append(candidate)
+    return unique
+
+
+class MultiSourceServer:
+    """Serves several frame sources from one process with a shared recognizer.
+
+    Each source has a capture thread that keeps only its newest frame. A shared
+    pool of detection workers takes frames from all sources round-robin, and a
+    single dispatch thread runs per-source tracking and recognition in frame
+    order and calls ``on_face(source_name, face)`` for every newly identified
+    face. Attendance is therefore deduplicated across all doors served here.
+    One ``governor`` (governor.LoadGovernor) sets the detection settings and
+    frame stride for every source, since they share the same CPU.
+    """
+
+    def __init__(self, sources, cascade_path, recognizer, label_dict, on_face, num_workers=None,
+                 threshold=CONFIDENCE_THRESHOLD, headless=True, report=None, report_interval=10.0,
+                 governor=None):
+        self.sources = [open_source(s, realtime=True) for s in sources]
+        self.names = unique_names([source.name for source in self.sources])
+        self.cascade_path = cascade_path
+        self.recognizer = recognizer
+        self.label_dict = label_dict
+        self.on_face = on_face
+        self.num_workers = num_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.threshold = threshold
+        self.display = Display(headless)
+        self.report = report
+        self.report_interval = report_interval
+        self.governor = governor
+
+        self.frame_queues = [DropOldestQueue(1) for _ in self.sources]
+        self.result_queue = queue.Queue(maxsize=4 * len(self.sources))
+        self.trackers = [FaceTracker() for _ in self.sources]
+        self.detectors = [AdaptiveDetector() for _ in self.sources]
+        self.counters = [StageCounter() for _ in self.sources]
+        self.finished = [threading.Event() for _ in self.sources]
+        self.predictions = 0
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(len(self.sources)):
+            self._threads.append(threading.Thread(target=self._capture_loop, args=(i,), daemon=True))
+        for _ in range(self.num_workers):
+            self._threads.append(threading.Thread(target=self._worker_loop, daemon=True))
+        for t in self._threads:
+            t.start()
+
+    def request_stop(self):
+        """Ask run() to return; safe to call from any thread."""
+        self._stop.set()
+
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=2.0)
+        for source in self.sources:
+            source.release()
+        self.display.close()
+
+    def _capture_loop(self, i):
+        seq = 0
+        while not self._stop.is_set():
+            ok, frame = self.sources[i].read()
+            if not ok:
+                break
+            seq += 1
+            if self.governor is not None and seq % self.governor.point.stride:
+                continue
+            self.frame_queues[i].put((seq, frame, time.perf_counter()))
+        self.finished[i].set()
+
+    def _next_frame(self, start):
+        """Take a frame from the first non-empty source queue, starting at ``start``."""
+        n = len(self.sources)
+        for k in range(n):
+            i = (start + k) % n
+            try:
+                return i, self.frame_queues[i].get(timeout=0)
+            except queue.Empty:
+                continue
+        return None, None
+
+    def _worker_loop(self):
+        face_cascade = cv2.CascadeClassifier(self.cascade_path)
+        preprocessor = FramePreprocessor()
+        turn = 0
+        while not self._stop.is_set():
+            i, item = self._next_frame(turn)
+            if item is None:
+                if all(e.is_set() for e in self.finished):
+                    break
+                time.sleep(0.005)
+                continue
+            turn = i + 1
+            seq, frame, captured = item
+            started = time.perf_counter()
+            point = self.governor.point if self.governor is not None else None
+            # Converted once here; the dispatch thread recognizes from the same gray frame
+            gray = gray_frame(frame, preprocessor, keep=True)
+            boxes = self.detectors[i].detect(gray, face_cascade, preprocessor=preprocessor, point=point)
+            busy = time.perf_counter() - started
+            try:
+                self.result_queue.put((i, seq, frame, gray, boxes, captured, busy), timeout=0.5)
+            except queue.Full:
+                pass
+
+    def run(self):
+        """Dispatch results until every source ends, the user quits or stop() is called."""
+        last_seq = [0] * len(self.sources)
+        last_report = time.perf_counter()
+        preprocessor = FramePreprocessor()
+        while not self._stop.is_set():
+            try:
+                i, seq, frame, gray, boxes, captured, busy = self.result_queue.get(timeout=0.1)
+            except queue.Empty:
+                if all(e.is_set() for e in self.finished) and not any(t.is_alive() for t in self._threads):
+                    break
+                continue
+            if seq <= last_seq[i]:
+                continue
+            last_seq[i] = seq
+            name = self.names[i]
+            start = time.perf_counter()
+            faces, calls = track_and_recognize(gray, boxes, self.trackers[i], self.recognizer,
+                                               self.label_dict, self.threshold, preprocessor=preprocessor)
+            self.predictions += calls
+            if self.governor is not None:
+                self.governor.observe(time.perf_counter() - captured, busy + time.perf_counter() - start)
+            self.counters[i].tick()
+            for face in faces:
+                if face.is_new:
+                    self.on_face(name, face)
+            if not self.display.headless:
+                draw_faces(frame, faces, status=self.governor.label() if self.governor is not None else None)
+                if not self.display.show(f"Attendance - {name}", frame):
+                    break
+            if self.report and time.perf_counter() - last_report >= self.report_interval:
+                last_report = time.perf_counter()
+                self.report(self.format_stats())
+
+    def format_stats(self):
+        fps = ", ".join(f"{name} {counter.fps():.1f}" for name, counter in zip(self.names, self.counters))
+        depth = sum(q.qsize() for q in self.frame_queues)
+        dropped = sum(q.dropped for q in self.frame_queues)
+        skipped = ", ".join(f"{name} {detector.summary()['full_skip_ratio']:.0%}"
+                            for name, detector in zip(self.names, self.detectors))
+        text = (f"[multi] fps: {fps} | queued frames {depth}, results {self.result_queue.qsize()} | "
+                f"dropped {dropped} | predictions {self.predictions} | full-scan avoided: {skipped}")
+        if self.governor is not None:
+            text += "\n" + self.governor.format_stats()
+        return text
+
+
+def serve(sources, headless=True, duration=None):
+    recognizer = load_recognizer(RECOGNIZER_BACKEND, RECOGNIZER_PATH)
+    if os.path.exists(LABELS_PATH):
+        label_dict = np.load(LABELS_PATH, allow_pickle=True).item()
+    else:
+        label_dict = {}
+    store = open_store(synchronous="FULL")
+    writer = AttendanceWriter(store)
+    marked = store.names_for_date(datetime.now().strftime('%Y-%m-%d'))
+
+    def on_face(source_name, face):
+        if face.name in marked:
+            return
+        dt_string = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        marked.add(face.name)
+        writer.submit(face.name, dt_string)
+        print(f"[{source_name}] Marked attendance for {face.name} at {dt_string}")
+
+    def report(message):
+        print(message)
+        print(writer.format_stats())
+
+    server = MultiSourceServer(sources, CASCADE_PATH, recognizer, label_dict, on_face,
+                               threshold=configured_threshold(recognizer), headless=headless, report=report,
+                               governor=LoadGovernor(report=print))
+    if duration:
+        timer = threading.Timer(duration, server.request_stop)
+        timer.daemon = True
+        timer.start()
+    server.start()
+    print(f"Serving {len(sources)} sources. Press Ctrl+C to stop.")
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        writer.close()
+        print(server.format_stats())
+        print(writer.format_stats())
+        store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recognize faces from several cameras in one process.")
+    parser.add_argument("sources", nargs="+",
+                        help="webcam indexes, video files, image directories or stream URLs")
+    parser.add_argument("--display", action="store_true", help="show a window per source")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    args = parser.parse_args()
+    serve(args.sources, headless=not args.display, duration=args.duration)
@@ -0,0 +1,469 @@
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import cv2
+
+from frame_sources import open_source
+from gallery_matcher import lbph_params, load_recognizer_config, model_params
+from preprocess import FramePreprocessor
+
+# Default recognition settings shared by the script and the GUI
+CONFIDENCE_THRESHOLD = 70  # used until lbph_sweep.py --apply chooses one for the trained parameters
+DETECT_SCALE = 0.5
+
+# Detection resolution, frame stride and cascade parameters a recognition loop
+# runs at; a LoadGovernor (governor.py) moves between these at runtime
+OperatingPoint = namedtuple("OperatingPoint", "scale stride scale_factor min_neighbors")
+DEFAULT_POINT = OperatingPoint(DETECT_SCALE, 1, 1.1, 4)
+
+
+class DropOldestQueue:
+    """Bounded queue that discards the oldest item instead of blocking the producer."""
+
+    def __init__(self, maxsize):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, item):
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        return self._queue.get(timeout=timeout)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+
+class StageCounter:
+    """Counts items through a stage and reports the rate since the last snapshot."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self._last_count = 0
+        self._last_time = time.perf_counter()
+
+    def tick(self, n=1):
+        with self._lock:
+            self.count += n
+
+    def fps(self):
+        with self._lock:
+            now = time.perf_counter()
+            elapsed = now - self._last_time
+            rate = (self.count - self._last_count) / elapsed if elapsed > 0 else 0.0
+            self._last_count = self.count
+            self._last_time = now
+            return rate
+
+
+# is_new is True when a caller should act on the identity (mark attendance).
+# Without a tracker that is every recognized face in every frame.
+Face = namedtuple("Face", "x y w h name confidence track_id is_new")
+
+
+def configured_threshold(recognizer=None):
+    """Accept threshold from recognizer_config.json, or CONFIDENCE_THRESHOLD.
+
+    LBPH distances depend on the radius, neighbors and grid, so a chosen
+    threshold only applies to a model trained with the same parameters.
+    When ``recognizer`` was trained with others, the default is used.
+    """
+    config = load_recognizer_config()
+    if "threshold" not in config:
+        return CONFIDENCE_THRESHOLD
+    trained = model_params(recognizer) if recognizer is not None else None
+    if trained is not None and trained != lbph_params(config):
+        print(f"Model parameters {trained} differ from recognizer_config.json; retrain to use its "
+              f"threshold. Using {CONFIDENCE_THRESHOLD}.")
+        return CONFIDENCE_THRESHOLD
+    return float(config["threshold"])
+
+
+def record_time(timings, stage, start):
+    """Record the time since ``start`` for ``stage`` when timing is enabled.
+
+    ``timings`` is a Metrics collector (see metrics.py), which gets it through
+    ``record``, or a plain dict of lists, as the benchmark uses.
+    """
+    if timings is None:
+        return
+    elapsed = time.perf_counter() - start
+    record = getattr(timings, "record", None)
+    if record is not None:
+        record(stage, elapsed)
+    else:
+        timings.setdefault(stage, []).append(elapsed)
+
+
+def record_predictions(timings, results):
+    """Hand recognizer results to a Metrics collector (see metrics.py) when one is attached."""
+    observe = getattr(timings, "observe_predictions", None)
+    if observe is not None:
+        observe(results)
+
+
+def gray_frame(frame, preprocessor, timings=None, keep=False):
+    """Convert a BGR frame to gray once; detection and recognition both take the result."""
+    if frame.ndim == 2:
+        return frame
+    start = time.perf_counter()
+    gray = preprocessor.gray(frame, keep)
+    record_time(timings, "cvtColor", start)
+    return gray
+
+
+def detect_faces(frame, face_cascade, timings=None, preprocessor=None, point=None):
+    """Detect faces in a BGR or gray frame, returning boxes in full-frame coordinates.
+
+    Pass the thread's FramePreprocessor to reuse its buffers, and an
+    OperatingPoint to override the detection scale and cascade parameters.
+    """
+    preprocessor = preprocessor or FramePreprocessor()
+    point = point or DEFAULT_POINT
+    gray = gray_frame(frame, preprocessor, timings)
+    start = time.perf_counter()
+    gray_small = preprocessor.downscale(gray, point.scale)
+    record_time(timings, "resize", start)
+    start = time.perf_counter()
+    faces = face_cascade.detectMultiScale(gray_small, scaleFactor=point.scale_factor,
+                                          minNeighbors=point.min_neighbors)
+    record_time(timings, "detectMultiScale", start)
+    # Scale face coordinates back to original frame size
+    return [tuple(int(v / point.scale) for v in box) for box in faces]
+
+
+def recognize_faces(frame, boxes, recognizer, label_dict, threshold=CONFIDENCE_THRESHOLD, timings=None,
+                    preprocessor=None):
+    """Return (name, confidence) for each face box, or None where prediction fails.
+
+    Faces are cropped from the gray frame and normalized exactly like the
+    training faces (see preprocess.py). Recognizers with ``predict_batch``
+    (see gallery_matcher) get all faces of the frame in one call.
+    """
+    preprocessor = preprocessor or FramePreprocessor()
+    gray = gray_frame(frame, preprocessor, timings)
+    start = time.perf_counter()
+    rois = preprocessor.faces(gray, boxes)
+    if boxes:
+        record_time(timings, "normalize", start)
+    start = time.perf_counter()
+    if hasattr(recognizer, "predict_batch"):
+        predictions = recognizer.predict_batch(rois)
+    else:
+        predictions = []
+        for roi_gray in rois:
+            try:
+                predictions.append(recognizer.predict(roi_gray))
+            except cv2.error:
+                predictions.append(None)
+    if boxes:
+        record_time(timings, "predict", start)
+    results = []
+    for prediction in predictions:
+        if prediction is None:
+            results.append(None)
+            continue
+        label, confidence = prediction
+        if confidence < threshold:
+            results.append((label_dict.get(label, "Unknown"), confidence))
+        else:
+            results.append(("Unknown", confidence))
+    record_predictions(timings, results)
+    return results
+
+
+def process_frame(frame, face_cascade, recognizer, label_dict, threshold=CONFIDENCE_THRESHOLD, timings=None,
+                  detector=None, preprocessor=None, point=None):
+    """Detect and recognize every face in a BGR frame.
+
+    Pass a dict as ``timings`` to collect per-stage durations in seconds, an
+    AdaptiveDetector as ``detector`` to schedule detection adaptively, the
+    thread's FramePreprocessor to reuse its buffers and an OperatingPoint for
+    the detection settings. The frame is converted to gray once for both
+    detection and recognition.
+    """
+    preprocessor = preprocessor or FramePreprocessor()
+    gray = gray_frame(frame, preprocessor, timings)
+    if detector is not None:
+        boxes = detector.detect(gray, face_cascade, timings, preprocessor, point)
+    else:
+        boxes = detect_faces(gray, face_cascade, timings, preprocessor, point)
+    predictions = recognize_faces(gray, boxes, recognizer, label_dict, threshold, timings, preprocessor)
+    results = []
+    for box, prediction in zip(boxes, predictions):
+        if prediction is None:
+            continue
+        name, confidence = prediction
+        results.append(Face(*box, name, confidence, None, name != "Unknown"))
+    return results
+
+
+def track_and_recognize(frame, boxes, tracker, recognizer, label_dict, threshold=CONFIDENCE_THRESHOLD,
+                        timings=None, preprocessor=None):
+    """Recognize only faces whose track is new, due for re-verification or has moved.
+
+    ``frame`` may be the BGR frame or its gray conversion from detection.
+    Returns (faces, predictions) where predictions is the number of recognizer calls.
+    """
+    tracks = tracker.update(boxes)
+    pending = [i for i, track in enumerate(tracks) if tracker.needs_recognition(track)]
+    predictions = recognize_faces(frame, [boxes[i] for i in pending], recognizer, label_dict, threshold,
+                                  timings, preprocessor)
+    for i, prediction in zip(pending, predictions):
+        if prediction is not None:
+            tracker.add_prediction(tracks[i], *prediction)
+    results = []
+    for box, track in zip(boxes, tracks):
+        new_name = tracker.take_new_identity(track)
+        results.append(Face(*box, track.name, track.confidence, track.id,
+                            new_name is not None and new_name != "Unknown"))
+    return results, len(pending)
+
+
+def draw_faces(frame, faces, timings=None, status=None):
+    """Draw the face boxes and names, plus an optional ``status`` line in the top-left corner."""
+    start = time.perf_counter()
+    for face in faces:
+        x, y, w, h = face.x, face.y, face.w, face.h
+        color = (0, 0, 255) if face.name == "Unknown" else (0, 255, 0)
+        cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+        cv2.putText(frame, face.name, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+    if status:
+        cv2.putText(frame, status, (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+    record_time(timings, "draw", start)
+
+
+class RecognitionPipeline:
+    """Staged capture -> detect/recognize -> render pipeline.
+
+    A capture thread keeps only the newest frame, a pool of worker threads runs
+    detection and recognition, and the caller consumes results in order from
+    ``results()`` (the render stage), where drawing, ``cv2.imshow`` and
+    attendance marking happen on a single thread.
+
+    With a ``tracker`` the workers only run detection; tracking and the
+    (much rarer) recognizer calls happen in frame order in the render stage.
+    A shared ``detector`` (AdaptiveDetector) replaces the full-frame cascade
+    pass on every frame. A ``metrics`` collector (metrics.Metrics) receives
+    every stage's timings and the frame, face and prediction counters. A
+    ``governor`` (governor.LoadGovernor) is told each frame's latency and
+    processing time, and its operating point sets the detection scale,
+    cascade parameters and how many captured frames are skipped.
+    """
+
+    def __init__(self, cascade_path, recognizer, label_dict, source=0, num_workers=None,
+                 queue_size=2, threshold=CONFIDENCE_THRESHOLD, report=None, report_interval=5.0,
+                 tracker=None, detector=None, metrics=None, governor=None):
+        self.cascade_path = cascade_path
+        # Recognizer and labels are swapped together as one tuple (see swap_model)
+        self.model = (recognizer, label_dict)
+        self.source = source
+        self.num_workers = num_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.threshold = threshold
+        self.report = report
+        self.report_interval = report_interval
+        self.tracker = tracker
+        self.detector = detector
+        self.metrics = metrics
+        self.governor = governor
+        self.predictions = 0
+
+        self.frame_queue = DropOldestQueue(1)
+        self.result_queue = DropOldestQueue(queue_size)
+        self.counters = {stage: StageCounter() for stage in ("capture", "recognize", "render")}
+        self.source_failed = False
+        self._stop = threading.Event()
+        self._capture_done = threading.Event()
+        self._threads = []
+        self._cap = None
+        self._workers_done = 0
+        self._workers_lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._model_users = {}  # id(model tuple) -> frames being recognized with it
+        self._retired = []  # (model tuple, retire callback) waiting for their last frame
+        if metrics is not None:
+            metrics.add_gauge("frames_dropped", lambda: self.frame_queue.dropped + self.result_queue.dropped)
+            metrics.add_gauge("queue_depth", lambda: self.frame_queue.qsize() + self.result_queue.qsize())
+            if governor is not None:
+                metrics.add_gauge("detect_scale", lambda: governor.point.scale)
+                metrics.add_gauge("frame_stride", lambda: governor.point.stride)
+
+    def start(self):
+        # Video files play at their own frame rate, like a camera; the drop-oldest queue would
+        # otherwise discard most of a file decoded as fast as possible
+        self._cap = open_source(self.source, realtime=True)
+        self._threads = [threading.Thread(target=self._capture_loop, daemon=True)]
+        for _ in range(self.num_workers):
+            self._threads.append(threading.Thread(target=self._worker_loop, daemon=True))
+        for t in self._threads:
+            t.start()
+
+    def swap_model(self, recognizer, label_dict, retire=None):
+        """Replace the recognizer and labels while running; frames in flight finish on the old model.
+
+        ``retire`` is called with the old recognizer once no frame uses it any
+        more: right away when none does, otherwise by the thread that finishes
+        the last such frame.
+        """
+        with self._model_lock:
+            old = self.model
+            self.model = (recognizer, label_dict)
+            if retire is not None and self._model_users.get(id(old)):
+                self._retired.append((old, retire))
+                return
+        if retire is not None:
+            retire(old[0])
+
+    @contextmanager
+    def _using_model(self):
+        """The current (recognizer, label_dict), kept from being retired until the block ends."""
+        with self._model_lock:
+            model = self.model
+            self._model_users[id(model)] = self._model_users.get(id(model), 0) + 1
+        try:
+            yield model
+        finally:
+            done = []
+            with self._model_lock:
+                users = self._model_users[id(model)] - 1
+                if users:
+                    self._model_users[id(model)] = users
+                else:
+                    del self._model_users[id(model)]
+                    done = [entry for entry in self._retired if entry[0] is model]
+                    self._retired = [entry for entry in self._retired if entry[0] is not model]
+            for old, retire in done:
+                retire(old[0])
+
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=2.0)
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+    def _capture_loop(self):
+        seq = 0
+        metrics = self.metrics
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            ret, frame = self._cap.read()
+            if not ret:
+                self.source_failed = True
+                break
+            record_time(metrics, "capture", start)
+            seq += 1
+            self.counters["capture"].tick()
+            if metrics is not None:
+                metrics.incr("frames_in")
+            if self.governor is not None and seq % self.governor.point.stride:
+                continue
+            # The capture time goes along so the render stage can measure end-to-end latency
+            self.frame_queue.put((seq, frame, time.perf_counter()))
+        self._capture_done.set()
+
+    def _worker_loop(self):
+        # CascadeClassifier is not safe to share between threads, so each worker
+        # gets its own; LBPH predict only reads the model and is shared.
+        face_cascade = cv2.CascadeClassifier(self.cascade_path)
+        preprocessor = FramePreprocessor()
+        while not self._stop.is_set():
+            try:
+                item = self.frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._capture_done.is_set():
+                    break
+                continue
+            seq, frame, captured = item
+            started = time.perf_counter()
+            metrics = self.metrics
+            point = self.governor.point if self.governor is not None else None
+            gray = None
+            if self.tracker is not None:
+                # The gray frame goes on to the render stage for recognition, so it gets its own array
+                gray = gray_frame(frame, preprocessor, metrics, keep=True)
+                if self.detector is not None:
+                    faces = self.detector.detect(gray, face_cascade, metrics, preprocessor, point)
+                else:
+                    faces = detect_faces(gray, face_cascade, metrics, preprocessor, point)
+            else:
+                with self._using_model() as (recognizer, label_dict):
+                    faces = process_frame(frame, face_cascade, recognizer, label_dict, self.threshold,
+                                          metrics, self.detector, preprocessor, point)
+                with self._workers_lock:
+                    self.predictions += len(faces)
+            if metrics is not None:
+                metrics.incr("faces_detected", len(faces))
+            self.result_queue.put((seq, frame, gray, faces, captured, time.perf_counter() - started))
+            self.counters["recognize"].tick()
+        with self._workers_lock:
+            self._workers_done += 1
+            if self._workers_done == self.num_workers:
+                self.result_queue.put(None)
+
+    def results(self):
+        """Yield (frame, faces) in capture order, skipping results that arrive late."""
+        last_seq = 0
+        last_report = time.perf_counter()
+        preprocessor = FramePreprocessor()
+        while not self._stop.is_set():
+            try:
+                item = self.result_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            seq, frame, gray, faces, captured, busy = item
+            if seq <= last_seq:
+                continue
+            last_seq = seq
+            if self.tracker is not None:
+                start = time.perf_counter()
+                with self._using_model() as (recognizer, label_dict):
+                    faces, predictions = track_and_recognize(gray, faces, self.tracker, recognizer,
+                                                             label_dict, self.threshold, self.metrics,
+                                                             preprocessor)
+                self.predictions += predictions
+                busy += time.perf_counter() - start
+            if self.governor is not None:
+                self.governor.observe(time.perf_counter() - captured, busy)
+            self.counters["render"].tick()
+            yield frame, faces
+            if self.report and time.perf_counter() - last_report >= self.report_interval:
+                last_report = time.perf_counter()
+                self.report(self.format_stats())
+
+    def stats(self):
+        return {
+            "fps": {stage: counter.fps() for stage, counter in self.counters.items()},
+            "queue_depth": {"frames": self.frame_queue.qsize(), "results": self.result_queue.qsize()},
+            "dropped": {"frames": self.frame_queue.dropped, "results": self.result_queue.dropped},
+            "predictions": self.predictions,
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        fps = ", ".join(f"{stage} {rate:.1f}" for stage, rate in s["fps"].items())
+        text = (f"[pipeline] fps: {fps} | queue: frames {s['queue_depth']['frames']}, "
+                f"results {s['queue_depth']['results']} | dropped: frames {s['dropped']['frames']}, "
+                f"results {s['dropped']['results']} | predictions {s['predictions']}")
+        if self.detector is not None:
+            text += "\n" + self.detector.format_stats()
+        if self.governor is not None:
+            text += "\n" + self.governor.format_stats()
+        return text
@@ -0,0 +1,109 @@
+import cv2
+import numpy as np
+
+# Every face is normalized the same way for enrollment, training and recognition,
+# so LBPH always compares histograms of equally sized, equally lit crops.
+FACE_SIZE = (100, 100)  # (width, height); LBP cost grows with the pixel count
+EQUALIZE = None  # None, "hist" (cv2.equalizeHist) or "clahe"; changing it re-decodes the face cache
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_TILE_GRID = (8, 8)
+
+
+def settings_key(face_size=FACE_SIZE, equalize=EQUALIZE):
+    """Short string identifying the normalization, stored with cached faces."""
+    return f"{face_size[0]}x{face_size[1]}:{equalize or 'none'}"
+
+
+def make_equalizer(equalize=EQUALIZE):
+    """Return ``f(src, dst)`` applying the configured equalization, or None when disabled."""
+    if not equalize:
+        return None
+    if equalize == "hist":
+        return lambda src, dst: cv2.equalizeHist(src, dst=dst)
+    if equalize == "clahe":
+        clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID)
+        return lambda src, dst: clahe.apply(src, dst=dst)
+    raise ValueError(f"Unknown equalization {equalize!r}; use None, 'hist' or 'clahe'")
+
+
+def normalize_face(face, out=None, face_size=FACE_SIZE, equalize=EQUALIZE, equalizer=None):
+    """Resize a grayscale crop to ``face_size`` and equalize it; writes into ``out`` when given.
+
+    Crops that already have the right size and need no equalization are
+    returned as they are (or copied into ``out``).
+    """
+    if (face.shape[1], face.shape[0]) != face_size:
+        # INTER_AREA only pays off (and is several times slower) when shrinking a lot
+        shrink = face.shape[1] >= 2 * face_size[0]
+        face = cv2.resize(face, face_size, dst=out,
+                          interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR)
+    elif out is not None:
+        np.copyto(out, face)
+        face = out
+    equalizer = equalizer or make_equalizer(equalize)
+    if equalizer is not None:
+        face = equalizer(face, out)  # in place when writing into ``out``
+    return face
+
+
+class FramePreprocessor:
+    """Per-frame preprocessing with reused buffers, shared by detection and recognition.
+
+    The BGR frame is converted to gray once at full resolution. The detection
+    image is a downscaled copy of that gray frame, face crops are zero-copy
+    views of it, and the normalized faces are written into a preallocated
+    (N, H, W) batch. Buffers are only reallocated when the frame size changes
+    or more faces than ever before show up, so a steady stream allocates
+    nothing here. Not thread-safe: each thread needs its own instance.
+    """
+
+    def __init__(self, face_size=FACE_SIZE, equalize=EQUALIZE):
+        self.face_size = face_size
+        self.equalize = equalize
+        self._equalizer = make_equalizer(equalize)
+        self._gray = None
+        self._small = None
+        self._faces = np.empty((0, face_size[1], face_size[0]), np.uint8)
+
+    def gray(self, frame, keep=False):
+        """Full-resolution gray frame (gray input is returned unchanged).
+
+        The result lives in a reused buffer and is overwritten by the next
+        call; pass ``keep=True`` for a new array that may be handed to
+        another thread.
+        """
+        if frame.ndim == 2:
+            return frame
+        if keep:
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self._gray is None or self._gray.shape != frame.shape[:2]:
+            self._gray = np.empty(frame.shape[:2], np.uint8)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+
+    def downscale(self, gray, scale):
+        """Gray frame resized by ``scale`` for detection, in a reused buffer."""
+        if scale == 1:
+            return gray
+        size = (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale)))
+        if self._small is None or (self._small.shape[1], self._small.shape[0]) != size:
+            self._small = np.empty((size[1], size[0]), np.uint8)
+        return cv2.resize(gray, size, dst=self._small, interpolation=cv2.INTER_LINEAR)
+
+    def faces(self, gray, boxes):
+        """Normalized crops for ``boxes``, as views into the batch buffer.
+
+        The crops are overwritten by the next call; copy any face that has to
+        be kept. Empty crops (boxes outside the frame) are returned as they
+        are so the recognizer reports them as failed predictions.
+        """
+        if len(boxes) > len(self._faces):
+            self._faces = np.empty((max(len(boxes), 2 * len(self._faces)), self.face_size[1],
+                                    self.face_size[0]), np.uint8)
+        crops = []
+        for i, (x, y, w, h) in enumerate(boxes):
+            roi = gray[max(y, 0):max(y + h, 0), max(x, 0):max(x + w, 0)]
+            if roi.size == 0:
+                crops.append(roi)
+                continue
+            crops.append(normalize_face(roi, self._faces[i], self.face_size, equalizer=self._equalizer))
+        return crops
@@ -0,0 +1,30 @@
+import threading
+import time
+from collections import Counter
+
+REPEAT_INTERVAL = 30.0  # seconds between repeats of the same keyed message
+
+
+class RateLimiter:
+    """Lets a message through once per ``interval`` seconds per key and counts the ones held back."""
+
+    def __init__(self, interval=REPEAT_INTERVAL, max_keys=10000):
+        self.interval = interval
+        self.max_keys = max_keys
+        self._last = {}
+        self._suppressed = Counter()
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """Return (allowed, suppressed) where suppressed is how many were held back since the last one."""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and now - last < self.interval:
+                self._suppressed[key] += 1
+                return False, 0
+            if len(self._last) >= self.max_keys:
+                # Forget keys that have been quiet for a full interval
+                self._last = {k: t for k, t in self._last.items() if now - t < self.interval}
+            self._last[key] = now
+            return True, self._suppressed.pop(key, 0)
@@ -1,19 +1,29 @@
-import cv2
+import argparse
+import time
 import numpy as np
-import pandas as pd
 from datetime import datetime
 import os
+from adaptive_detector import AdaptiveDetector
+from attendance_store import AttendanceWriter, open_store
+from face_tracker import FaceTracker
+from frame_sources import Display
+from gallery_matcher import load_recognizer
+from governor import CPU_BUDGET, TARGET_LATENCY_MS, LoadGovernor
+from metrics import METRICS_PORT, Metrics, SamplingProfiler, start_metrics_server
+from pipeline import RecognitionPipeline, configured_threshold, draw_faces, record_time
+from rate_limit import RateLimiter
 
 # Path to Haar Cascade and trained recognizer
 CASCADE_PATH = "haarcascade_frontalface_default.xml"
 RECOGNIZER_PATH = "trainer.yml"
+RECOGNIZER_BACKEND = "lbph"  # "gallery" for the vectorized NumPy matcher, "sharded" for shard processes
 LABELS_PATH = "labels.npy"  # Numpy file with {label: name} mapping
-ATTENDANCE_CSV = "attendance.csv"
+VIDEO_SOURCE = 0  # webcam index, video file, image directory or stream URL
 
-# Load face detector and recognizer
-face_cascade = cv2.CascadeClassifier(CASCADE_PATH)
-recognizer = cv2.face.LBPHFaceRecognizer_create()
-recognizer.read(RECOGNIZER_PATH)
+# Load recognizer (the pipeline workers load their own face detectors)
+recognizer = load_recognizer(RECOGNIZER_BACKEND, RECOGNIZER_PATH)
+# Accept threshold chosen with lbph_sweep.py --apply (70 without one)
+threshold = configured_threshold(recognizer)
 
 # Load label-name mapping
 if os.path.exists(LABELS_PATH):
@@ -21,45 +31,38 @@ if os.path.exists(LABELS_PATH):
 else:
     label_dict = {}  # {label: name}
 
+# Attendance storage (imports attendance.csv on first use)
+store = open_store(synchronous="FULL")
+
 # Attendance dictionary to avoid duplicate entries in this session
 attendance_dict = {}
+# Repeated console messages about the same person are printed at most every 30 s
+repeats = RateLimiter()
 
 def load_existing_attendance():
-    """Load today's attendance from CSV to prevent duplicates across sessions."""
+    """Load today's attendance from the store to prevent duplicates across sessions."""
     today = datetime.now().strftime('%Y-%m-%d')
-    existing = set()
-    if os.path.exists(ATTENDANCE_CSV):
-        df = pd.read_csv(ATTENDANCE_CSV)
-        if not df.empty:
-            for _, row in df.iterrows():
-                name = row["Name"]
-                timestamp = row["Timestamp"]
-                if str(timestamp).startswith(today):
-                    existing.add(name)
-    return existing
+    return store.names_for_date(today)
 
-def mark_attendance(name, existing_today):
+def mark_attendance(name, existing_today, writer):
     now = datetime.now()
     dt_string = now.strftime('%Y-%m-%d %H:%M:%S')
     if name not in attendance_dict and name not in existing_today and name != "Unknown":
         attendance_dict[name] = dt_string
+        # Persisted in the background so a crash doesn't lose the session
+        writer.submit(name, dt_string)
         print(f"Marked attendance for {name} at {dt_string}")
-    elif name in existing_today:
+    elif name in existing_today and repeats.allow(("marked", name))[0]:
         print(f"Attendance for {name} already marked today.")
 
-def save_attendance_to_csv(filename=ATTENDANCE_CSV):
-    # Append new attendance to CSV
+def save_attendance(writer):
+    # Flush whatever the background writer still has queued
+    writer.close()
     if attendance_dict:
-        df_new = pd.DataFrame(list(attendance_dict.items()), columns=["Name", "Timestamp"])
-        if os.path.exists(filename):
-            df_existing = pd.read_csv(filename)
-            df_combined = pd.concat([df_existing, df_new], ignore_index=True)
-            df_combined.to_csv(filename, index=False)
-        else:
-            df_new.to_csv(filename, index=False)
-        print(f"Attendance saved to {filename}")
+        print(f"Attendance saved to {store.path} ({writer.written} new records)")
     else:
         print("No new attendance to save.")
+    print(writer.format_stats())
 
 def show_summary():
     print("\n--- Attendance Session Summary ---")
@@ -70,53 +73,81 @@ def show_summary():
     else:
         print("No new attendance marked this session.")
 
-def recognize_and_mark_attendance():
+def recognize_and_mark_attendance(source=VIDEO_SOURCE, headless=False, metrics_port=None,
+                                  target_latency_ms=TARGET_LATENCY_MS, cpu_budget=CPU_BUDGET, governed=True):
     existing_today = load_existing_attendance()
-    cap = cv2.VideoCapture(0)
-    print("Starting real-time face recognition. Press 'q' to quit and save attendance.")
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-            
-        # Resize frame for faster processing
-        frame_small = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
-        gray_small = cv2.cvtColor(frame_small, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray_small, scaleFactor=1.1, minNeighbors=4)
-        
-        # Scale face coordinates back to original frame size
-        for (x, y, w, h) in faces:
-            x_big, y_big, w_big, h_big = [int(v * 2) for v in (x, y, w, h)]
-            roi_gray = cv2.cvtColor(frame[y_big:y_big+h_big, x_big:x_big+w_big], cv2.COLOR_BGR2GRAY)
-            try:
-                label, confidence = recognizer.predict(roi_gray)
-            except:
-                continue
-            if confidence < 70:
-                name = label_dict.get(label, "Unknown")
-                print(f"Recognized: {name} (confidence: {confidence})")
-                mark_attendance(name, existing_today)
-                color = (0, 255, 0)
-            else:
-                name = "Unknown"
-                print("Face not recognized.")
-                color = (0, 0, 255)
-            cv2.rectangle(frame, (x_big, y_big), (x_big+w_big, y_big+h_big), color, 2)
-            cv2.putText(frame, name, (x_big, y_big-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-        cv2.imshow("Attendance - Face Recognition", frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-    cap.release()
-    cv2.destroyAllWindows()
-    save_attendance_to_csv()
+    writer = AttendanceWriter(store)
+    metrics = None
+    if metrics_port:
+        metrics = Metrics()
+        metrics.add_gauge("marks_written", lambda: writer.written)
+        metrics.add_gauge("writer_backlog", writer.backlog)
+        start_metrics_server(metrics, metrics_port, profiler=SamplingProfiler())
+        print(f"Metrics at http://127.0.0.1:{metrics_port}/metrics")
+
+    def report(message):
+        print(message)
+        print(writer.format_stats())
+        if metrics is not None:
+            print(metrics.format_summary())
+
+    # Trades detection resolution and frame rate for latency as the machine's load changes
+    governor = LoadGovernor(target_latency_ms, cpu_budget, report=print) if governed else None
+    pipeline = RecognitionPipeline(CASCADE_PATH, recognizer, label_dict, source=source, threshold=threshold,
+                                   report=report, tracker=FaceTracker(), detector=AdaptiveDetector(),
+                                   metrics=metrics, governor=governor)
+    display = Display(headless)
+    pipeline.start()
+    if headless:
+        print("Starting headless face recognition. Press Ctrl+C to stop and save attendance.")
+    else:
+        print("Starting real-time face recognition. Press 'q' to quit and save attendance.")
+    try:
+        for frame, faces in pipeline.results():
+            for face in faces:
+                if face.is_new:
+                    if repeats.allow(("recognized", face.name))[0]:
+                        print(f"Recognized: {face.name} (confidence: {face.confidence})")
+                    mark_attendance(face.name, existing_today, writer)
+            if not headless:
+                draw_faces(frame, faces, metrics, governor.label() if governor is not None else None)
+            start = time.perf_counter()
+            shown = display.show("Attendance - Face Recognition", frame)
+            record_time(metrics, "display", start)
+            if not shown:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+    print(pipeline.format_stats())
+    display.close()
+    save_attendance(writer)
+    store.close()
     show_summary()
 
 if __name__ == "__main__":
-    recognize_and_mark_attendance()
+    parser = argparse.ArgumentParser(description="Real-time face recognition attendance.")
+    parser.add_argument("--source", default=VIDEO_SOURCE,
+                        help="webcam index, video file, image directory or stream URL (default: 0)")
+    parser.add_argument("--headless", action="store_true", help="run without a display window")
+    parser.add_argument("--metrics-port", type=int, nargs="?", const=METRICS_PORT, default=None,
+                        help=f"serve /metrics and /metrics.json on this port (default {METRICS_PORT})")
+    parser.add_argument("--target-latency-ms", type=float, default=TARGET_LATENCY_MS,
+                        help=f"end-to-end latency the governor aims for (default {TARGET_LATENCY_MS})")
+    parser.add_argument("--cpu-budget", type=float, default=CPU_BUDGET,
+                        help="share of all CPU cores to stay under, e.g. 0.5 (default: no limit)")
+    parser.add_argument("--fixed", action="store_true",
+                        help="keep the default detection settings instead of adapting them to the load")
+    args = parser.parse_args()
+    recognize_and_mark_attendance(args.source, args.headless, args.metrics_port, args.target_latency_ms,
+                                  args.cpu_budget, not args.fixed)
 
 # Instructions:
 # - Ensure 'haarcascade_frontalface_default.xml', 'trainer.yml', and 'labels.npy' are in the same directory or update the paths.
-# - Press 'q' to quit and save attendance.
-# - The attendance will be saved in 'attendance.csv'.
+# - Press 'q' to quit and save attendance (Ctrl+C with --headless).
+# - Use --source to read from a video file, image directory or stream URL instead of the webcam.
+# - Detection scale, frame stride and cascade settings follow the load (see governor.py); --fixed turns that off.
+# - The attendance will be saved in 'attendance.db' (export to CSV with 'python attendance_store.py').
 # - No duplicate attendance for the same person per day, even across multiple runs.
 # - A summary of the session will be printed at the end.
@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from adaptive_detector import AdaptiveDetector
+from attendance_store import AttendanceWriter, open_store
+from face_tracker import FaceTracker
+from frame_sources import Display
+from gallery_matcher import load_recognizer
+from governor import LoadGovernor
+from metrics import Metrics, SamplingProfiler, metrics_response, profiler_response
+from pipeline import RecognitionPipeline, configured_threshold, draw_faces
+from rate_limit import RateLimiter
+from service_client import SERVICE_HOST, SERVICE_PORT
+from shard_recognizer import SHARD_MANIFEST
+
+CASCADE_PATH = "haarcascade_frontalface_default.xml"
+RECOGNIZER_PATH = "trainer.yml"
+RECOGNIZER_BACKEND = "lbph"
+LABELS_PATH = "labels.npy"
+
+
+def load_labels(labels_path=LABELS_PATH):
+    if os.path.exists(labels_path):
+        return np.load(labels_path, allow_pickle=True).item()
+    return {}
+
+
+def close_recognizer(recognizer):
+    """Stop a recognizer that owns resources; sharded recognizers have worker processes."""
+    if hasattr(recognizer, "close"):
+        recognizer.close()
+
+
+class RecognitionService:
+    """Long-lived recognition process: models are loaded once and reused by every session.
+
+    A watcher thread reloads trainer.yml/labels.npy when they change on disk and
+    swaps them into the running pipeline, so retraining needs no restart and
+    no frames are dropped. Events (marks, log lines, session changes) go into a
+    bounded buffer that clients read incrementally by sequence number.
+    """
+
+    def __init__(self, reload_interval=2.0, max_events=1000):
+        self.model = (load_recognizer(RECOGNIZER_BACKEND, RECOGNIZER_PATH), load_labels())
+        self.model_mtime = self._model_mtime()
+        self.store = open_store(synchronous="FULL")
+        self.reload_interval = reload_interval
+        self.events = deque(maxlen=max_events)
+        self.event_seq = 0
+        self._events_cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self.pipeline = None
+        self.session_thread = None
+        self.session = None
+        self.governor = None
+        self._shutdown = threading.Event()
+        self.metrics = Metrics()
+        self.profiler = SamplingProfiler()
+        threading.Thread(target=self._watch_model, daemon=True).start()
+
+    @staticmethod
+    def _model_mtime():
+        # Sharded training rewrites shards.json instead of trainer.yml
+        mtimes = [os.path.getmtime(p) for p in (RECOGNIZER_PATH, SHARD_MANIFEST) if os.path.exists(p)]
+        return max(mtimes) if mtimes else None
+
+    def emit(self, kind, message, **data):
+        with self._events_cond:
+            self.event_seq += 1
+            self.events.append({"seq": self.event_seq, "type": kind, "message": message,
+                                "time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'), **data})
+            self._events_cond.notify_all()
+
+    def events_since(self, since, timeout=0.0):
+        """Return events with seq > since, waiting up to ``timeout`` seconds for new ones."""
+        with self._events_cond:
+            if self.event_seq <= since and timeout > 0:
+                self._events_cond.wait(timeout)
+            return [e for e in self.events if e["seq"] > since]
+
+    def reload_model(self):
+        """Load the model from disk and swap it in atomically; the old one keeps serving until then.
+
+        Reloads (the watcher or POST /reload) run one at a time, so each old
+        recognizer is closed exactly once. A running pipeline closes it only
+        after its last in-flight frame has finished with it.
+        """
+        with self._reload_lock:
+            mtime = self._model_mtime()
+            try:
+                model = (load_recognizer(RECOGNIZER_BACKEND, RECOGNIZER_PATH), load_labels())
+            except Exception as e:
+                self.emit("log", f"Model reload failed: {e}")
+                return False
+            with self._lock:
+                old_recognizer = self.model[0]
+                self.model = model
+                self.model_mtime = mtime
+                pipeline = self.pipeline
+                if pipeline is not None:
+                    pipeline.swap_model(*model, retire=close_recognizer)
+                    # Retraining may have applied new LBPH parameters with their own threshold
+                    pipeline.threshold = configured_threshold(model[0])
+            if pipeline is None:
+                close_recognizer(old_recognizer)
+        self.emit("model", f"Model reloaded ({len(model[1])} people).")
+        return True
+
+    def _watch_model(self):
+        while not self._shutdown.wait(self.reload_interval):
+            mtime = self._model_mtime()
+            if mtime is not None and mtime != self.model_mtime:
+                self.reload_model()
+
+    def start_session(self, source=0, headless=False):
+        with self._lock:
+            if self.session_thread is not None and self.session_thread.is_alive():
+                return False
+            self.session = {"source": source, "headless": headless, "marked": {},
+                            "started": datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+            self.governor = LoadGovernor(report=lambda message: self.emit("log", message))
+            self.pipeline = RecognitionPipeline(CASCADE_PATH, *self.model, source=source,
+                                                threshold=configured_threshold(self.model[0]),
+                                                tracker=FaceTracker(), detector=AdaptiveDetector(),
+                                                report=self._report, metrics=self.metrics,
+                                                governor=self.governor)
+            self.session_thread = threading.Thread(target=self._run_session,
+                                                   args=(self.pipeline, self.session), daemon=True)
+            self.session_thread.start()
+        return True
+
+    def _report(self, message):
+        self.emit("stats", message)
+        self.emit("stats", self.metrics.format_summary())
+
+    def stop_session(self):
+        with self._lock:
+            pipeline, thread = self.pipeline, self.session_thread
+        if pipeline is None:
+            return False
+        pipeline.stop()
+        if thread is not None:
+            thread.join(timeout=5.0)
+        return True
+
+    def _run_session(self, pipeline, session):
+        existing_today = self.store.names_for_date(datetime.now().strftime('%Y-%m-%d'))
+        writer = AttendanceWriter(self.store)
+        self.metrics.add_gauge("marks_written", lambda: writer.written)
+        self.metrics.add_gauge("writer_backlog", writer.backlog)
+        display = Display(session["headless"])
+        marked = session["marked"]
+        repeats = RateLimiter()
+        pipeline.start()
+        self.emit("session", "Attendance session started.", state="running")
+        try:
+            for frame, faces in pipeline.results():
+                for face in faces:
+                    if not face.is_new:
+                        continue
+                    if face.name in existing_today:
+                        allowed, suppressed = repeats.allow(face.name)
+                        if allowed:
+                            self.emit("log", f"Attendance for {face.name} already marked today.", repeats=suppressed)
+                    elif face.name not in marked:
+                        dt_string = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                        with self._lock:  # status() copies this dict from HTTP threads
+                            marked[face.name] = dt_string
+                        writer.submit(face.name, dt_string)
+                        self.emit("mark", f"Marked attendance for {face.name} at {dt_string}",
+                                  name=face.name, timestamp=dt_string)
+                if not session["headless"]:
+                    draw_faces(frame, faces, self.metrics, pipeline.governor.label())
+                if not display.show("Attendance - Face Recognition", frame):
+                    break
+        finally:
+            pipeline.stop()
+            display.close()
+            writer.close()
+            with self._lock:
+                if self.pipeline is pipeline:
+                    self.pipeline = None
+        self.emit("stats", pipeline.format_stats())
+        self.emit("stats", writer.format_stats())
+        with self._lock:
+            marked = dict(marked)
+        self.emit("session", f"Attendance session finished: {len(marked)} new marks.", state="stopped",
+                  marked=marked)
+
+    def status(self):
+        with self._lock:
+            running = self.session_thread is not None and self.session_thread.is_alive()
+            pipeline = self.pipeline
+            # A copy: the session thread keeps adding marks while the response is serialized
+            session = {**self.session, "marked": dict(self.session["marked"])} if self.session else None
+        return {
+            "running": running,
+            "session": session,
+            "people": len(self.model[1]),
+            "model_mtime": self.model_mtime,
+            "last_event": self.event_seq,
+            "pipeline": pipeline.stats() if pipeline is not None else None,
+            "governor": self.governor.summary() if self.governor is not None else None,
+        }
+
+    def shutdown(self):
+        self.stop_session()
+        self._shutdown.set()
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload, code=200):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/status":
+            self._send(self.service.status())
+        elif url.path in ("/metrics", "/metrics.json"):
+            content_type, text = metrics_response(url.path, self.service.metrics)
+            body = text.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif url.path == "/events":
+            since = int(query.get("since", ["0"])[0])
+            timeout = min(float(query.get("timeout", ["0"])[0]), 30.0)
+            self._send({"events": self.service.events_since(since, timeout)})
+        else:
+            self._send({"error": "not found"}, 404)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path == "/session/start":
+            body = self._body()
+            started = self.service.start_session(body.get("source", 0), bool(body.get("headless", False)))
+            self._send({"started": started})
+        elif path == "/session/stop":
+            self._send({"stopped": self.service.stop_session()})
+        elif path in ("/profile/start", "/profile/stop"):
+            self._send(profiler_response(path, self.service.profiler))
+        elif path == "/reload":
+            self._send({"reloaded": self.service.reload_model()})
+        elif path == "/shutdown":
+            self._send({"shutdown": True})
+            self.service.shutdown()
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        else:
+            self._send({"error": "not found"}, 404)
+
+
+def serve(host=SERVICE_HOST, port=SERVICE_PORT):
+    ServiceHandler.service = RecognitionService()
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    print(f"Recognition service listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ServiceHandler.service.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-lived face recognition service with a local HTTP API.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    args = parser.parse_args()
+    serve(args.host, args.port)
@@ -0,0 +1,250 @@
+import argparse
+import csv
+import json
+import os
+
+from attendance_store import ATTENDANCE_DB, open_store
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional
+    pa = pq = None
+
+DATASET_DIR = "dataset"
+LABELS_PATH = "labels.npy"
+LATE_CUTOFF = "09:00:00"
+REPORTS = ["daily", "weekly", "person", "late", "absentees"]
+PARQUET_BATCH = 10000
+
+
+def load_roster(dataset_dir=DATASET_DIR, labels_path=LABELS_PATH):
+    """Enrolled people: the dataset/ person folders plus the names in the trained label map."""
+    roster = set()
+    if os.path.isdir(dataset_dir):
+        from face_cache import list_people
+        roster.update(person_name for person_name, _, _ in list_people(dataset_dir))
+    if os.path.exists(labels_path):
+        import numpy as np
+        roster.update(np.load(labels_path, allow_pickle=True).item().values())
+    return sorted(roster)
+
+
+def normalize_cutoff(cutoff):
+    """'9:00' -> '09:00:00', so it compares correctly against the time part of a timestamp."""
+    parts = [int(p) for p in cutoff.split(":")]
+    parts += [0] * (3 - len(parts))
+    return "{:02d}:{:02d}:{:02d}".format(*parts[:3])
+
+
+def date_filter(start_date, end_date, column="date"):
+    clauses, params = [], []
+    if start_date:
+        clauses.append(f"{column} >= ?")
+        params.append(start_date)
+    if end_date:
+        clauses.append(f"{column} <= ?")
+        params.append(end_date)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+# Every report is a (columns, row iterator) pair. The aggregation runs inside
+# SQLite and rows are streamed from its cursor, so memory stays flat no matter
+# how many years of history are in the database.
+
+def daily_report(store, start_date=None, end_date=None, cutoff=LATE_CUTOFF, roster=None):
+    where, params = date_filter(start_date, end_date)
+    columns = ["date", "present", "late", "first_arrival", "last_arrival"]
+    rows = store.stream(
+        "SELECT date, COUNT(*), SUM(substr(timestamp, 12) > ?), "
+        "MIN(substr(timestamp, 12)), MAX(substr(timestamp, 12)) "
+        f"FROM attendance{where} GROUP BY date ORDER BY date", [cutoff] + params)
+    return columns, rows
+
+
+def weekly_report(store, start_date=None, end_date=None, cutoff=LATE_CUTOFF, roster=None):
+    where, params = date_filter(start_date, end_date)
+    columns = ["week_start", "days", "marks", "people", "late", "avg_daily_present"]
+    # Weeks start on Monday: step back six days, then forward to the next Monday
+    rows = store.stream(
+        "SELECT date(date, '-6 days', 'weekday 1') AS week_start, COUNT(DISTINCT date), COUNT(*), "
+        "COUNT(DISTINCT name), SUM(substr(timestamp, 12) > ?), "
+        "ROUND(COUNT(*) * 1.0 / COUNT(DISTINCT date), 2) "
+        f"FROM attendance{where} GROUP BY week_start ORDER BY week_start", [cutoff] + params)
+    return columns, rows
+
+
+def person_report(store, start_date=None, end_date=None, cutoff=LATE_CUTOFF, roster=None):
+    where, params = date_filter(start_date, end_date)
+    columns = ["name", "days_present", "attendance_rate", "late_days", "first_seen", "last_seen",
+               "avg_arrival"]
+    marked = store.stream(
+        "SELECT name, COUNT(*), "
+        f"ROUND(COUNT(*) * 1.0 / (SELECT COUNT(DISTINCT date) FROM attendance{where}), 4), "
+        "SUM(substr(timestamp, 12) > ?), MIN(date), MAX(date), "
+        "time(CAST(AVG(strftime('%s', timestamp) - strftime('%s', date)) AS INTEGER), 'unixepoch') "
+        f"FROM attendance{where} GROUP BY name ORDER BY name", params + [cutoff] + params)
+
+    def rows():
+        seen = set()
+        for row in marked:
+            seen.add(row[0])
+            yield row
+        # Enrolled people who never showed up still get a row
+        for name in roster or []:
+            if name not in seen:
+                yield name, 0, 0.0, 0, None, None, None
+    return columns, rows()
+
+
+def late_report(store, start_date=None, end_date=None, cutoff=LATE_CUTOFF, roster=None):
+    where, params = date_filter(start_date, end_date)
+    where += (" AND " if where else " WHERE ") + "substr(timestamp, 12) > ?"
+    columns = ["date", "name", "timestamp"]
+    rows = store.stream(f"SELECT date, name, timestamp FROM attendance{where} ORDER BY date, name",
+                        params + [cutoff])
+    return columns, rows
+
+
+def absentees_report(store, start_date=None, end_date=None, cutoff=LATE_CUTOFF, roster=None):
+    """Roster members with no mark, for every day on which anyone was marked."""
+    if not roster:
+        raise ValueError("The absentee report needs an enrolled roster (dataset/ folders or labels.npy)")
+    where, params = date_filter(start_date, end_date)
+    columns = ["date", "name"]
+
+    def rows():
+        present, current = set(), None
+        # One ordered pass; only a single day's names are held at a time
+        for date, name in store.stream(f"SELECT date, name FROM attendance{where} ORDER BY date", params):
+            if date != current:
+                if current is not None:
+                    yield from ((current, n) for n in roster if n not in present)
+                present, current = set(), date
+            present.add(name)
+        if current is not None:
+            yield from ((current, n) for n in roster if n not in present)
+    return columns, rows()
+
+
+REPORT_BUILDERS = {
+    "daily": daily_report,
+    "weekly": weekly_report,
+    "person": person_report,
+    "late": late_report,
+    "absentees": absentees_report,
+}
+
+
+def write_csv(path, columns, rows):
+    count = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_json(path, columns, rows):
+    """Write a JSON array of objects one record at a time."""
+    count = 0
+    with open(path, "w") as f:
+        f.write("[")
+        for row in rows:
+            f.write(",\n " if count else "\n ")
+            json.dump(dict(zip(columns, row)), f)
+            count += 1
+        f.write("\n]\n")
+    return count
+
+
+def write_parquet(path, columns, rows):
+    """Write row groups of PARQUET_BATCH rows so only one batch is in memory."""
+    if pq is None:
+        raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+    writer = None
+    count = 0
+    batch = []
+
+    def flush():
+        nonlocal writer
+        table = pa.Table.from_pylist([dict(zip(columns, row)) for row in batch])
+        if writer is None:
+            # A column that is all None in the first batch is typed as string, not null
+            schema = pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+                                for f in table.schema])
+            writer = pq.ParquetWriter(path, schema)
+        writer.write_table(table.cast(writer.schema))
+
+    try:
+        for row in rows:
+            batch.append(row)
+            count += 1
+            if len(batch) >= PARQUET_BATCH:
+                flush()
+                batch = []
+        if batch or writer is None:
+            if not batch:
+                # Empty report: still write a file with the right columns
+                pq.write_table(pa.table({c: pa.array([], pa.string()) for c in columns}), path)
+            else:
+                flush()
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+WRITERS = {"csv": write_csv, "json": write_json, "parquet": write_parquet}
+
+
+def write_report(kind, path, fmt=None, store=None, start_date=None, end_date=None, cutoff=LATE_CUTOFF,
+                 roster=None):
+    """Build report ``kind`` and stream it to ``path``; returns the number of rows written."""
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower() or "csv"
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown output format {fmt!r}; use one of {', '.join(WRITERS)}")
+    columns, rows = REPORT_BUILDERS[kind](store, start_date, end_date, normalize_cutoff(cutoff), roster)
+    # Write to a temp file first so a failed report never leaves a half-written one behind
+    tmp_path = f"{path}.tmp"
+    try:
+        count = WRITERS[fmt](tmp_path, columns, rows)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Attendance reports streamed from attendance.db.")
+    parser.add_argument("reports", nargs="+", choices=REPORTS + ["all"])
+    parser.add_argument("--format", choices=list(WRITERS), default="csv")
+    parser.add_argument("--output-dir", default="reports")
+    parser.add_argument("--from", dest="start_date", help="first date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end_date", help="last date (YYYY-MM-DD)")
+    parser.add_argument("--late-after", default=LATE_CUTOFF, help="arrivals after this time are late (HH:MM)")
+    parser.add_argument("--db", default=ATTENDANCE_DB)
+    parser.add_argument("--dataset", default=DATASET_DIR, help="roster folder for absentees")
+    parser.add_argument("--labels", default=LABELS_PATH, help="label map adding to the roster")
+    args = parser.parse_args()
+
+    kinds = REPORTS if "all" in args.reports else args.reports
+    roster = load_roster(args.dataset, args.labels)
+    os.makedirs(args.output_dir, exist_ok=True)
+    store = open_store(args.db)
+    try:
+        for kind in kinds:
+            path = os.path.join(args.output_dir, f"{kind}.{args.format}")
+            try:
+                count = write_report(kind, path, args.format, store, args.start_date, args.end_date,
+                                     args.late_after, roster)
+            except (ValueError, RuntimeError) as e:
+                print(f"Skipped {kind} report: {e}")
+                continue
+            print(f"Wrote {count} rows to {path}")
+    finally:
+        store.close()
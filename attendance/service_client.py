@@ -0,0 +1,55 @@
+import json
+import time
+import urllib.error
+import urllib.request
+
+# Kept free of OpenCV/NumPy imports so the dashboard starts instantly
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+
+
+class ServiceClient:
+    """Small JSON client for the recognition service's localhost HTTP API."""
+
+    def __init__(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        self.base = f"http://{host}:{port}"
+
+    def _request(self, path, payload=None, timeout=5.0):
+        data = None if payload is None else json.dumps(payload).encode()
+        request = urllib.request.Request(self.base + path, data=data,
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+
+    def is_running(self):
+        try:
+            self.status()
+            return True
+        except (urllib.error.URLError, OSError):
+            return False
+
+    def status(self):
+        return self._request("/status", timeout=1.0)
+
+    def start_session(self, source=0, headless=False):
+        return self._request("/session/start", {"source": source, "headless": headless})
+
+    def stop_session(self):
+        return self._request("/session/stop", {}, timeout=10.0)
+
+    def reload(self):
+        return self._request("/reload", {}, timeout=60.0)
+
+    def events(self, since=0, timeout=10.0):
+        return self._request(f"/events?since={since}&timeout={timeout}", timeout=timeout + 5.0)["events"]
+
+    def shutdown(self):
+        return self._request("/shutdown", {})
+
+    def wait_until_ready(self, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.is_running():
+                return True
+            time.sleep(0.2)
+        return False
@@ -0,0 +1,254 @@
+import atexit
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from face_cache import CACHE_DIR, FaceCache, file_key, list_dataset
+from gallery_matcher import create_lbph, lbph_params, load_recognizer_config, save_lbph_binary
+
+SHARD_DIR = "shards"
+SHARD_MANIFEST = "shards.json"
+NO_MATCH = (-1, float("inf"))
+
+
+def plan_shards(labels, label_dict, shards=None, cohorts=None):
+    """Split the trained labels into shards; returns [(shard name, [labels])].
+
+    With ``cohorts`` ({person_name: cohort}) there is one shard per cohort
+    folder. Otherwise label IDs are cut into ``shards`` contiguous ranges
+    holding roughly the same number of images.
+    """
+    counts = Counter(int(label) for label in labels)
+    if cohorts is not None:
+        groups = {}
+        for label in sorted(counts):
+            groups.setdefault(cohorts.get(label_dict[label]) or "default", []).append(label)
+        return sorted(groups.items())
+    total = sum(counts.values())
+    groups, current, seen = [], [], 0
+    for label in sorted(counts):
+        current.append(label)
+        seen += counts[label]
+        if len(groups) < shards - 1 and seen >= total * (len(groups) + 1) / shards:
+            groups.append(current)
+            current = []
+    if current:
+        groups.append(current)
+    return [(f"labels-{group[0]}-{group[-1]}", group) for group in groups]
+
+
+def _shard_signature(shard_labels, files_by_label, params):
+    """Hash of the LBPH parameters and dataset files behind a shard, so unchanged shards are not retrained."""
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode())
+    for label in sorted(shard_labels):
+        digest.update(json.dumps([label, files_by_label.get(label, [])]).encode())
+    return digest.hexdigest()
+
+
+def _train_shard(task):
+    """Process pool job: train one shard from the memory-mapped face cache."""
+    cache_dir, shard_labels, path, params = task
+    faces, labels, _ = FaceCache(cache_dir).load()
+    rows = np.flatnonzero(np.isin(labels, shard_labels))
+    recognizer = create_lbph(params)
+    recognizer.train([faces[i] for i in rows], labels[rows])
+    save_lbph_binary(recognizer, path)
+    return len(rows)
+
+
+def train_shards(groups, dataset_dir, name_to_label, workers=None, cache_dir=CACHE_DIR, shard_by="label",
+                 manifest_path=SHARD_MANIFEST, shard_dir=SHARD_DIR):
+    """Train every shard whose people or images changed, in parallel, and write the manifest.
+
+    Shards are read from the face cache, which must already be in sync with
+    ``dataset_dir`` (see train_recognizer.get_images_and_labels). Shard
+    files a previous run wrote that are no longer in the manifest are
+    deleted.
+    """
+    files_by_label = {}
+    for rel, person_name in list_dataset(dataset_dir):
+        files_by_label.setdefault(name_to_label[person_name], []).append(
+            [rel, file_key(os.path.join(dataset_dir, rel))])
+    params = lbph_params(load_recognizer_config())
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = {s["name"]: s for s in json.load(f)["shards"]}
+
+    os.makedirs(shard_dir, exist_ok=True)
+    entries, tasks = [], []
+    for name, shard_labels in groups:
+        entry = {"name": name, "path": os.path.join(shard_dir, f"trainer.{name}.yml"),
+                 "labels": shard_labels, "signature": _shard_signature(shard_labels, files_by_label, params)}
+        old = previous.get(name)
+        if not (old and old["signature"] == entry["signature"] and os.path.exists(old["path"])):
+            tasks.append((cache_dir, shard_labels, entry["path"], params))
+        entries.append(entry)
+
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for (_, _, path, _), count in zip(tasks, pool.map(_train_shard, tasks)):
+                print(f"Trained {path} on {count} images.")
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"shard_by": shard_by, "shards": entries}, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+    _remove_stale_shards(shard_dir, {entry["path"] for entry in entries})
+    return len(tasks)
+
+
+def _remove_stale_shards(shard_dir, keep):
+    """Delete shard models a previous run wrote that the new manifest no longer lists."""
+    for filename in os.listdir(shard_dir):
+        path = os.path.join(shard_dir, filename)
+        if filename.startswith("trainer.") and filename.endswith(".yml") and path not in keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _serve_shard(path, conn):
+    """Worker process: answer predict requests for one shard model.
+
+    Each request is (shared memory name, [(offset, height, width), ...]);
+    the faces are read in place from the shared block and one list of
+    (label, confidence) or None is sent back.
+    """
+    cv2.setNumThreads(1)
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    try:
+        recognizer.read(path)
+    except cv2.error as e:
+        conn.send(("error", str(e)))
+        return
+    conn.send(("ready", len(recognizer.getLabels())))
+    shm = None
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            name, layout = request
+            if shm is None or shm.name != name:
+                if shm is not None:
+                    shm.close()
+                shm = shared_memory.SharedMemory(name=name)
+            results = []
+            for offset, height, width in layout:
+                roi = np.ndarray((height, width), np.uint8, shm.buf, offset)
+                try:
+                    results.append(recognizer.predict(roi))
+                except cv2.error:
+                    results.append(None)
+                del roi
+            conn.send(results)
+    finally:
+        if shm is not None:
+            shm.close()
+
+
+class ShardedRecognizer:
+    """Fans each predict out to one worker process per shard and keeps the best match.
+
+    Faces are copied once into a shared memory block that every worker reads
+    in place; only their offsets and sizes go through the pipes. Labels are
+    global IDs from labels.npy, so the merged result is simply the lowest
+    confidence (distance) any shard reports. Implements ``predict`` and
+    ``predict_batch`` like the other recognizers, so the pipeline uses it
+    unchanged.
+    """
+
+    def __init__(self, shard_paths, buffer_size=1 << 22, start_timeout=120.0):
+        context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._closed = False
+        self._shm = shared_memory.SharedMemory(create=True, size=buffer_size)
+        self._workers = []
+        for path in shard_paths:
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_serve_shard, args=(path, child_conn), daemon=True)
+            process.start()
+            child_conn.close()
+            self._workers.append((process, parent_conn))
+        atexit.register(self.close)
+        for path, (_, conn) in zip(shard_paths, self._workers):
+            if not conn.poll(start_timeout):
+                self.close()
+                raise RuntimeError(f"Shard worker for {path} did not start")
+            status, detail = conn.recv()
+            if status != "ready":
+                self.close()
+                raise RuntimeError(f"Could not load shard {path}: {detail}")
+
+    @classmethod
+    def from_manifest(cls, manifest_path=SHARD_MANIFEST):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        return cls([s["path"] for s in manifest["shards"]])
+
+    def _write(self, rois):
+        """Copy the faces into the shared block, growing it if needed; returns their layout."""
+        rois = [np.ascontiguousarray(roi, dtype=np.uint8) for roi in rois]
+        needed = sum(roi.size for roi in rois)
+        if needed > self._shm.size:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = shared_memory.SharedMemory(create=True, size=max(needed, 2 * self._shm.size))
+        layout, offset = [], 0
+        for roi in rois:
+            np.ndarray(roi.shape, np.uint8, self._shm.buf, offset)[:] = roi
+            layout.append((offset, roi.shape[0], roi.shape[1]))
+            offset += roi.size
+        return layout
+
+    def predict_batch(self, rois):
+        if not rois:
+            return []
+        with self._lock:
+            if self._closed:
+                return [None] * len(rois)
+            layout = self._write(rois)  # may replace the block, so read its name afterwards
+            request = (self._shm.name, layout)
+            for _, conn in self._workers:
+                conn.send(request)
+            replies = [conn.recv() for _, conn in self._workers]
+        merged = []
+        for i in range(len(rois)):
+            candidates = [reply[i] for reply in replies if reply[i] is not None]
+            merged.append(min(candidates, key=lambda p: p[1]) if candidates else None)
+        return merged
+
+    def predict(self, roi):
+        result = self.predict_batch([roi])[0]
+        return NO_MATCH if result is None else result
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for process, conn in self._workers:
+                try:
+                    conn.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+            for process, conn in self._workers:
+                process.join(timeout=2.0)
+                if process.is_alive():
+                    process.terminate()
+                conn.close()
+            self._shm.close()
+            self._shm.unlink()
+        atexit.unregister(self.close)
@@ -0,0 +1,40 @@
+import importlib
+import time
+from contextlib import contextmanager
+
+# Process start as seen by the first module that imports this one
+PROCESS_START = time.perf_counter()
+
+
+class StartupReport:
+    """Collects how long each startup step took (imports, model loads, first paint)."""
+
+    def __init__(self, start=PROCESS_START):
+        self.start = start
+        self.steps = []
+
+    @contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - start))
+
+    def import_modules(self, *names):
+        """Import modules one by one, timing each; returns them in order."""
+        modules = []
+        for name in names:
+            with self.step(f"import {name}"):
+                modules.append(importlib.import_module(name))
+        return modules
+
+    def mark(self, name):
+        """Record the time elapsed since process start, e.g. when the window first appears."""
+        self.steps.append((name, time.perf_counter() - self.start))
+
+    def lines(self):
+        total = time.perf_counter() - self.start
+        lines = [f"[startup] {name:28s} {seconds * 1000:8.1f} ms" for name, seconds in self.steps]
+        lines.append(f"[startup] {'ready after':28s} {total * 1000:8.1f} ms")
+        return lines
@@ -1,44 +1,113 @@
-import cv2
+import argparse
 import numpy as np
 import os
+from face_cache import FaceCache, list_dataset, list_people
+from gallery_matcher import create_lbph, lbph_params, load_recognizer_config, model_params, save_lbph_binary
 
 DATASET_DIR = "dataset"
 CASCADE_PATH = "haarcascade_frontalface_default.xml"
 TRAINER_PATH = "trainer.yml"
 LABELS_PATH = "labels.npy"
+SHARDS = None  # e.g. 4 to split the model into label-range shards served by worker processes
 
-face_cascade = cv2.CascadeClassifier(CASCADE_PATH)
-recognizer = cv2.face.LBPHFaceRecognizer_create()
-
-def get_images_and_labels(dataset_dir):
-    faces = []
-    labels = []
-    label_dict = {}
-    current_label = 0
-    for person_name in os.listdir(dataset_dir):
-        person_dir = os.path.join(dataset_dir, person_name)
-        if not os.path.isdir(person_dir):
-            continue
-        label_dict[current_label] = person_name
-        for img_name in os.listdir(person_dir):
-            img_path = os.path.join(person_dir, img_name)
-            img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-            if img is None:
-                continue
-            faces.append(img)
-            labels.append(current_label)
-        current_label += 1
-    return faces, labels, label_dict
-
-def train_and_save():
-    faces, labels, label_dict = get_images_and_labels(DATASET_DIR)
+def load_label_dict(labels_path=LABELS_PATH):
+    if os.path.exists(labels_path):
+        return np.load(labels_path, allow_pickle=True).item()
+    return {}
+
+def assign_labels(person_names, label_dict):
+    """Extend {label: name} with new people, keeping every existing label ID unchanged."""
+    label_dict = dict(label_dict)
+    known = set(label_dict.values())
+    next_label = max(label_dict, default=-1) + 1
+    for person_name in sorted(person_names):
+        if person_name not in known:
+            label_dict[next_label] = person_name
+            known.add(person_name)
+            next_label += 1
+    return label_dict
+
+def get_images_and_labels(dataset_dir, workers=None):
+    """Return (faces, labels, label_dict) using the on-disk face cache.
+
+    Only images that are new or changed since the last run are decoded, in
+    parallel across ``workers`` processes. ``faces`` is a list of views into
+    the memory-mapped cache.
+    """
+    person_names = {person_name for _, person_name in list_dataset(dataset_dir)}
+    label_dict = assign_labels(person_names, load_label_dict())
+    name_to_label = {name: label for label, name in label_dict.items()}
+    faces, labels, decoded = FaceCache().sync(dataset_dir, name_to_label, workers)
+    print(f"Face cache: {0 if faces is None else len(faces)} images, {decoded} newly decoded.")
+    if faces is None or len(faces) == 0:
+        return [], [], label_dict
+    return list(faces), labels, label_dict
+
+def save_labels(label_dict):
+    np.save(LABELS_PATH + ".tmp.npy", label_dict)
+    os.replace(LABELS_PATH + ".tmp.npy", LABELS_PATH)
+
+def train_sharded(labels, label_dict, shards=None, shard_by="label", workers=None):
+    """Train one model per shard (label range or cohort folder) for the "sharded" recognizer backend."""
+    from shard_recognizer import SHARD_MANIFEST, plan_shards, train_shards
+    cohorts = None
+    if shard_by == "cohort":
+        cohorts = {person_name: cohort for person_name, _, cohort in list_people(DATASET_DIR)}
+    groups = plan_shards(labels, label_dict, shards or os.cpu_count() or 1, cohorts)
+    name_to_label = {name: label for label, name in label_dict.items()}
+    # Labels first: the service reloads when shards.json changes, and labels only ever gain people
+    save_labels(label_dict)
+    trained = train_shards(groups, DATASET_DIR, name_to_label, workers, shard_by=shard_by)
+    print(f"Training complete. {trained} of {len(groups)} shards retrained; manifest in {SHARD_MANIFEST}.")
+
+def train_and_save(incremental=False, workers=None, shards=SHARDS, shard_by="label"):
+    faces, labels, label_dict = get_images_and_labels(DATASET_DIR, workers)
     if len(faces) == 0:
         print("No images found for training!")
         return
-    recognizer.train(faces, np.array(labels))
-    recognizer.save(TRAINER_PATH)
-    np.save(LABELS_PATH, label_dict)
-    print(f"Training complete. Saved recognizer to {TRAINER_PATH} and labels to {LABELS_PATH}.")
+    if shards or shard_by == "cohort":
+        # Shards whose images did not change are always kept, so this is incremental by nature
+        train_sharded(labels, label_dict, shards, shard_by, workers)
+        return
+    # Radius, neighbors and grid come from recognizer_config.json when lbph_sweep.py chose them
+    config = load_recognizer_config()
+    recognizer = create_lbph(config)
+    if incremental and os.path.exists(TRAINER_PATH):
+        recognizer.read(TRAINER_PATH)
+        if model_params(recognizer) != lbph_params(config):
+            print("LBPH parameters changed since the last training; retraining on all images.")
+            recognizer = create_lbph(config)
+            incremental = False
+    if incremental and os.path.exists(TRAINER_PATH):
+        # Only people not in the previous model are added; existing histograms are left alone
+        trained = set(load_label_dict())
+        new_rows = [i for i, label in enumerate(labels) if label not in trained]
+        if not new_rows:
+            print("No new people to add; model is up to date.")
+            return
+        recognizer.update([faces[i] for i in new_rows], np.asarray(labels)[new_rows])
+        print(f"Added {len(new_rows)} images of {len(set(np.asarray(labels)[new_rows]))} new people.")
+    else:
+        recognizer.train(faces, np.asarray(labels))
+    # Write to temporary files and rename so a running recognition service never
+    # reads a half-written model
+    recognizer.save(TRAINER_PATH + ".tmp.yml")
+    save_labels(label_dict)
+    # The binary cache goes first too, so a service reloading the new trainer.yml finds it fresh
+    save_lbph_binary(recognizer)
+    os.replace(TRAINER_PATH + ".tmp.yml", TRAINER_PATH)
+    print(f"Training complete. Saved recognizer to {TRAINER_PATH} and labels to {LABELS_PATH} "
+          f"(LBPH {lbph_params(config)}).")
 
 if __name__ == "__main__":
-    train_and_save()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the LBPH face recognizer on the dataset.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only add people missing from the existing trainer.yml")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of processes used to decode images and train shards (default: all cores)")
+    parser.add_argument("--shards", type=int, nargs="?", const=os.cpu_count(), default=SHARDS,
+                        help="split the model into this many label-range shards (default: one per core)")
+    parser.add_argument("--shard-by", choices=["label", "cohort"], default="label",
+                        help="'cohort' makes one shard per class folder (dataset/<cohort>/<person>/)")
+    args = parser.parse_args()
+    train_and_save(incremental=args.incremental, workers=args.workers, shards=args.shards, shard_by=args.shard_by)
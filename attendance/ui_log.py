@@ -0,0 +1,98 @@
+import threading
+import tkinter as tk
+from collections import deque
+
+from rate_limit import REPEAT_INTERVAL, RateLimiter
+
+LOG_MAX_LINES = 1000  # lines kept in a log widget; older ones are removed
+LOG_POLL_MS = 100
+CALL_POLL_MS = 50
+
+
+class LogChannel:
+    """Thread-safe log feed for a Tk text widget.
+
+    Any thread may call ``put()``; messages are queued and the Tk thread
+    inserts them in one batch every ``poll_ms`` via ``after()``, so workers
+    never touch the widget. Messages with a ``key`` (e.g. a person's name)
+    are rate limited per key, and the widget keeps only the last
+    ``max_lines`` lines.
+    """
+
+    def __init__(self, widget, max_lines=LOG_MAX_LINES, poll_ms=LOG_POLL_MS, repeat_interval=REPEAT_INTERVAL,
+                 backlog=5000):
+        self.widget = widget
+        self.max_lines = max_lines
+        self.poll_ms = poll_ms
+        self.limiter = RateLimiter(repeat_interval)
+        self.dropped = 0
+        self._pending = deque(maxlen=backlog)
+        self._lock = threading.Lock()
+        widget.after(poll_ms, self._drain)
+
+    def put(self, message, key=None):
+        if key is not None:
+            allowed, suppressed = self.limiter.allow(key)
+            if not allowed:
+                return
+            if suppressed:
+                message += f" (repeated {suppressed} more times)"
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append(message)
+
+    def _drain(self):
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+            dropped, self.dropped = self.dropped, 0
+        try:
+            if lines:
+                if dropped:
+                    lines.insert(0, f"... {dropped} log lines dropped ...")
+                self._append(lines)
+            self.widget.after(self.poll_ms, self._drain)
+        except tk.TclError:
+            pass  # widget destroyed
+
+    def _append(self, lines):
+        widget = self.widget
+        widget.config(state='normal')
+        widget.insert(tk.END, "\n".join(lines) + "\n")
+        line_count = int(widget.index('end-1c').split('.')[0]) - 1
+        if line_count > self.max_lines:
+            widget.delete('1.0', f"{line_count - self.max_lines + 1}.0")
+        widget.see(tk.END)
+        widget.config(state='disabled')
+
+
+class UiCalls:
+    """Hands callbacks from worker threads to the Tk thread.
+
+    Tk is not thread-safe, so workers must not call widget methods or even
+    ``after()``. They ``put()`` a callback and its arguments instead, and
+    the Tk thread runs the queued calls in order every ``poll_ms``.
+    """
+
+    def __init__(self, widget, poll_ms=CALL_POLL_MS):
+        self.widget = widget
+        self.poll_ms = poll_ms
+        self._pending = deque()
+        self._lock = threading.Lock()
+        widget.after(poll_ms, self._drain)
+
+    def put(self, callback, *args):
+        with self._lock:
+            self._pending.append((callback, args))
+
+    def _drain(self):
+        with self._lock:
+            calls = list(self._pending)
+            self._pending.clear()
+        try:
+            for callback, args in calls:
+                callback(*args)
+            self.widget.after(self.poll_ms, self._drain)
+        except tk.TclError:
+            pass  # widget destroyed
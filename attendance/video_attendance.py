@@ -0,0 +1,230 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+from attendance_store import ATTENDANCE_DB, open_store
+from gallery_matcher import load_recognizer
+from pipeline import configured_threshold, process_frame
+from preprocess import FramePreprocessor
+
+CASCADE_PATH = "haarcascade_frontalface_default.xml"
+RECOGNIZER_PATH = "trainer.yml"
+RECOGNIZER_BACKEND = "lbph"  # "gallery" for the vectorized NumPy matcher
+LABELS_PATH = "labels.npy"
+CHUNK_SECONDS = 120  # length of the time range one worker process handles at a time
+FRAME_STRIDE = 15  # recognize every Nth frame (2 per second at 30 fps)
+MIN_HITS = 2  # sampled frames a person must be recognized in before being marked
+
+# Per-process state, set up once by _init_worker
+_worker = {}
+
+
+def video_info(path):
+    """Return (frame_count, fps) of a video file; frame_count is 0 when the container does not say."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video {path}")
+    try:
+        frame_count = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    finally:
+        cap.release()
+    return frame_count, fps if fps > 0 else 30.0
+
+
+def plan_chunks(path, frame_count, fps, chunk_seconds=CHUNK_SECONDS):
+    """Split a video into (path, first_frame, end_frame, fps) ranges of about ``chunk_seconds``.
+
+    A video whose length is unknown is one chunk read to the end (end_frame None).
+    """
+    if not frame_count:
+        return [(path, 0, None, fps)]
+    step = max(1, int(chunk_seconds * fps))
+    return [(path, start, min(start + step, frame_count), fps) for start in range(0, frame_count, step)]
+
+
+def _init_worker(cascade_path, recognizer_path, backend, labels_path, threshold):
+    # Each process gets its own cascade and recognizer; OpenCV's own thread
+    # pool would only compete with the other worker processes
+    cv2.setNumThreads(1)
+    _worker["cascade"] = cv2.CascadeClassifier(cascade_path)
+    _worker["recognizer"] = load_recognizer(backend, recognizer_path)
+    _worker["labels"] = np.load(labels_path, allow_pickle=True).item() if os.path.exists(labels_path) else {}
+    _worker["threshold"] = threshold
+    _worker["preprocessor"] = FramePreprocessor()
+
+
+def process_chunk(path, first_frame, end_frame, fps, stride=FRAME_STRIDE):
+    """Recognize faces in every ``stride``-th frame of one chunk (runs in a worker process).
+
+    Frames between samples are only grabbed, not converted. Returns
+    ({name: [first_seen_s, last_seen_s, hits, best_confidence]}, frames_sampled),
+    times measured on the video clock.
+    """
+    cap = cv2.VideoCapture(path)
+    seen = {}
+    sampled = 0
+    try:
+        if first_frame:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
+        index = first_frame
+        # Samples line up on multiples of the stride, whichever chunk they fall in
+        next_sample = -(-first_frame // stride) * stride
+        while end_frame is None or index < end_frame:
+            if not cap.grab():
+                break
+            if index == next_sample:
+                next_sample += stride
+                ok, frame = cap.retrieve()
+                if ok:
+                    sampled += 1
+                    seconds = index / fps
+                    faces = process_frame(frame, _worker["cascade"], _worker["recognizer"], _worker["labels"],
+                                          _worker["threshold"], preprocessor=_worker["preprocessor"])
+                    for face in faces:
+                        if face.name == "Unknown":
+                            continue
+                        entry = seen.get(face.name)
+                        if entry is None:
+                            seen[face.name] = [seconds, seconds, 1, face.confidence]
+                        else:
+                            entry[1] = seconds
+                            entry[2] += 1
+                            entry[3] = min(entry[3], face.confidence)
+            index += 1
+    finally:
+        cap.release()
+    return seen, sampled
+
+
+def _run_chunk(task):
+    path, first_frame, end_frame, fps, stride = task
+    return process_chunk(path, first_frame, end_frame, fps, stride)
+
+
+def merge_sightings(chunk_results):
+    """Combine per-chunk sightings into one entry per person (earliest first seen, latest last seen)."""
+    merged = {}
+    for seen in chunk_results:
+        for name, (first, last, hits, confidence) in seen.items():
+            entry = merged.get(name)
+            if entry is None:
+                merged[name] = [first, last, hits, confidence]
+            else:
+                entry[0] = min(entry[0], first)
+                entry[1] = max(entry[1], last)
+                entry[2] += hits
+                entry[3] = min(entry[3], confidence)
+    return merged
+
+
+def recording_start(path, frame_count, fps):
+    """Best guess of when a recording started: its modification time minus its length."""
+    return datetime.fromtimestamp(os.path.getmtime(path)) - timedelta(seconds=frame_count / fps)
+
+
+def format_offset(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def process_videos(paths, starts=None, stride=FRAME_STRIDE, chunk_seconds=CHUNK_SECONDS, workers=None,
+                   min_hits=MIN_HITS, threshold=None, backend=RECOGNIZER_BACKEND,
+                   progress=None):
+    """Recognize everyone in the given recordings using a pool of worker processes.
+
+    ``starts`` maps a path to the datetime its recording started (see
+    recording_start for the default). ``threshold`` defaults to the
+    configured one (see pipeline.configured_threshold). Returns one dict per person seen in at
+    least ``min_hits`` sampled frames, with the earliest sighting over all
+    videos: {name: {"timestamp", "video", "offset_s", "hits", "confidence"}},
+    plus the totals (video_seconds, frames_sampled).
+    """
+    starts = starts or {}
+    # Build the binary/gallery model caches once here, so workers only read them
+    recognizer = load_recognizer(backend, RECOGNIZER_PATH)
+    if threshold is None:
+        threshold = configured_threshold(recognizer)
+    tasks, video_seconds, clock = [], 0.0, {}
+    for path in paths:
+        frame_count, fps = video_info(path)
+        chunks = plan_chunks(path, frame_count, fps, chunk_seconds)
+        video_seconds += frame_count / fps
+        clock[path] = starts.get(path) or recording_start(path, frame_count, fps)
+        tasks.extend((path, first, end, fps, stride) for path, first, end, fps in chunks)
+
+    per_video = {path: [] for path in paths}
+    frames_sampled = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(CASCADE_PATH, RECOGNIZER_PATH, backend, LABELS_PATH, threshold)) as pool:
+        futures = {pool.submit(_run_chunk, task): task for task in tasks}
+        for done, future in enumerate(as_completed(futures), 1):
+            seen, sampled = future.result()
+            per_video[futures[future][0]].append(seen)
+            frames_sampled += sampled
+            if progress:
+                progress(done, len(tasks))
+
+    people = {}
+    for path, results in per_video.items():
+        for name, (first, _, hits, confidence) in merge_sightings(results).items():
+            if hits < min_hits:
+                continue
+            timestamp = clock[path] + timedelta(seconds=first)
+            current = people.get(name)
+            if current is None or timestamp < current["timestamp"]:
+                people[name] = {"timestamp": timestamp, "video": path, "offset_s": first, "hits": hits,
+                                "confidence": confidence}
+    return people, video_seconds, frames_sampled
+
+
+def save_marks(people, db_path=ATTENDANCE_DB):
+    """Write one mark per person through the attendance store; returns how many were new."""
+    # Earliest first, so a mark from an earlier recording of the same day is the one kept
+    marks = sorted(((name, info["timestamp"].strftime('%Y-%m-%d %H:%M:%S')) for name, info in people.items()),
+                   key=lambda mark: mark[1])
+    store = open_store(db_path, synchronous="FULL")
+    try:
+        return store.mark_many(marks)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Take attendance from recorded video files.")
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--start", action="append", default=[],
+                        help="recording start as 'YYYY-MM-DD HH:MM:SS', one per video in order "
+                             "(default: file modification time minus the video length)")
+    parser.add_argument("--stride", type=int, default=FRAME_STRIDE, help="recognize every Nth frame")
+    parser.add_argument("--chunk-seconds", type=float, default=CHUNK_SECONDS)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--min-hits", type=int, default=MIN_HITS)
+    parser.add_argument("--backend", choices=["lbph", "gallery"], default=RECOGNIZER_BACKEND)
+    parser.add_argument("--db", default=ATTENDANCE_DB)
+    parser.add_argument("--dry-run", action="store_true", help="print the result without writing marks")
+    args = parser.parse_args()
+
+    if len(args.start) > len(args.videos):
+        parser.error("more --start values than videos")
+    starts = {path: datetime.strptime(start, '%Y-%m-%d %H:%M:%S') for path, start in zip(args.videos, args.start)}
+    started = time.perf_counter()
+    people, video_seconds, frames_sampled = process_videos(
+        args.videos, starts, args.stride, args.chunk_seconds, args.workers, args.min_hits,
+        backend=args.backend, progress=lambda done, total: print(f"Chunk {done}/{total} done", flush=True))
+    elapsed = time.perf_counter() - started
+
+    for name, info in sorted(people.items(), key=lambda item: item[1]["timestamp"]):
+        print(f"{name}: {info['timestamp']:%Y-%m-%d %H:%M:%S} (at {format_offset(info['offset_s'])} in "
+              f"{os.path.basename(info['video'])}, {info['hits']} sightings)")
+    print(f"{len(people)} people in {format_offset(video_seconds)} of video; {frames_sampled} frames sampled "
+          f"in {elapsed:.1f} s ({video_seconds / elapsed if elapsed else 0:.1f}x real time).")
+    if args.dry_run:
+        print("Dry run: no attendance written.")
+    else:
+        print(f"Attendance saved to {args.db} ({save_marks(people, args.db)} new records)")
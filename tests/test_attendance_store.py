@@ -0,0 +1,148 @@
+import csv
+import os
+import sqlite3
+
+import pytest
+
+from attendance_store import AttendanceStore, AttendanceWriter, open_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = AttendanceStore(str(tmp_path / "attendance.db"), node_id="test")
+    yield store
+    store.close()
+
+
+def test_earliest_mark_wins_per_person_and_day(store):
+    assert store.mark("ann", "2024-03-04 09:30:00")
+    # A later mark the same day changes nothing, an earlier one moves the time back
+    assert not store.mark("ann", "2024-03-04 10:00:00")
+    assert store.mark("ann", "2024-03-04 08:15:00")
+    assert not store.mark("ann", "2024-03-04 08:15:00")
+    # Another day or another person is a separate row
+    assert store.mark("ann", "2024-03-05 11:00:00")
+    assert store.mark("bob", "2024-03-04 12:00:00")
+
+    assert list(store.rows()) == [("ann", "2024-03-04 08:15:00"), ("bob", "2024-03-04 12:00:00"),
+                                  ("ann", "2024-03-05 11:00:00")]
+    # Only the marks that changed the table are in the change log
+    assert store.change_heads() == {"test": 4}
+
+
+def test_mark_many_counts_new_or_earlier_marks(store):
+    marks = [("ann", "2024-03-04 09:00:00"), ("ann", "2024-03-04 09:05:00"),
+             ("ann", "2024-03-04 08:55:00"), ("bob", "2024-03-04 09:00:00")]
+    assert store.mark_many(marks) == 3
+    assert store.count() == 2
+    assert store.names_for_date("2024-03-04") == {"ann", "bob"}
+
+
+def test_writer_flushes_queued_marks_on_close(store):
+    # Neither the batch size nor the interval is reached before close()
+    writer = AttendanceWriter(store, batch_size=1000, flush_interval_ms=60000)
+    for i in range(50):
+        writer.submit(f"person{i}", "2024-03-04 09:00:00")
+    writer.close()
+
+    assert writer.written == 50
+    assert writer.backlog() == 0
+    assert store.count() == 50
+
+
+def test_writer_retries_a_failed_flush_on_close(store):
+    class FlakyStore:
+        calls = 0
+
+        def mark_many(self, batch):
+            FlakyStore.calls += 1
+            if FlakyStore.calls == 1:
+                raise sqlite3.OperationalError("database is locked")
+            return store.mark_many(batch)
+
+    writer = AttendanceWriter(FlakyStore(), batch_size=1000, flush_interval_ms=10)
+    writer.submit("ann", "2024-03-04 09:00:00")
+    writer.close()
+
+    assert writer.errors == 1
+    assert writer.written == 1
+    assert store.count() == 1
+
+
+def _write_csv(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Name", "Timestamp"])
+        writer.writerows(rows)
+
+
+def test_csv_migration_runs_once(tmp_path):
+    db_path, csv_path = str(tmp_path / "attendance.db"), str(tmp_path / "attendance.csv")
+    _write_csv(csv_path, [("ann", "2024-03-04 09:00:00"), ("ann", "2024-03-04 08:00:00"),
+                          ("bob", "2024-03-04 10:00:00"), ("", "2024-03-04 10:00:00")])
+
+    store = open_store(db_path, csv_path)
+    assert list(store.rows()) == [("ann", "2024-03-04 08:00:00"), ("bob", "2024-03-04 10:00:00")]
+    assert store.migrate_from_csv(csv_path) == 0
+    store.close()
+
+    # Reopening (and rows added to the CSV later) import nothing again
+    _write_csv(csv_path, [("carl", "2024-03-05 09:00:00")])
+    store = open_store(db_path, csv_path)
+    assert store.count() == 2
+    assert store.change_heads() == {store.node_id: 3}  # ann, ann moved earlier, bob
+    store.close()
+
+
+def test_missing_csv_is_not_recorded_as_migrated(tmp_path):
+    db_path, csv_path = str(tmp_path / "attendance.db"), str(tmp_path / "attendance.csv")
+    store = open_store(db_path, csv_path)
+    assert store.count() == 0
+    store.close()
+
+    _write_csv(csv_path, [("ann", "2024-03-04 09:00:00")])
+    store = open_store(db_path, csv_path)
+    assert store.count() == 1
+    store.close()
+    assert os.path.exists(csv_path)
+
+
+def _page_all(store, limit, after=None, **kwargs):
+    """Follow page() from ``after`` until a short page; returns every row seen."""
+    rows = []
+    while True:
+        page = store.page(limit, after, **kwargs)
+        rows.extend(page)
+        if len(page) < limit:
+            return rows
+        after = page[-1][2]
+
+
+@pytest.mark.parametrize("sort", ["name", "date", "timestamp"])
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("filters", [{}, {"start_date": "2024-03-05", "end_date": "2024-03-07"},
+                                     {"name": "p03"}])
+def test_keyset_paging_returns_every_row_once(store, sort, descending, filters):
+    # Many rows share a name, a date or even the exact timestamp, so pages end inside runs of equal keys
+    marks = [(f"p{person:02d}", f"2024-03-{day:02d} 09:{person % 3:02d}:00")
+             for day in range(3, 10) for person in range(13)]
+    store.mark_many(marks)
+    expected = sorted(store.rows(**filters))
+
+    for limit in (1, 4, 7, 1000):
+        rows = _page_all(store, limit, sort=sort, descending=descending, **filters)
+        assert sorted((name, timestamp) for name, timestamp, _ in rows) == expected
+        keys = [key for _, _, key in rows]
+        assert keys == sorted(keys, reverse=descending)
+        assert len(set(keys)) == len(keys)
+
+
+@pytest.mark.parametrize("sort", ["name", "date", "timestamp"])
+def test_paging_back_from_a_row_returns_the_rows_before_it(store, sort):
+    store.mark_many([(f"p{person}", f"2024-03-{day:02d} 09:00:00") for day in range(3, 8) for person in range(6)])
+    forward = _page_all(store, 5, sort=sort)
+    middle = forward[len(forward) // 2]
+
+    back = _page_all(store, 4, middle[2], sort=sort, descending=True)
+    assert back == forward[:len(forward) // 2][::-1]
+
@@ -0,0 +1,110 @@
+import pytest
+
+import governor
+from governor import LEVELS, LoadGovernor
+from pipeline import DEFAULT_POINT
+
+START = LEVELS.index(DEFAULT_POINT)
+
+
+class FakeTime:
+    """Stands in for the time module so windows close exactly when the test says."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def perf_counter(self):
+        return self.now
+
+    def process_time(self):
+        return 0.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(governor, "time", fake)
+    return fake
+
+
+def feed(gov, clock, latency_ms, busy_ms=None, frames=8, window_s=1.0):
+    """``frames`` evenly spaced frames over ``window_s``; returns the levels the governor moved to.
+
+    The defaults are powers of two so the fake clock lands exactly on window boundaries.
+    """
+    moves = []
+    for _ in range(frames):
+        clock.now += window_s / frames
+        if gov.observe(latency_ms / 1000.0, (busy_ms if busy_ms is not None else latency_ms / 2) / 1000.0):
+            moves.append(gov.level)
+    return moves
+
+
+def test_sustained_p95_breach_steps_down_once(clock):
+    messages = []
+    gov = LoadGovernor(target_latency_ms=200, report=messages.append)
+
+    assert feed(gov, clock, 300) == []  # one window over budget is not enough
+    assert feed(gov, clock, 300) == [START + 1]
+    assert gov.point == LEVELS[START + 1]
+    assert len(messages) == 1 and "stepped down" in messages[0]
+    # The window after a change is discarded, then the count starts again
+    assert feed(gov, clock, 300) == []
+    assert feed(gov, clock, 300) == []
+    assert feed(gov, clock, 300) == [START + 2]
+
+
+def test_p95_ignores_a_few_slow_frames(clock):
+    gov = LoadGovernor(target_latency_ms=200)
+    for _ in range(5):
+        # One slow frame in 32 stays above the 95th percentile
+        moves = (feed(gov, clock, 100, frames=31, window_s=31 / 32)
+                 + feed(gov, clock, 900, frames=1, window_s=1 / 32))
+        assert moves == []
+    assert gov.changes == 0
+
+
+def test_alternating_load_does_not_flap(clock):
+    gov = LoadGovernor(target_latency_ms=200)
+    for window in range(20):
+        feed(gov, clock, 300 if window % 2 else 100)
+    assert gov.changes == 0
+    assert gov.level == START
+
+
+def test_steps_up_only_after_the_up_windows(clock):
+    gov = LoadGovernor(target_latency_ms=200, up_windows=5)
+    for _ in range(4):
+        assert feed(gov, clock, 20) == []
+    assert feed(gov, clock, 20) == [START - 1]
+    # A window over the up margin resets the count
+    feed(gov, clock, 20)  # settling
+    for _ in range(3):
+        feed(gov, clock, 20)
+    feed(gov, clock, 100)
+    for _ in range(4):
+        assert feed(gov, clock, 20) == []
+    assert feed(gov, clock, 20) == [START - 2]
+
+
+def test_learned_cost_keeps_it_from_returning_to_a_level_it_left(clock):
+    gov = LoadGovernor(target_latency_ms=200, start=START - 1)
+    feed(gov, clock, 300, busy_ms=150)
+    assert feed(gov, clock, 300, busy_ms=150) == [START]
+
+    # The better level measured three times this one's cost per frame, so 50 ms would become 150 ms,
+    # over the 0.7 up margin; the pixel-based estimate alone (2.25x) would have stepped back up
+    for _ in range(20):
+        assert feed(gov, clock, 50, busy_ms=50) == []
+    assert gov.level == START
+
+
+def test_cpu_budget_steps_down_without_a_latency_target(clock, monkeypatch):
+    cpu = {"used": 0.0}
+    monkeypatch.setattr(clock, "process_time", lambda: cpu["used"], raising=False)
+    monkeypatch.setattr(governor.os, "cpu_count", lambda: 1)
+    gov = LoadGovernor(target_latency_ms=None, cpu_budget=0.5)
+    for _ in range(2):
+        cpu["used"] += 0.8  # 80% of the only core per one-second window
+        moves = feed(gov, clock, 1000)
+    assert moves == [START + 1]
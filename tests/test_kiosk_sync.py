@@ -0,0 +1,19 @@
+import pytest
+
+from kiosk_sync import simulate
+
+
+@pytest.mark.parametrize("transport", ["dir", "http"])
+def test_simulated_kiosks_converge(transport):
+    result = simulate(nodes=4, marks_per_node=2500, rounds=5, people=300, transport=transport)
+
+    assert result["converged"]
+    assert result["expected_marks"] > 0
+    # Every node applied its own marks and received the others'
+    assert sum(row["applied"] for row in result["rounds"]) > 0
+    # Once converged, another round moves nothing
+    assert result["idle_round"]["pushed"] == 0
+    assert result["idle_round"]["applied"] == 0
+    assert result["idle_round"]["updated"] == 0
+    # Replaying changes a node already holds is a no-op
+    assert result["replay"] == (0, 0)
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from lbph_sweep import choose_threshold, out_of_fold_rates, rates_at
+
+
+def _fold(truth, predicted, distances):
+    return np.array(truth), np.array(predicted), np.array(distances, dtype=np.float64)
+
+
+def test_choose_threshold_stays_within_the_false_accept_limit():
+    truth, predicted, distances = _fold([0, 1, 2, 3], [0, 1, 0, 3], [10, 20, 30, 40])
+    threshold = choose_threshold(truth, predicted, distances, max_false_accept=0.0)
+    assert threshold == 25.0
+    assert rates_at(truth, predicted, distances, threshold) == (0.5, 0.0)
+
+
+def test_rates_are_scored_at_thresholds_chosen_on_the_other_folds():
+    folds = [_fold([0, 1], [0, 0], [10, 20]),  # a right match, then a wrong one
+             _fold([2], [2], [30])]
+    truth, predicted, distances = (np.concatenate([f[k] for f in folds]) for k in range(3))
+    in_sample = rates_at(truth, predicted, distances, choose_threshold(truth, predicted, distances, 0.0))
+    assert in_sample == pytest.approx((1 / 3, 0.0))
+
+    # The second fold alone allows anything up to 30.5, which accepts the first fold's wrong match,
+    # and the first fold's 15 rejects the second fold's right one
+    accuracy, false_accept = out_of_fold_rates(folds, max_false_accept=0.0)
+    assert accuracy == pytest.approx(1 / 3)
+    assert false_accept == pytest.approx(1 / 3)
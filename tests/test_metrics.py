@@ -0,0 +1,30 @@
+import time
+
+from metrics import Metrics
+from pipeline import record_time
+
+
+def test_record_time_feeds_metrics_stage_timers():
+    metrics = Metrics()
+    for _ in range(3):
+        record_time(metrics, "detect", time.perf_counter() - 0.01)
+    record_time(metrics, "predict", time.perf_counter())
+
+    stages = metrics.snapshot()["stages"]
+    assert stages["detect"]["count"] == 3
+    assert stages["detect"]["p50_ms"] >= 10
+    assert stages["predict"]["count"] == 1
+    assert "detect" in metrics.format_summary()
+    assert 'attendance_stage_seconds_count{stage="detect"} 3' in metrics.prometheus()
+
+
+def test_record_time_appends_to_a_plain_timings_dict():
+    timings = {}
+    record_time(timings, "detect", time.perf_counter())
+    record_time(timings, "detect", time.perf_counter())
+    assert list(timings) == ["detect"]
+    assert len(timings["detect"]) == 2
+
+
+def test_record_time_without_timings_does_nothing():
+    record_time(None, "detect", time.perf_counter())
@@ -0,0 +1,111 @@
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from face_cache import FaceCache
+from shard_recognizer import ShardedRecognizer, plan_shards, train_shards
+
+PEOPLE = 6
+IMAGES = 8
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    """Synthetic faces: each person is a fixed blurred pattern plus per-image noise and shifts."""
+    monkeypatch.chdir(tmp_path)  # no recognizer_config.json here, so LBPH defaults apply
+    rng = np.random.default_rng(0)
+    dataset_dir = tmp_path / "dataset"
+    names = [f"person{p}" for p in range(PEOPLE)]
+    for name in names:
+        base = cv2.GaussianBlur(rng.integers(0, 256, (120, 120), dtype=np.uint8), (0, 0), 3)
+        person_dir = dataset_dir / name
+        person_dir.mkdir(parents=True)
+        for i in range(IMAGES):
+            noisy = np.clip(base + rng.normal(0, 6, base.shape), 0, 255).astype(np.uint8)
+            cv2.imwrite(str(person_dir / f"{i}.png"), np.roll(noisy, (i % 3, i % 2), axis=(0, 1)))
+    name_to_label = {name: label for label, name in enumerate(names)}
+    faces, labels, _ = FaceCache(str(tmp_path / "face_cache")).sync(str(dataset_dir), name_to_label, workers=1)
+    return {"dir": str(dataset_dir), "cache": str(tmp_path / "face_cache"), "faces": faces, "labels": labels,
+            "name_to_label": name_to_label, "label_dict": {v: k for k, v in name_to_label.items()},
+            "manifest": str(tmp_path / "shards.json"), "shard_dir": str(tmp_path / "shards")}
+
+
+def _train(dataset, groups):
+    return train_shards(groups, dataset["dir"], dataset["name_to_label"], workers=1, cache_dir=dataset["cache"],
+                        manifest_path=dataset["manifest"], shard_dir=dataset["shard_dir"])
+
+
+def _manifest_paths(dataset):
+    with open(dataset["manifest"]) as f:
+        return [s["path"] for s in json.load(f)["shards"]]
+
+
+def test_plan_shards_partitions_labels_into_balanced_ranges():
+    labels = [0] * 10 + [1] * 10 + [2] * 30 + [3] * 10 + [4] * 10 + [5] * 10
+    label_dict = {label: f"person{label}" for label in range(6)}
+    groups = plan_shards(labels, label_dict, 3)
+
+    assert len(groups) == 3
+    members = [label for _, group in groups for label in group]
+    assert members == sorted(set(labels))  # every label exactly once, ranges in order
+    for name, group in groups:
+        assert group == list(range(group[0], group[-1] + 1))
+        assert name == f"labels-{group[0]}-{group[-1]}"
+    # The same input always gives the same shards, whatever the order of the rows
+    assert plan_shards(labels[::-1], label_dict, 3) == groups
+    # More shards than people never gives empty shards
+    assert all(group for _, group in plan_shards(labels, label_dict, 20))
+
+
+def test_plan_shards_by_cohort():
+    label_dict = {0: "ann", 1: "bob", 2: "cat", 3: "dan"}
+    cohorts = {"ann": "class-b", "bob": "class-a", "cat": "class-b"}
+    groups = plan_shards([0, 1, 2, 3], label_dict, cohorts=cohorts)
+    assert groups == [("class-a", [1]), ("class-b", [0, 2]), ("default", [3])]
+
+
+def test_unchanged_shards_are_not_retrained(dataset):
+    groups = plan_shards(dataset["labels"], dataset["label_dict"], 3)
+    assert _train(dataset, groups) == 3
+    assert _train(dataset, groups) == 0
+
+    # Changing one person's images retrains only their shard
+    path = os.path.join(dataset["dir"], "person0", "0.png")
+    cv2.imwrite(path, np.zeros((120, 120), np.uint8))
+    FaceCache(dataset["cache"]).sync(dataset["dir"], dataset["name_to_label"], workers=1)
+    assert _train(dataset, groups) == 1
+
+
+def test_shards_dropped_by_a_smaller_rerun_are_deleted(dataset):
+    _train(dataset, plan_shards(dataset["labels"], dataset["label_dict"], 4))
+    assert len(os.listdir(dataset["shard_dir"])) == 4
+
+    _train(dataset, plan_shards(dataset["labels"], dataset["label_dict"], 2))
+    kept = _manifest_paths(dataset)
+    assert len(kept) == 2
+    assert sorted(os.path.join(dataset["shard_dir"], f) for f in os.listdir(dataset["shard_dir"])) == sorted(kept)
+
+
+def test_sharded_predictions_match_a_single_model(dataset):
+    faces, labels = dataset["faces"], dataset["labels"]
+    _train(dataset, plan_shards(labels, dataset["label_dict"], 3))
+    single = cv2.face.LBPHFaceRecognizer_create()
+    single.train(list(faces), labels)
+
+    rng = np.random.default_rng(1)
+    probes = [np.clip(face + rng.normal(0, 10, face.shape), 0, 255).astype(np.uint8) for face in faces[::3]]
+    sharded = ShardedRecognizer(_manifest_paths(dataset))
+    try:
+        merged = sharded.predict_batch(probes)
+        assert sharded.predict(probes[0]) == merged[0]
+    finally:
+        sharded.close()
+    for probe, (label, distance) in zip(probes, merged):
+        expected_label, expected_distance = single.predict(probe)
+        assert label == expected_label
+        assert distance == pytest.approx(expected_distance, rel=1e-5)
+    # A closed recognizer answers "unknown" instead of touching its stopped workers
+    assert sharded.predict(probes[0])[0] == -1